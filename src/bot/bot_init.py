@@ -1,8 +1,15 @@
+import asyncio
+import signal
+from datetime import timedelta
+from urllib.parse import urlsplit
+
 from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiohttp import web
 
+from bot.services.rate_limit import TelegramRateLimiter
 from config import settings
 
-
 if settings.TELEGRAM_BOT_API_URL:
     from aiogram.client.session.aiohttp import AiohttpSession
     from aiogram.client.telegram import TelegramAPIServer
@@ -16,6 +23,21 @@ else:
 dp = Dispatcher()
 
 
+def rate_limiter() -> TelegramRateLimiter:
+    """
+    Limits of this process: the bot process and its JOB_WORKERS workers share
+    the global one, chat limits hold per process only. Built once the command
+    line is parsed, runbot --workers changes JOB_WORKERS.
+    """
+    return TelegramRateLimiter(
+        global_rate=settings.TELEGRAM_GLOBAL_RATE / (settings.JOB_WORKERS + 1),
+        chat_rate=settings.TELEGRAM_CHAT_RATE,
+        chat_burst=settings.TELEGRAM_CHAT_BURST,
+        group_rate=settings.TELEGRAM_GROUP_RATE,
+        max_retry_after=settings.TELEGRAM_MAX_RETRY_AFTER_SECONDS,
+    )
+
+
 def setup_handlers(dp: Dispatcher) -> None:
     from bot import handlers
 
@@ -27,7 +49,115 @@ def setup_handlers(dp: Dispatcher) -> None:
     )
 
 
-async def run_bot() -> None:
+async def prepare_bot() -> None:
+    from bot.services import db, job_queue, metrics, transcribe
+    from bot.services.log_writer import transcription_log
+
+    bot.session.middleware(rate_limiter())
+    # Fail fast on misconfigured engines, only their SDKs get imported
+    transcribe.transcription_client()
+    transcribe.fallback_transcription_client()
+
+    # Jobs interrupted by the previous shutdown will not finish, return their seconds
+    await db.refund_stale_reservations(
+        timedelta(seconds=settings.STALE_RESERVATION_SECONDS)
+    )
+    # Jobs of this process and its workers killed mid-transcription start over
+    await job_queue.requeue_running(settings.JOB_WORKER_NAME)
+
+    dp.startup.register(transcription_log.start)
+    if settings.METRICS_PORT:
+        metrics.clear_multiprocess_dir()
+        metrics_server = metrics.MetricsServer()
+        dp.startup.register(metrics_server.start)
+        dp.shutdown.register(metrics_server.stop)
+    if settings.JOB_WORKERS:
+        workers = job_queue.WorkerPool(settings.JOB_WORKERS)
+        dp.startup.register(workers.start)
+        dp.shutdown.register(workers.stop)
+    else:
+        dp.startup.register(job_queue.resume_jobs)
+        dp.shutdown.register(job_queue.job_runner.stop)
+    # After the jobs are drained, their logs are the last to be written
+    dp.shutdown.register(transcription_log.close)
     setup_handlers(dp)
-    await bot.delete_webhook(drop_pending_updates=True)
+
+
+def stop_signal() -> asyncio.Event:
+    """Event set on SIGTERM or SIGINT, e.g. by docker compose stop."""
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
+    return stop
+
+
+async def run_worker(name: str | None = None) -> None:
+    """Runs queued jobs of the intake process, see bot.services.job_queue."""
+    from bot.services import job_queue, transcribe
+    from bot.services.log_writer import transcription_log
+
+    bot.session.middleware(rate_limiter())
+    transcribe.transcription_client()
+    transcribe.fallback_transcription_client()
+
+    await transcription_log.start()
+    try:
+        await job_queue.run_worker(name, stop_signal())
+    finally:
+        await transcription_log.close()
+
+
+async def run_bot() -> None:
+    await prepare_bot()
+    # Updates sent while the bot was down are processed, not dropped
+    await bot.delete_webhook(drop_pending_updates=False)
+    # On SIGTERM polling stops first, then the shutdown hooks drain the jobs
     await dp.start_polling(bot)
+
+
+async def set_webhook() -> None:
+    # Pending updates are kept, other processes may be restarting one by one
+    await bot.set_webhook(
+        settings.WEBHOOK_URL,
+        secret_token=settings.WEBHOOK_SECRET,
+        allowed_updates=dp.resolve_used_update_types(),
+    )
+
+
+def webhook_app() -> web.Application:
+    """
+    aiohttp application receiving updates at the path of WEBHOOK_URL.
+    Updates are processed in background tasks, so the Bot API server
+    gets its answer right away and is not held for a whole transcription.
+    """
+    app = web.Application()
+    # Runs dispatcher startup and shutdown hooks with the application,
+    # registered first so jobs are drained before the bot session is closed
+    setup_application(app, dp, bot=bot)
+    SimpleRequestHandler(
+        dispatcher=dp,
+        bot=bot,
+        handle_in_background=True,
+        secret_token=settings.WEBHOOK_SECRET,
+    ).register(app, path=urlsplit(settings.WEBHOOK_URL).path or "/")
+    return app
+
+
+async def run_webhook() -> None:
+    if not settings.WEBHOOK_URL or not settings.WEBHOOK_SECRET:
+        raise ValueError(
+            "Для режима webhook необходимо установить WEBHOOK_URL и WEBHOOK_SECRET"
+        )
+
+    await prepare_bot()
+    dp.startup.register(set_webhook)
+
+    runner = web.AppRunner(webhook_app())
+    await runner.setup()
+    try:
+        await web.TCPSite(runner, settings.WEBHOOK_HOST, settings.WEBHOOK_PORT).start()
+        await stop_signal().wait()
+    finally:
+        # Stops accepting updates, then runs the shutdown hooks
+        await runner.cleanup()
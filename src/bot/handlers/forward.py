@@ -1,42 +1,63 @@
 import hashlib
 
-from aiogram import Router, F
-from aiogram.types import Message
 import sentry_sdk
+from aiogram import F, Router
+from aiogram.types import Message
 
+from bot.services import job_queue
+from bot.services.file_processor import start_job
+from bot.services.scheduler import Priority
 from config import settings
-from bot.services.file_processor import handle_file
-
 
 router = Router()
 
 
-async def forward_and_transcribe(message: Message, file_type: str, duration: int, file_id: str, mime_type: str):
+async def forward_and_transcribe(
+    message: Message,
+    file_type: str,
+    duration: int,
+    file_id: str,
+    mime_type: str,
+    file_unique_id: str,
+):
     """Forward message to admin and automatically transcribe it"""
     if not settings.ADMIN_ID:
         return
-    
+
     try:
-        # Forward to admin
-        forwarded = await message.forward(settings.ADMIN_ID)
-        
-        # Add source info
-        await forwarded.reply(
-            f"From: {message.chat.title} (@{message.chat.username or message.chat.id or 'no username'})\n"
-            f"User: {message.from_user.full_name or message.from_user.id or 'no username'}"
-        )
-        
-        # Automatically transcribe
         hashed_user_id = hashlib.sha256(str(message.from_user.id).encode()).hexdigest()
         sentry_sdk.set_user({"id": hashed_user_id})
-        await handle_file(
-            forwarded,
+        # Stored first, a message Telegram delivers again is not forwarded twice
+        job = await job_queue.hold(
+            Priority.LOW,
+            message,
             hashed_user_id,
             file_type,
             duration,
             file_id,
             mime_type,
+            file_unique_id,
         )
+        if job is None:
+            return
+
+        try:
+            # Forward to admin
+            forwarded = await message.forward(settings.ADMIN_ID)
+        except Exception:
+            # Not forwarded, the next delivery of the update tries again
+            await job.adelete()
+            raise
+        await job_queue.release(job, forwarded)
+
+        # Add source info
+        await forwarded.reply(
+            f"From: {message.chat.title} (@{message.chat.username or message.chat.id or 'no username'})\n"
+            f"User: {message.from_user.full_name or message.from_user.id or 'no username'}"
+        )
+
+        # Automatically transcribe
+        await start_job(job)
     except Exception as e:
         sentry_sdk.capture_exception(e)
 
@@ -54,6 +75,7 @@ async def forward_voice_to_admin(message: Message):
         message.voice.duration,
         message.voice.file_id,
         message.voice.mime_type,
+        message.voice.file_unique_id,
     )
 
 
@@ -70,6 +92,7 @@ async def forward_audio_to_admin(message: Message):
         message.audio.duration,
         message.audio.file_id,
         message.audio.mime_type,
+        message.audio.file_unique_id,
     )
 
 
@@ -86,4 +109,5 @@ async def forward_video_note_to_admin(message: Message):
         message.video_note.duration,
         message.video_note.file_id,
         "video/mp4",
+        message.video_note.file_unique_id,
     )
@@ -1,13 +1,14 @@
 import hashlib
 
-from aiogram import Router, F
+from aiogram import F, Router
 from aiogram.filters import Command
 from aiogram.types import Message
 
-
-from config import settings
 from bot import messages
-from bot.services import db
+from bot.services import db, metrics
+from bot.services.health import engine_health
+from bot.services.scheduler import job_scheduler
+from config import settings
 
 router = Router()
 
@@ -30,9 +31,39 @@ async def stats(message: Message):
         )
     )
 
+
 @router.message(Command("model"))
 async def model(message: Message):
-    await message.reply(f"{settings.TRANSCRIPTION_ENGINE=} {settings.FALLBACK_TRANSCRIPTION_ENGINE=}")
+    engines = filter(
+        None, [settings.TRANSCRIPTION_ENGINE, settings.FALLBACK_TRANSCRIPTION_ENGINE]
+    )
+    if settings.JOB_WORKERS:
+        # Every worker keeps its own circuit breakers, the ones of the bot
+        # process never see a request
+        health = "Состояние движков у каждого воркера своё: transcription_circuit_open в /metrics."
+    else:
+        health = "\n".join(engine_health(engine).describe() for engine in engines)
+    await message.reply(
+        f"{settings.TRANSCRIPTION_ENGINE=} {settings.FALLBACK_TRANSCRIPTION_ENGINE=}\n\n{health}"
+    )
+
+
+@router.message(Command("queue"), F.from_user.id == settings.ADMIN_ID)
+async def queue(message: Message):
+    queued, running = await metrics.job_counts()
+    queued = ", ".join(f"{priority.name} {count}" for priority, count in queued.items())
+    if settings.JOB_WORKERS:
+        max_in_flight = settings.JOB_WORKERS * settings.SCHEDULER_MAX_IN_FLIGHT
+        await message.reply(f"В работе: {running}/{max_in_flight}\nВ очереди: {queued}")
+        return
+
+    stats = job_scheduler.stats()
+    await message.reply(
+        f"В работе: {running}/{stats['max_in_flight']}\n"
+        f"В очереди: {queued}\n"
+        f"Ожидание p50/p95/max: {stats['wait_p50']:.1f}/{stats['wait_p95']:.1f}/{stats['wait_max']:.1f} с"
+    )
+
 
 @router.message(F.text, F.chat.type == "private")
 async def unknown_command(message: Message):
@@ -1,13 +1,13 @@
 import hashlib
 
-from aiogram import Router, F
-from aiogram.types import Message
 import sentry_sdk
+from aiogram import F, Router
+from aiogram.types import Message
 
-from bot.services.file_processor import handle_file
+from bot.services.file_processor import schedule_file
+from bot.services.scheduler import Priority
 from config import settings
 
-
 router = Router()
 
 
@@ -15,13 +15,15 @@ router = Router()
 async def handle_voice(message: Message):
     hashed_user_id = hashlib.sha256(str(message.from_user.id).encode()).hexdigest()
     sentry_sdk.set_user({"id": hashed_user_id})
-    await handle_file(
+    await schedule_file(
+        Priority.HIGH,
         message,
         hashed_user_id,
         "voice",
         message.voice.duration,
         message.voice.file_id,
         message.voice.mime_type,
+        message.voice.file_unique_id,
     )
 
 
@@ -29,13 +31,15 @@ async def handle_voice(message: Message):
 async def handle_audio(message: Message):
     hashed_user_id = hashlib.sha256(str(message.from_user.id).encode()).hexdigest()
     sentry_sdk.set_user({"id": hashed_user_id})
-    await handle_file(
+    await schedule_file(
+        Priority.HIGH,
         message,
         hashed_user_id,
         "audio",
         message.audio.duration,
         message.audio.file_id,
         message.audio.mime_type,
+        message.audio.file_unique_id,
     )
 
 
@@ -44,13 +48,15 @@ async def handle_video(message: Message):
     hashed_user_id = hashlib.sha256(str(message.from_user.id).encode()).hexdigest()
     sentry_sdk.set_user({"id": hashed_user_id})
 
-    await handle_file(
+    await schedule_file(
+        Priority.HIGH,
         message,
         hashed_user_id,
         "video_note",
         message.video_note.duration,
         message.video_note.file_id,
         "video/mp4",
+        message.video_note.file_unique_id,
     )
 
 
@@ -62,13 +68,15 @@ async def handle_video(message: Message):
 async def handle_voice_reply(message: Message):
     hashed_user_id = hashlib.sha256(str(message.from_user.id).encode()).hexdigest()
     sentry_sdk.set_user({"id": hashed_user_id})
-    await handle_file(
+    await schedule_file(
+        Priority.NORMAL,
         message,
         hashed_user_id,
         "voice",
         message.reply_to_message.voice.duration,
         message.reply_to_message.voice.file_id,
         message.reply_to_message.voice.mime_type,
+        message.reply_to_message.voice.file_unique_id,
     )
 
 
@@ -80,13 +88,15 @@ async def handle_voice_reply(message: Message):
 async def handle_audio_reply(message: Message):
     hashed_user_id = hashlib.sha256(str(message.from_user.id).encode()).hexdigest()
     sentry_sdk.set_user({"id": hashed_user_id})
-    await handle_file(
+    await schedule_file(
+        Priority.NORMAL,
         message,
         hashed_user_id,
         "audio",
         message.reply_to_message.audio.duration,
         message.reply_to_message.audio.file_id,
         message.reply_to_message.audio.mime_type,
+        message.reply_to_message.audio.file_unique_id,
     )
 
 
@@ -98,13 +108,15 @@ async def handle_audio_reply(message: Message):
 async def handle_group_message(message: Message):
     hashed_user_id = hashlib.sha256(str(message.from_user.id).encode()).hexdigest()
     sentry_sdk.set_user({"id": hashed_user_id})
-    await handle_file(
+    await schedule_file(
+        Priority.LOW,
         message,
         hashed_user_id,
         "voice",
         message.voice.duration,
         message.voice.file_id,
         message.voice.mime_type,
+        message.voice.file_unique_id,
     )
 
 
@@ -116,11 +128,13 @@ async def handle_group_message(message: Message):
 async def handle_group_video_note(message: Message):
     hashed_user_id = hashlib.sha256(str(message.from_user.id).encode()).hexdigest()
     sentry_sdk.set_user({"id": hashed_user_id})
-    await handle_file(
+    await schedule_file(
+        Priority.LOW,
         message,
         hashed_user_id,
         "video_note",
         message.video_note.duration,
         message.video_note.file_id,
         "video/mp4",
+        message.video_note.file_unique_id,
     )
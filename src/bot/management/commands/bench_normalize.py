@@ -0,0 +1,100 @@
+import asyncio
+import mimetypes
+import re
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from bot.services.chunking import file_size
+from bot.services.ffmpeg import analyze_ffmpeg
+from bot.services.normalize import normalize_audio, should_normalize
+from bot.services.transcribe import get_transcription_client
+from config import settings
+
+DURATION_RE = re.compile(r"Duration: (\d+):(\d+):(\d+(?:\.\d+)?)")
+
+
+async def probe_duration(path: str) -> int:
+    log = await analyze_ffmpeg(["-i", path], ["-vn"])
+    match = DURATION_RE.search(log)
+    if not match:
+        raise CommandError(f"Cannot read the duration of {path}")
+    hours, minutes, seconds = match.groups()
+    return round(int(hours) * 3600 + int(minutes) * 60 + float(seconds))
+
+
+async def timed(coro) -> tuple[object, float]:
+    start = time.perf_counter()
+    result = await coro
+    return result, time.perf_counter() - start
+
+
+class Command(BaseCommand):
+    help = (
+        "Normalizes audio files like the bot does before upload and reports "
+        "the bytes saved and, per engine, the end-to-end latency of the "
+        "original and the normalized file"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("files", nargs="+")
+        parser.add_argument(
+            "--engine",
+            action="append",
+            dest="engines",
+            default=[],
+            help="Also transcribe with this engine, needs its API key",
+        )
+        parser.add_argument(
+            "--tempo", type=float, help="Speed-up factor instead of NORMALIZE_TEMPO"
+        )
+
+    def handle(self, *args, **options):
+        if options["tempo"]:
+            settings.NORMALIZE_TEMPO = options["tempo"]
+            settings.NORMALIZE_TEMPO_MIN_SECONDS = 0
+        asyncio.run(self.main(options["files"], options["engines"]))
+
+    async def main(self, files, engines):
+        clients = {name: get_transcription_client(name) for name in engines}
+        total_before = total_after = 0
+
+        for path in files:
+            duration = await probe_duration(path)
+            mime_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+            with await asyncio.to_thread(open, path, "rb") as original:
+                size = file_size(original)
+                used = should_normalize(original, mime_type, duration)
+                (normalized, new_mime_type, new_duration), encode_time = await timed(
+                    # Closes the original if the result is smaller
+                    normalize_audio(
+                        await asyncio.to_thread(open, path, "rb"), mime_type, duration
+                    )
+                )
+            with normalized:
+                new_size = file_size(normalized)
+                total_before += size
+                total_after += new_size
+                self.stdout.write(
+                    f"{path}: {duration}s, {size / 1024:.0f} KiB -> "
+                    f"{new_size / 1024:.0f} KiB ({1 - new_size / size:.0%} saved), "
+                    f"{new_duration}s after tempo, encoded in {encode_time:.2f}s, "
+                    f"used by the bot: {'yes' if used else 'no'}"
+                )
+
+                for name, client in clients.items():
+                    with await asyncio.to_thread(open, path, "rb") as original:
+                        _, before = await timed(client.transcribe(original, mime_type))
+                    normalized.seek(0)
+                    _, after = await timed(client.transcribe(normalized, new_mime_type))
+                    self.stdout.write(
+                        f"  {name}: original {before:.2f}s, "
+                        f"normalized {encode_time + after:.2f}s "
+                        f"({encode_time:.2f}s encoding + {after:.2f}s engine)"
+                    )
+
+        if total_before:
+            self.stdout.write(
+                f"Total: {total_before / 1024:.0f} KiB -> {total_after / 1024:.0f} KiB "
+                f"({1 - total_after / total_before:.0%} saved)"
+            )
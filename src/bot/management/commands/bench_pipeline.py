@@ -0,0 +1,325 @@
+import asyncio
+import json
+import multiprocessing
+import random
+import resource
+import sys
+import time
+from types import SimpleNamespace
+
+from django.core.management.base import BaseCommand
+
+from bot.services import file_processor, transcribe
+from bot.services.ffmpeg import run_ffmpeg
+from bot.services.scheduler import percentile
+from bot.services.status import StatusMessage
+from config import settings
+
+TRANSCRIPT = "Раз, два, три, проверка связи. " * 20
+
+
+class FakeProvider:
+    """
+    Stands in for a provider: reads the upload, waits ``latency`` ± ``jitter``
+    seconds and fails with probability ``error_rate``.
+    """
+
+    def __init__(self, latency: float, jitter: float, error_rate: float):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.calls = 0
+
+    async def respond(self, file) -> str:
+        self.calls += 1
+        if isinstance(file, tuple):
+            file = file[1]
+        if hasattr(file, "read"):
+            await asyncio.to_thread(file.read)
+        await asyncio.sleep(
+            max(0.0, self.latency + random.uniform(-self.jitter, self.jitter))
+        )
+        if random.random() < self.error_rate:
+            raise RuntimeError("fake provider error")
+        return TRANSCRIPT
+
+    async def stream(self, file, make_chunk):
+        words = (await self.respond(file)).split(" ")
+
+        async def chunks():
+            for word in words:
+                yield make_chunk(word + " ")
+
+        return chunks()
+
+
+def fake_openai(provider: FakeProvider):
+    async def create(model, file, response_format=None, stream=False):
+        if stream:
+            return await provider.stream(
+                file,
+                lambda text: SimpleNamespace(type="transcript.text.delta", delta=text),
+            )
+        return await provider.respond(file)
+
+    return SimpleNamespace(
+        audio=SimpleNamespace(transcriptions=SimpleNamespace(create=create))
+    )
+
+
+def fake_elevenlabs(provider: FakeProvider):
+    async def convert(file, model_id):
+        return SimpleNamespace(text=await provider.respond(file))
+
+    return SimpleNamespace(speech_to_text=SimpleNamespace(convert=convert))
+
+
+def fake_gemini(provider: FakeProvider):
+    async def upload(file, config):
+        return SimpleNamespace(name=f"files/{id(file)}", file=file)
+
+    async def delete(name):
+        pass
+
+    def audio(contents):
+        part = contents[1]
+        return part.file if hasattr(part, "file") else part.inline_data.data
+
+    async def generate_content(model, contents):
+        return SimpleNamespace(text=await provider.respond(audio(contents)))
+
+    async def generate_content_stream(model, contents):
+        return await provider.stream(
+            audio(contents), lambda text: SimpleNamespace(text=text)
+        )
+
+    return SimpleNamespace(
+        aio=SimpleNamespace(
+            files=SimpleNamespace(upload=upload, delete=delete),
+            models=SimpleNamespace(
+                generate_content=generate_content,
+                generate_content_stream=generate_content_stream,
+            ),
+        )
+    )
+
+
+FAKE_CLIENTS = {
+    "openai_client": fake_openai,
+    "elevenlabs_client": fake_elevenlabs,
+    "gemini_client": fake_gemini,
+}
+
+
+class FakeMessage:
+    """The user message and the status message, every call costs ``latency``."""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+
+    async def edit_text(self, *args, **kwargs):
+        await asyncio.sleep(self.latency)
+
+    async def reply(self, *args, **kwargs):
+        await asyncio.sleep(self.latency)
+        return FakeMessage(self.latency)
+
+    async def reply_document(self, *args, **kwargs):
+        await asyncio.sleep(self.latency)
+        return FakeMessage(self.latency)
+
+
+class FakeBot:
+    """Serves ``audio`` for any file_id after ``latency``, like the Bot API."""
+
+    def __init__(self, audio: bytes, latency: float):
+        self.audio = audio
+        self.latency = latency
+        self.session = SimpleNamespace(api=SimpleNamespace(is_local=False))
+
+    async def get_file(self, file_id):
+        await asyncio.sleep(self.latency)
+        return SimpleNamespace(file_id=file_id, file_path=f"bench/{file_id}")
+
+    async def download_file(self, file_path, destination, timeout=None):
+        await asyncio.sleep(self.latency)
+        destination.write(self.audio)
+        destination.seek(0)
+
+
+def _peak_rss_kib() -> int:
+    # ru_maxrss is in KiB on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+
+def _bench_engine(args) -> dict:
+    """
+    Runs the jobs against one engine in a fresh process, so peak RSS is its
+    own. Module globals and settings are only replaced in that process.
+    """
+    engine_name, audio, mime_type, duration, options = args
+    random.seed()
+    settings.RETRY_DELAY = 0
+    settings.HEDGE_ENABLED = False
+    settings.TRANSCRIPT_CACHE_SIZE = 0
+    provider = FakeProvider(
+        options["latency"], options["jitter"], options["error_rate"]
+    )
+    for factory_name, fake in FAKE_CLIENTS.items():
+        setattr(transcribe, factory_name, lambda fake=fake: fake(provider))
+    engine = transcribe.get_transcription_client(engine_name)
+    settings.TRANSCRIPTION_ENGINE = engine_name
+    file_processor.transcription_client = lambda: engine
+    file_processor.fallback_transcription_client = lambda: None
+    file_processor.bot = FakeBot(audio, options["telegram_latency"])
+
+    async def set_step(msg, step, notify_user=True):
+        if notify_user:
+            msg.update(step.value)
+
+    async def job(number: int):
+        message = FakeMessage(options["telegram_latency"])
+        start = time.perf_counter()
+        msg = None
+        try:
+            msg = StatusMessage(await message.reply("Распознаю..."), "Распознаю...")
+            transcript, _ = await file_processor.transcribe_file(
+                msg, f"file{number}", "voice", mime_type, duration, set_step
+            )
+            await file_processor.send_results(message, msg, transcript, set_step)
+        except Exception:
+            return None
+        finally:
+            if msg:
+                msg.close()
+        return time.perf_counter() - start
+
+    async def main():
+        slots = asyncio.Semaphore(options["concurrency"])
+
+        async def limited(number):
+            async with slots:
+                return await job(number)
+
+        return await asyncio.gather(*(limited(n) for n in range(options["jobs"])))
+
+    baseline = _peak_rss_kib()
+    start = time.perf_counter()
+    results = asyncio.run(main())
+    elapsed = time.perf_counter() - start
+    peak = _peak_rss_kib()
+
+    latencies = sorted(r for r in results if r is not None)
+    in_flight = min(options["concurrency"], options["jobs"])
+    return {
+        "engine": engine_name,
+        "engine_class": type(engine).__name__,
+        "streaming": engine.supports_streaming,
+        "jobs": options["jobs"],
+        "failed": len(results) - len(latencies),
+        "provider_calls": provider.calls,
+        "concurrency": options["concurrency"],
+        "elapsed_seconds": elapsed,
+        "jobs_per_second": len(latencies) / elapsed if elapsed else 0.0,
+        "latency_p50_seconds": percentile(latencies, 0.5),
+        "latency_p95_seconds": percentile(latencies, 0.95),
+        "latency_p99_seconds": percentile(latencies, 0.99),
+        "peak_rss_kib": peak,
+        # ffmpeg runs in child processes and is not included
+        "rss_per_job_kib": (peak - baseline) / in_flight,
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Runs download, preparation, transcription and sending of results for "
+        "every engine against fake providers and a fake Bot, and prints latency "
+        "percentiles, throughput and peak RSS as JSON"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--engine",
+            action="append",
+            dest="engines",
+            help="Engine to run, all known engines by default",
+        )
+        parser.add_argument("--jobs", type=int, default=100)
+        parser.add_argument("--concurrency", type=int, default=8)
+        parser.add_argument(
+            "--latency", type=float, default=1.0, help="Provider latency, seconds"
+        )
+        parser.add_argument("--jitter", type=float, default=0.3)
+        parser.add_argument("--error-rate", type=float, default=0.0)
+        parser.add_argument("--telegram-latency", type=float, default=0.05)
+        parser.add_argument(
+            "--file", help="Audio file to send, a voice-like OGG tone by default"
+        )
+        parser.add_argument(
+            "--duration", type=int, default=30, help="Duration of the file, seconds"
+        )
+        parser.add_argument("--output", help="Write the JSON report to this file")
+
+    def handle(self, *args, **options):
+        audio, mime_type = self.audio(options["file"], options["duration"])
+        engines = options["engines"] or list(transcribe.available_engines())
+
+        # Forked after the audio is ready, one process per engine
+        context = multiprocessing.get_context("fork")
+        results = []
+        for engine_name in engines:
+            with context.Pool(1) as pool:
+                result = pool.apply(
+                    _bench_engine,
+                    ((engine_name, audio, mime_type, options["duration"], options),),
+                )
+            results.append(result)
+            self.stderr.write(
+                f"{engine_name:>32}: {result['jobs_per_second']:6.2f} jobs/s, "
+                f"p50 {result['latency_p50_seconds']:6.2f}s, "
+                f"p95 {result['latency_p95_seconds']:6.2f}s, "
+                f"p99 {result['latency_p99_seconds']:6.2f}s, "
+                f"{result['rss_per_job_kib']:8.0f} KiB/job, "
+                f"failed {result['failed']}"
+            )
+
+        report = json.dumps(
+            {
+                "config": {
+                    key: options[key]
+                    for key in (
+                        "jobs",
+                        "concurrency",
+                        "latency",
+                        "jitter",
+                        "error_rate",
+                        "telegram_latency",
+                        "file",
+                        "duration",
+                    )
+                },
+                "results": results,
+            },
+            ensure_ascii=False,
+            indent=2,
+        )
+        if options["output"]:
+            with open(options["output"], "w") as output:
+                output.write(report)
+        else:
+            self.stdout.write(report)
+
+    def audio(self, path: str | None, duration: int) -> tuple[bytes, str]:
+        if path:
+            with open(path, "rb") as file:
+                return file.read(), "application/octet-stream"
+
+        async def tone():
+            with await run_ffmpeg(
+                ["-f", "lavfi", "-i", f"sine=frequency=300:duration={duration}"],
+                ["-ac", "1", "-c:a", "libopus", "-b:a", "32k", "-f", "ogg", "-"],
+            ) as file:
+                return file.read()
+
+        return asyncio.run(tone()), "audio/ogg"
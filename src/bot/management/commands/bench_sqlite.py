@@ -0,0 +1,133 @@
+import asyncio
+import multiprocessing
+import random
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connections
+
+from bot.services.scheduler import percentile
+from config import settings
+
+# Configurations to compare, the production one comes from settings
+PROFILES = {
+    "rollback": {
+        **settings.SQLITE_PRAGMAS,
+        "journal_mode": "DELETE",
+        "synchronous": "FULL",
+        "cache_size": -2000,
+        "mmap_size": 0,
+    },
+    "production": settings.SQLITE_PRAGMAS,
+}
+
+
+def _use_database(path: Path, pragmas: dict):
+    connection = connections["default"]
+    connection.close()
+    connection.settings_dict["NAME"] = path
+    connection.settings_dict["OPTIONS"] = settings.sqlite_options(pragmas)
+
+
+async def _timed(coro, latencies: list[float], errors: list[str]):
+    start = time.perf_counter()
+    try:
+        return await coro
+    except OperationalError as e:
+        errors.append(str(e))
+    finally:
+        latencies.append(time.perf_counter() - start)
+
+
+def _simulate_jobs(args) -> tuple[list[float], list[str]]:
+    """Runs jobs of one worker process: admission, reservation and the final log."""
+    path, pragmas, jobs, users = args
+    from bot.services import db
+
+    _use_database(path, pragmas)
+    # Forked workers inherit the random state, reseed so they pick different users
+    random.seed()
+    latencies, errors = [], []
+
+    def timed(coro):
+        return _timed(coro, latencies, errors)
+
+    async def main():
+        for _ in range(jobs):
+            hashed_user_id = f"bench-user-{random.randrange(users)}"
+            duration = random.randint(5, 120)
+            result = await timed(
+                db.prepare_user_for_transcription(hashed_user_id, duration)
+            )
+            if result is None or result[1] == "exceeded":
+                continue
+            reservation = await timed(db.reserve_seconds(result[0], duration))
+            if reservation is None:
+                continue
+            # Stands in for the provider call, no locks are held meanwhile
+            await asyncio.sleep(random.uniform(0, 0.005))
+            if random.random() < 0.05:
+                await timed(db.refund_reservation(reservation, duration))
+            else:
+                await timed(
+                    db.commit_reservation(reservation, duration, random.random())
+                )
+
+    asyncio.run(main())
+    connections.close_all()
+    return latencies, errors
+
+
+class Command(BaseCommand):
+    help = (
+        "Runs concurrent simulated jobs through bot.services.db on a scratch "
+        "SQLite database for each configuration and reports throughput and "
+        "lock wait percentiles"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=8)
+        parser.add_argument("--jobs", type=int, default=200, help="Jobs per worker")
+        parser.add_argument("--users", type=int, default=50)
+        parser.add_argument(
+            "--profile", action="append", choices=PROFILES, dest="profiles"
+        )
+
+    def handle(self, *args, **options):
+        settings.AVAILABLE_SECONDS = 10**9
+        # Every worker is a process with its own connection, like bot replicas,
+        # because async ORM calls of one process share a single thread
+        context = multiprocessing.get_context("fork")
+
+        for name in options["profiles"] or PROFILES:
+            pragmas = PROFILES[name]
+            with tempfile.TemporaryDirectory() as tmp:
+                path = Path(tmp) / "bench.sqlite3"
+                _use_database(path, pragmas)
+                call_command("migrate", verbosity=0)
+                connections.close_all()
+
+                tasks = [(path, pragmas, options["jobs"], options["users"])] * options[
+                    "workers"
+                ]
+                start = time.perf_counter()
+                with context.Pool(options["workers"]) as pool:
+                    results = pool.map(_simulate_jobs, tasks)
+                elapsed = time.perf_counter() - start
+
+            latencies = sorted(x for worker, _ in results for x in worker)
+            errors = [e for _, worker in results for e in worker]
+            ms = [x * 1000 for x in latencies]
+            self.stdout.write(
+                f"{name:>10}: {len(latencies) / elapsed:8.0f} ops/s, "
+                f"wait p50 {percentile(ms, 0.5):6.2f} ms, "
+                f"p95 {percentile(ms, 0.95):6.2f} ms, "
+                f"p99 {percentile(ms, 0.99):7.2f} ms, "
+                f"max {(ms[-1] if ms else 0):7.2f} ms, "
+                f"mean {statistics.fmean(ms) if ms else 0:6.2f} ms, "
+                f"locked errors {len(errors)}"
+            )
@@ -0,0 +1,73 @@
+from contextlib import contextmanager
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connections, transaction
+
+from bot.models import Job, Payment, QuotaReservation, Transcription, User
+
+# Parents first, so foreign keys resolve. Queued jobs and the ones the stopped
+# bot left running come along, the latter are queued again on its next start
+MODELS = [User, Payment, QuotaReservation, Transcription, Job]
+
+
+@contextmanager
+def keep_timestamps():
+    """Stops created_at and updated_at from being replaced with the import time."""
+    fields = [
+        model._meta.get_field(name)
+        for model in MODELS
+        for name in ("created_at", "updated_at")
+    ]
+    flags = [(field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, (auto_now, auto_now_add) in zip(fields, flags):
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+class Command(BaseCommand):
+    help = (
+        "Copies users, payments, reservations, transcription logs and jobs from "
+        "the SQLite database into PostgreSQL, keeping primary keys"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        if "sqlite" not in connections.settings:
+            raise CommandError("Set POSTGRES_HOST to import into PostgreSQL")
+        target = connections["default"]
+        for model in MODELS:
+            if model.objects.exists():
+                raise CommandError(
+                    f"{model._meta.label} already has rows in PostgreSQL, "
+                    "import only into a freshly migrated database"
+                )
+
+        batch_size = options["batch_size"]
+        with transaction.atomic(), keep_timestamps():
+            for model in MODELS:
+                batch, total = [], 0
+                for row in (
+                    model.objects.using("sqlite")
+                    .order_by("pk")
+                    .iterator(chunk_size=batch_size)
+                ):
+                    batch.append(row)
+                    if len(batch) == batch_size:
+                        model.objects.bulk_create(batch)
+                        total += len(batch)
+                        batch = []
+                model.objects.bulk_create(batch)
+                total += len(batch)
+                self.stdout.write(f"{model._meta.label}: {total}")
+
+            # Rows were inserted with explicit ids, move the sequences past them
+            with target.cursor() as cursor:
+                for sql in target.ops.sequence_reset_sql(no_style(), MODELS):
+                    cursor.execute(sql)
@@ -1,23 +1,42 @@
 import asyncio
 
+import sentry_sdk
 from django.core.management.base import BaseCommand
-from bot.bot_init import run_bot
+
+from bot.bot_init import run_bot, run_webhook
 from config import settings
-import sentry_sdk
 
 
 class Command(BaseCommand):
     help = "Run the bot"
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--webhook",
+            action="store_true",
+            help="Receive updates on a webhook instead of long polling",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=settings.JOB_WORKERS,
+            help="Run transcriptions in this many worker processes (JOB_WORKERS)",
+        )
+
     def handle(self, *args, **options):
-        asyncio.run(self.main())
+        settings.JOB_WORKERS = options["workers"]
+        asyncio.run(self.main(options["webhook"]))
 
-    async def main(self):
+    async def main(self, webhook=False):
         if settings.SENTRY_DSN:
             sentry_sdk.init(
                 dsn=settings.SENTRY_DSN,
                 traces_sample_rate=1.0,
                 profiles_sample_rate=1.0,
             )
-        print("Bot started")
-        await run_bot()
+        if webhook:
+            print(f"Bot started, webhook on port {settings.WEBHOOK_PORT}")
+            await run_webhook()
+        else:
+            print("Bot started")
+            await run_bot()
@@ -0,0 +1,31 @@
+import asyncio
+
+import sentry_sdk
+from django.core.management.base import BaseCommand
+
+from bot.bot_init import run_worker
+from config import settings
+
+
+class Command(BaseCommand):
+    help = "Run a worker process transcribing jobs queued by runbot --workers"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--name",
+            default=settings.JOB_WORKER_NAME,
+            help="Worker name stored on claimed jobs (JOB_WORKER_NAME)",
+        )
+
+    def handle(self, *args, **options):
+        asyncio.run(self.main(options["name"]))
+
+    async def main(self, name=None):
+        if settings.SENTRY_DSN:
+            sentry_sdk.init(
+                dsn=settings.SENTRY_DSN,
+                traces_sample_rate=1.0,
+                profiles_sample_rate=1.0,
+            )
+        print(f"Worker {name or ''} started")
+        await run_worker(name)
@@ -106,3 +106,6 @@ UNKNOWN_COMMAND_MESSAGE = """
 /stats - проверить, сколько минут осталось.
 /payment N - купить дополнительные минуты.
 """
+
+
+NO_SPEECH_MESSAGE = "🤷 Речь не распознана: в сообщении нет слов."
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.7 on 2026-10-18 12:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("bot", "0002_quotareservation"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="payment",
+            name="payment_id",
+            field=models.CharField(db_index=True, max_length=255),
+        ),
+        migrations.AddIndex(
+            model_name="transcription",
+            index=models.Index(
+                fields=["user", "created_at"], name="bot_transcr_user_id_1afae6_idx"
+            ),
+        ),
+    ]
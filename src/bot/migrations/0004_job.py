@@ -0,0 +1,85 @@
+# Generated by Django 5.2.7 on 2026-10-18 12:38
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("bot", "0003_transcription_payment_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Job",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                ("priority", models.SmallIntegerField()),
+                ("hashed_user_id", models.CharField(max_length=255)),
+                ("source_chat_id", models.BigIntegerField()),
+                ("source_message_id", models.BigIntegerField()),
+                ("chat_id", models.BigIntegerField()),
+                ("chat_type", models.CharField(max_length=32)),
+                ("message_id", models.BigIntegerField()),
+                ("file_type", models.CharField(max_length=32)),
+                ("file_duration", models.IntegerField()),
+                ("file_id", models.CharField(blank=True, max_length=255)),
+                ("mime_type", models.CharField(blank=True, max_length=255, null=True)),
+                (
+                    "file_unique_id",
+                    models.CharField(blank=True, max_length=255, null=True),
+                ),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("held", "Отложена"),
+                            ("queued", "В очереди"),
+                            ("running", "В работе"),
+                            ("done", "Готово"),
+                            ("failed", "Ошибка"),
+                        ],
+                        default="queued",
+                        max_length=16,
+                    ),
+                ),
+                ("worker", models.CharField(blank=True, max_length=255)),
+                ("status_message_id", models.BigIntegerField(blank=True, null=True)),
+                ("started_at", models.DateTimeField(blank=True, null=True)),
+                ("finished_at", models.DateTimeField(blank=True, null=True)),
+                (
+                    "reservation",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        to="bot.quotareservation",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["status", "priority", "id"],
+                        name="bot_job_status_6f8782_idx",
+                    )
+                ],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("source_chat_id", "source_message_id"),
+                        name="job_unique_message",
+                    )
+                ],
+            },
+        ),
+    ]
@@ -28,14 +28,91 @@ class Transcription(TimestampModel):
     audio_duration = models.IntegerField()
     transcription_time = models.FloatField()
 
+    class Meta:
+        indexes = [models.Index(fields=["user", "created_at"])]
+
     def __str__(self):
         return f"Транскрипция #{self.id} от {self.user}"
 
 
+class QuotaReservation(TimestampModel):
+    """Seconds held for a running transcription until it is committed or refunded."""
+
+    class Status(models.TextChoices):
+        RESERVED = "reserved", "Зарезервировано"
+        COMMITTED = "committed", "Списано"
+        REFUNDED = "refunded", "Возвращено"
+
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name="reservations"
+    )
+    free_seconds = models.IntegerField(default=0)
+    purchased_seconds = models.IntegerField(default=0)
+    status = models.CharField(
+        max_length=16, choices=Status.choices, default=Status.RESERVED
+    )
+
+    def __str__(self):
+        return f"Резерв #{self.id} ({self.status}) от {self.user}"
+
+
 class Payment(TimestampModel):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="payments")
-    payment_id = models.CharField(max_length=255)
+    payment_id = models.CharField(max_length=255, db_index=True)
     total_amount = models.IntegerField()
 
     def __str__(self):
         return f"Платеж {self.payment_id} на сумму {self.total_amount} от {self.user}"
+
+
+class Job(TimestampModel):
+    """A file accepted by the intake process and waiting for a worker."""
+
+    class Status(models.TextChoices):
+        # Stored but not to be run yet, see job_queue.hold
+        HELD = "held", "Отложена"
+        QUEUED = "queued", "В очереди"
+        RUNNING = "running", "В работе"
+        DONE = "done", "Готово"
+        FAILED = "failed", "Ошибка"
+
+    priority = models.SmallIntegerField()
+    hashed_user_id = models.CharField(max_length=255)
+    # The message the file came in, a message gets one job however often
+    # Telegram delivers it
+    source_chat_id = models.BigIntegerField()
+    source_message_id = models.BigIntegerField()
+    # The message to reply to, the source one or its copy forwarded to the
+    # admin. Nothing else of it is stored: no names, usernames or captions,
+    # and the file ids are cleared once the job is finished
+    chat_id = models.BigIntegerField()
+    chat_type = models.CharField(max_length=32)
+    message_id = models.BigIntegerField()
+    file_type = models.CharField(max_length=32)
+    file_duration = models.IntegerField()
+    file_id = models.CharField(max_length=255, blank=True)
+    mime_type = models.CharField(max_length=255, null=True, blank=True)
+    file_unique_id = models.CharField(max_length=255, null=True, blank=True)
+    status = models.CharField(
+        max_length=16, choices=Status.choices, default=Status.QUEUED
+    )
+    worker = models.CharField(max_length=255, blank=True)
+    # Set once the job is admitted, so it can be resumed after a restart
+    status_message_id = models.BigIntegerField(null=True, blank=True)
+    reservation = models.ForeignKey(
+        QuotaReservation, on_delete=models.SET_NULL, null=True, blank=True
+    )
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["status", "priority", "id"])]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["source_chat_id", "source_message_id"],
+                name="job_unique_message",
+            )
+        ]
+
+    def __str__(self):
+        return f"Задача #{self.id} ({self.status}) от {self.hashed_user_id[:8]}..."
@@ -0,0 +1,135 @@
+import asyncio
+import hashlib
+import os
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+from config import settings
+
+
+class TranscriptCache:
+    """
+    LRU + TTL cache of finished transcripts keyed by Telegram file_unique_id
+    and engine name. Lives in memory; with ``disk_dir`` and ``disk_key`` set,
+    entries are also kept on disk, encrypted with Fernet, under hashed names.
+
+    The memory tier belongs to one process, so with JOB_WORKERS every worker
+    has its own; the disk tier is shared by all processes using the directory.
+    """
+
+    def __init__(
+        self,
+        max_entries: int,
+        ttl: int,
+        disk_dir: str | None = None,
+        disk_key: str | None = None,
+    ):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: OrderedDict[str, tuple[float, str]] = OrderedDict()
+
+        self._disk_dir = None
+        self._fernet = None
+        if disk_dir:
+            from cryptography.fernet import Fernet
+
+            if not disk_key:
+                raise ValueError(
+                    "Для дискового кэша необходимо установить TRANSCRIPT_CACHE_KEY"
+                )
+            self._disk_dir = Path(disk_dir)
+            self._disk_dir.mkdir(parents=True, exist_ok=True)
+            self._fernet = Fernet(disk_key)
+            self._disk_salt = disk_key.encode()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def _key(self, file_unique_id: str, engine: str) -> str:
+        return f"{engine}:{file_unique_id}"
+
+    def _disk_path(self, key: str) -> Path:
+        # File names must not leak file ids, so they are salted with the key
+        digest = hashlib.sha256(self._disk_salt + key.encode()).hexdigest()
+        return self._disk_dir / digest
+
+    async def get(self, file_unique_id: str | None, engine: str) -> str | None:
+        if not self.enabled or not file_unique_id:
+            return None
+
+        key = self._key(file_unique_id, engine)
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires_at, transcript = entry
+            if expires_at > time.monotonic():
+                self._entries.move_to_end(key)
+                return transcript
+            del self._entries[key]
+
+        if self._fernet is None:
+            return None
+
+        transcript = await asyncio.to_thread(self._disk_get, key)
+        if transcript is not None:
+            self._remember(key, transcript)
+        return transcript
+
+    async def set(self, file_unique_id: str | None, engine: str, transcript: str):
+        if not self.enabled or not file_unique_id:
+            return
+
+        key = self._key(file_unique_id, engine)
+        self._remember(key, transcript)
+
+        if self._fernet is not None:
+            await asyncio.to_thread(self._disk_set, key, transcript)
+
+    def _remember(self, key: str, transcript: str):
+        self._entries[key] = (time.monotonic() + self.ttl, transcript)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _disk_get(self, key: str) -> str | None:
+        from cryptography.fernet import InvalidToken
+
+        path = self._disk_path(key)
+        try:
+            token = path.read_bytes()
+        except FileNotFoundError:
+            return None
+
+        try:
+            transcript = self._fernet.decrypt(token, ttl=self.ttl).decode()
+        except InvalidToken:
+            # Expired or written with another key
+            path.unlink(missing_ok=True)
+            return None
+
+        os.utime(path)
+        return transcript
+
+    def _disk_set(self, key: str, transcript: str):
+        path = self._disk_path(key)
+        # Processes sharing the directory may write the same entry at once
+        tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+        tmp_path.write_bytes(self._fernet.encrypt(transcript.encode()))
+        os.replace(tmp_path, path)
+
+        try:
+            files = sorted(self._disk_dir.iterdir(), key=lambda p: p.stat().st_mtime)
+        except FileNotFoundError:
+            # Another thread evicted a file while we were listing
+            return
+        for stale in files[: max(0, len(files) - self.max_entries)]:
+            stale.unlink(missing_ok=True)
+
+
+transcript_cache = TranscriptCache(
+    max_entries=settings.TRANSCRIPT_CACHE_SIZE,
+    ttl=settings.TRANSCRIPT_CACHE_TTL_SECONDS,
+    disk_dir=settings.TRANSCRIPT_CACHE_DIR,
+    disk_key=settings.TRANSCRIPT_CACHE_KEY,
+)
@@ -0,0 +1,147 @@
+import asyncio
+import contextlib
+import os
+import re
+import tempfile
+from typing import BinaryIO
+
+from bot.services.ffmpeg import analyze_ffmpeg, local_path, run_ffmpeg
+from config import settings
+
+SILENCE_START_RE = re.compile(r"silence_start: (-?\d+(?:\.\d+)?)")
+SILENCE_END_RE = re.compile(r"silence_end: (\d+(?:\.\d+)?)")
+
+
+def parse_silences(log: str, duration: float) -> list[tuple[float, float]]:
+    """Parses silencedetect output into a list of ``(start, end)`` intervals."""
+    silences = []
+    start = None
+    for line in log.splitlines():
+        if match := SILENCE_START_RE.search(line):
+            start = max(0.0, float(match.group(1)))
+        elif (match := SILENCE_END_RE.search(line)) and start is not None:
+            silences.append((start, float(match.group(1))))
+            start = None
+    if start is not None:
+        # Silence lasts until the end of the file
+        silences.append((start, float(duration)))
+    return silences
+
+
+async def detect_silences(
+    path: str,
+    duration: float,
+    noise_db: int = settings.SILENCE_NOISE_DB,
+    min_seconds: float = settings.SILENCE_MIN_SECONDS,
+) -> list[tuple[float, float]]:
+    log = await analyze_ffmpeg(
+        ["-i", path],
+        ["-vn", "-af", f"silencedetect=noise={noise_db}dB:d={min_seconds}"],
+    )
+    return parse_silences(log, duration)
+
+
+def plan_chunks(
+    duration: float, silences: list[tuple[float, float]], chunk_seconds: float
+) -> list[tuple[float, float]]:
+    """
+    Splits ``[0, duration]`` into chunks of about ``chunk_seconds``.
+
+    Every cut is placed in the middle of the silence closest to the target
+    length, searched within ±25% of it. If there is no silence there, the
+    audio is cut at the upper bound.
+    """
+    midpoints = sorted((start + end) / 2 for start, end in silences)
+    max_length = chunk_seconds * 1.25
+
+    chunks = []
+    start = 0.0
+    while duration - start > max_length:
+        target = start + chunk_seconds
+        candidates = [
+            m
+            for m in midpoints
+            if start + chunk_seconds * 0.75 <= m <= start + max_length
+        ]
+        cut = (
+            min(candidates, key=lambda m: abs(m - target))
+            if candidates
+            else start + max_length
+        )
+        chunks.append((start, cut))
+        start = cut
+    chunks.append((start, float(duration)))
+    return chunks
+
+
+async def extract_chunk(path: str, start: float, end: float) -> tuple[BinaryIO, str]:
+    """Cuts ``[start, end]`` out of the file as mono Opus, small enough for any engine."""
+    chunk_file = await run_ffmpeg(
+        ["-ss", f"{start:.3f}", "-t", f"{end - start:.3f}", "-i", path],
+        [
+            "-vn",
+            "-ac",
+            "1",
+            "-c:a",
+            "libopus",
+            "-b:a",
+            settings.CHUNK_BITRATE,
+            "-f",
+            "ogg",
+            "-",
+        ],
+    )
+    return chunk_file, "audio/ogg"
+
+
+def _copy_to_named_file(fd: int):
+    copy = tempfile.NamedTemporaryFile()
+    offset = 0
+    while chunk := os.pread(fd, 64 * 1024, offset):
+        copy.write(chunk)
+        offset += len(chunk)
+    copy.flush()
+    return copy
+
+
+@contextlib.asynccontextmanager
+async def local_copy(audio_file: BinaryIO):
+    """
+    Yields a filesystem path with the audio, so ffmpeg can seek in it.
+    Files without a path are copied into a named temporary file first.
+    """
+    path = local_path(audio_file)
+    if path:
+        yield path
+        return
+
+    copy = await asyncio.to_thread(_copy_to_named_file, audio_file.fileno())
+    try:
+        yield copy.name
+    finally:
+        copy.close()
+
+
+def file_size(audio_file: BinaryIO) -> int:
+    audio_file.seek(0, os.SEEK_END)
+    size = audio_file.tell()
+    audio_file.seek(0)
+    return size
+
+
+def chunk_seconds(clients) -> float:
+    limits = [c.max_duration for c in clients if c.max_duration]
+    # Leave a margin, since chunk bounds move to the nearest silence
+    return min([settings.CHUNK_SECONDS, *(limit * 0.75 for limit in limits)])
+
+
+def needs_chunking(clients, audio_file: BinaryIO, duration: int) -> bool:
+    if not duration:
+        # Without a duration there is nothing to plan the cuts with
+        return False
+    if duration > settings.CHUNK_THRESHOLD_SECONDS:
+        return True
+    if any(c.max_duration and duration > c.max_duration for c in clients):
+        return True
+    size = file_size(audio_file)
+    return any(c.max_upload_bytes and size > c.max_upload_bytes for c in clients)
@@ -1,14 +1,33 @@
-from bot.models import Transcription, User, Payment
-from config import settings
-from django.utils import timezone
 from datetime import timedelta
 
+from asgiref.sync import sync_to_async
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from bot.models import Payment, QuotaReservation, Transcription, User
+from bot.services.user_cache import user_cache
+from config import settings
+
+# Balances are only changed with UPDATE statements on F() expressions, never
+# by saving a User read earlier, so concurrent jobs of one user cannot overwrite
+# each other's changes. Reservations read the balance with the row locked to
+# split it into free and purchased seconds. The resulting balances are written
+# through to the cached User, so admission of returning users does not touch
+# the database
+
+
+async def get_or_create_user(hashed_user_id: str) -> tuple[User, bool]:
+    user = user_cache.get(hashed_user_id)
+    if user is not None:
+        return user, False
 
-async def get_or_create_user(hashed_user_id: str) -> User:
-    return await User.objects.aget_or_create(
+    user, created = await User.objects.aget_or_create(
         hashed_user_id=hashed_user_id,
         defaults=dict(left_free_seconds=settings.AVAILABLE_SECONDS),
     )
+    user_cache.put(user)
+    return user, created
 
 
 async def prepare_user_for_transcription(
@@ -18,37 +37,190 @@ async def prepare_user_for_transcription(
 
     now = timezone.now()
     if user.last_free_reset_at < now - timedelta(days=30):
-        user.left_free_seconds = settings.AVAILABLE_SECONDS
-        user.last_free_reset_at = now
-        user.warned_at = None
-        await user.asave()
+        reset = await User.objects.filter(
+            pk=user.pk, last_free_reset_at__lt=now - timedelta(days=30)
+        ).aupdate(
+            left_free_seconds=settings.AVAILABLE_SECONDS,
+            last_free_reset_at=now,
+            warned_at=None,
+        )
+        if reset:
+            user.left_free_seconds = settings.AVAILABLE_SECONDS
+            user.last_free_reset_at = now
+            user.warned_at = None
+        else:
+            await user.arefresh_from_db()
 
     if user.left_free_seconds + user.left_purchased_seconds < audio_duration:
-        return user, "exceeded"
+        # The cached balance might miss a payment handled by another process
+        await user.arefresh_from_db()
+        if user.left_free_seconds + user.left_purchased_seconds < audio_duration:
+            return user, "exceeded"
     elif (
         user.left_free_seconds + user.left_purchased_seconds
         < settings.LEFT_WARNING_SECONDS
     ):
-        if user.warned_at:
+        # Only one of concurrent jobs gets to show the warning
+        warned = await User.objects.filter(pk=user.pk, warned_at=None).aupdate(
+            warned_at=now
+        )
+        if not warned:
+            if user.warned_at is None:
+                await user.arefresh_from_db()
             return user, "warned"
-        else:
-            user.warned_at = now
-            await user.asave()
-            return user, "show_warning"
+        user.warned_at = now
+        return user, "show_warning"
 
     return user, "success"
 
 
-async def process_user_transcription(
-    user: User, audio_duration: int, transcription_time: float
+async def reserve_seconds(user: User, audio_duration: int) -> QuotaReservation | None:
+    """
+    Atomically takes ``audio_duration`` seconds from the balance, free seconds first.
+    Returns None when the balance is not enough, e.g. because of concurrent jobs.
+    """
+    reservation, user.left_free_seconds, user.left_purchased_seconds = await _reserve(
+        user, audio_duration
+    )
+    return reservation
+
+
+@sync_to_async
+def _reserve(
+    user: User, audio_duration: int
+) -> tuple[QuotaReservation | None, int, int]:
+    # The row stays locked until commit: by SELECT ... FOR UPDATE on PostgreSQL,
+    # SQLite transactions are IMMEDIATE and take the write lock right away.
+    # The balance is the current one, so a job is only rejected if it is short.
+    with transaction.atomic():
+        free, purchased = _balance(user.pk, lock=True)
+        if free + purchased < audio_duration:
+            return None, free, purchased
+        from_free = min(free, audio_duration)
+        from_purchased = audio_duration - from_free
+        User.objects.filter(
+            pk=user.pk,
+            left_free_seconds__gte=from_free,
+            left_purchased_seconds__gte=from_purchased,
+        ).update(
+            left_free_seconds=F("left_free_seconds") - from_free,
+            left_purchased_seconds=F("left_purchased_seconds") - from_purchased,
+        )
+        reservation = QuotaReservation.objects.create(
+            user=user, free_seconds=from_free, purchased_seconds=from_purchased
+        )
+        return reservation, free - from_free, purchased - from_purchased
+
+
+def _balance(user_id: int, lock: bool = False) -> tuple[int, int]:
+    users = User.objects.select_for_update() if lock else User.objects
+    return (
+        users.filter(pk=user_id)
+        .values_list("left_free_seconds", "left_purchased_seconds")
+        .get()
+    )
+
+
+async def commit_reservation(
+    reservation: QuotaReservation, audio_duration: int, transcription_time: float
 ) -> None:
-    if audio_duration <= user.left_free_seconds:
-        user.left_free_seconds -= audio_duration
-    else:
-        seconds_form_purchased = audio_duration - user.left_free_seconds
-        user.left_free_seconds = 0
-        user.left_purchased_seconds -= seconds_form_purchased
-    await user.asave()
+    """Charges the reserved seconds and logs the transcription in one transaction."""
+    log = Transcription(
+        user_id=reservation.user_id,
+        audio_duration=audio_duration,
+        transcription_time=transcription_time,
+    )
+    await commit_reservations([(reservation.pk, log)])
+
+
+@sync_to_async
+def commit_reservations(entries: list[tuple[int | None, Transcription]]) -> None:
+    """
+    Writes a batch of ``(reservation_id, log)`` entries in a single transaction:
+    the reservations are committed and the logs inserted with one statement each.
+    Entries whose reservation was refunded meanwhile, e.g. after an earlier
+    flush of them failed and the job reported an error, are dropped: the
+    refund has logged the job already.
+    """
+    with transaction.atomic():
+        reserved = QuotaReservation.objects.select_for_update().filter(
+            pk__in=[pk for pk, _ in entries if pk is not None],
+            status=QuotaReservation.Status.RESERVED,
+        )
+        committed = set(reserved.values_list("pk", flat=True))
+        QuotaReservation.objects.filter(pk__in=committed).update(
+            status=QuotaReservation.Status.COMMITTED
+        )
+        Transcription.objects.bulk_create(
+            [log for pk, log in entries if pk is None or pk in committed]
+        )
+
+
+async def refund_reservation(
+    reservation: QuotaReservation,
+    audio_duration: int | None = None,
+    transcription_time: float = -1,
+) -> None:
+    """
+    Returns the reserved seconds to the balance and, if ``audio_duration``
+    is given, logs the failed transcription in the same transaction.
+    Free seconds reserved before a monthly reset are not returned.
+    """
+    # The user is the one passed to reserve_seconds, usually the cached instance
+    user = reservation.user
+    user.left_free_seconds, user.left_purchased_seconds = await _refund_and_log(
+        reservation, audio_duration, transcription_time
+    )
+
+
+@sync_to_async
+def _refund_and_log(
+    reservation: QuotaReservation,
+    audio_duration: int | None,
+    transcription_time: float,
+) -> tuple[int, int]:
+    with transaction.atomic():
+        _refund(reservation)
+        if audio_duration is not None:
+            Transcription.objects.create(
+                user_id=reservation.user_id,
+                audio_duration=audio_duration,
+                transcription_time=transcription_time,
+            )
+        return _balance(reservation.user_id)
+
+
+def _refund(reservation: QuotaReservation) -> None:
+    if not QuotaReservation.objects.filter(
+        pk=reservation.pk, status=QuotaReservation.Status.RESERVED
+    ).update(status=QuotaReservation.Status.REFUNDED):
+        return
+    User.objects.filter(pk=reservation.user_id).update(
+        left_purchased_seconds=F("left_purchased_seconds")
+        + reservation.purchased_seconds
+    )
+    User.objects.filter(
+        pk=reservation.user_id, last_free_reset_at__lte=reservation.created_at
+    ).update(left_free_seconds=F("left_free_seconds") + reservation.free_seconds)
+
+
+@sync_to_async
+def refund_stale_reservations(older_than: timedelta = timedelta(0)) -> int:
+    """
+    Refunds reservations of jobs that were interrupted by a restart. With
+    several bot processes on one database only reservations older than the
+    longest job may be refunded, younger ones can belong to running jobs.
+    """
+    stale = QuotaReservation.objects.filter(
+        status=QuotaReservation.Status.RESERVED,
+        created_at__lte=timezone.now() - older_than,
+    )
+    count = 0
+    for reservation in stale:
+        with transaction.atomic():
+            _refund(reservation)
+        count += 1
+    return count
 
 
 async def insert_transcription_log(
@@ -62,10 +234,21 @@ async def insert_transcription_log(
 
 
 async def make_payment(user: User, payment_id: str, total_amount: int) -> None:
-    await Payment.objects.acreate(
-        user=user,
-        payment_id=payment_id,
-        total_amount=total_amount,
+    user.left_free_seconds, user.left_purchased_seconds = await _make_payment(
+        user, payment_id, total_amount
     )
-    user.left_purchased_seconds += total_amount * settings.CURRENCY_RATE_SECONDS
-    await user.asave()
+
+
+@sync_to_async
+def _make_payment(user: User, payment_id: str, total_amount: int) -> tuple[int, int]:
+    with transaction.atomic():
+        Payment.objects.create(
+            user=user,
+            payment_id=payment_id,
+            total_amount=total_amount,
+        )
+        User.objects.filter(pk=user.pk).update(
+            left_purchased_seconds=F("left_purchased_seconds")
+            + total_amount * settings.CURRENCY_RATE_SECONDS
+        )
+        return _balance(user.pk)
@@ -0,0 +1,93 @@
+import asyncio
+
+from aiogram.types import BufferedInputFile
+from aiogram.utils.formatting import BlockQuote, Text
+
+from bot import messages
+from config import settings
+
+# Tried in order, a message ends at the last one in its second half
+SEPARATORS = ("\n\n", "\n", ". ", "! ", "? ", "… ", " ")
+
+TRANSCRIPT_FILENAME = "transcript.txt"
+FILE_NOTE = "Полный текст — в файле."
+
+
+def message_length(text: str) -> int:
+    """Length of ``text`` as Telegram limits it, in UTF-16 code units."""
+    return len(text.encode("utf-16-le")) // 2
+
+
+def _fitting(text: str, limit: int) -> int:
+    """Number of leading characters of ``text`` within ``limit``."""
+    if message_length(text[:limit]) <= limit:
+        return min(len(text), limit)
+    # Emoji and other characters outside the BMP take two units
+    low, high = 0, limit
+    while low < high:
+        middle = (low + high + 1) // 2
+        if message_length(text[:middle]) <= limit:
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+
+def split_transcript(text: str, limit: int | None = None) -> list[str]:
+    """
+    Splits ``text`` into messages of at most ``limit``, at the end of
+    a paragraph, line, sentence or word if there is one close enough.
+    BlockQuote adds an entity, not characters, so the text is what counts.
+    """
+    limit = limit or settings.MAX_MESSAGE_LENGTH
+    parts = []
+    text = text.strip()
+    while message_length(text) > limit:
+        head = text[: _fitting(text, limit)]
+        end = len(head)
+        for separator in SEPARATORS:
+            found = head.rfind(separator)
+            if found > len(head) // 2:
+                # Sentence punctuation stays with its sentence
+                end = found + len(separator.rstrip())
+                break
+        parts.append(head[:end].rstrip())
+        text = text[end:].lstrip()
+    if text:
+        parts.append(text)
+    return parts
+
+
+async def send_transcript(message, status, transcript: str):
+    """
+    Shows the transcript in the ``status`` message, continued in replies to
+    ``message``. Past TRANSCRIPT_FILE_LENGTH it is sent as a .txt document
+    instead, with its beginning in the status message.
+
+    The status message is edited while the replies go out; the replies are
+    sent one by one, so they keep their order.
+    """
+    if settings.TRANSCRIPT_FILE_LENGTH and (
+        message_length(transcript) > settings.TRANSCRIPT_FILE_LENGTH
+    ):
+        limit = settings.MAX_MESSAGE_LENGTH - message_length(FILE_NOTE) - 3
+        preview = split_transcript(transcript, limit)[0] + " …"
+        document = BufferedInputFile(transcript.encode(), filename=TRANSCRIPT_FILENAME)
+        await asyncio.gather(
+            status.final(**Text(BlockQuote(preview), "\n", FILE_NOTE).as_kwargs()),
+            message.reply_document(document),
+        )
+        return
+
+    parts = split_transcript(transcript)
+    if not parts:
+        # The engine heard nothing, and Telegram rejects empty messages
+        await status.final(messages.NO_SPEECH_MESSAGE)
+        return
+    first, *rest = parts
+
+    async def reply_rest():
+        for part in rest:
+            await message.reply(**BlockQuote(part).as_kwargs())
+
+    await asyncio.gather(status.final(**BlockQuote(first).as_kwargs()), reply_rest())
@@ -0,0 +1,115 @@
+import asyncio
+import os
+import subprocess
+import tempfile
+from typing import BinaryIO
+
+from config import settings
+
+CHUNK_SIZE = 64 * 1024
+
+# Caps the number of ffmpeg processes across all jobs of this process
+ffmpeg_slots = asyncio.Semaphore(settings.FFMPEG_CONCURRENCY)
+
+
+def local_path(file: BinaryIO) -> str | None:
+    """Returns a filesystem path of the file handle if ffmpeg can open it directly."""
+    name = getattr(file, "name", None)
+    if isinstance(name, str) and os.path.isfile(name):
+        return name
+    return None
+
+
+async def _feed_stdin(process, source: BinaryIO):
+    try:
+        while chunk := await asyncio.to_thread(source.read, CHUNK_SIZE):
+            process.stdin.write(chunk)
+            await process.stdin.drain()
+    except (BrokenPipeError, ConnectionResetError):
+        # ffmpeg exited early, the reason will be in stderr
+        pass
+    finally:
+        process.stdin.close()
+
+
+async def _collect_stdout(process, output: BinaryIO):
+    while chunk := await process.stdout.read(CHUNK_SIZE):
+        output.write(chunk)
+
+
+def _command(loglevel: str, input_args: list[str], output_args: list[str]):
+    return [
+        "ffmpeg",
+        "-hide_banner",
+        "-loglevel",
+        loglevel,
+        "-threads",
+        str(settings.FFMPEG_THREADS),
+        *input_args,
+        "-threads",
+        str(settings.FFMPEG_THREADS),
+        *output_args,
+    ]
+
+
+async def _run(command: list[str], source: BinaryIO | None, output: BinaryIO | None):
+    """Runs ffmpeg in a free slot and returns its stderr."""
+    async with ffmpeg_slots:
+        process = await asyncio.create_subprocess_exec(
+            *command,
+            stdin=subprocess.PIPE if source is not None else subprocess.DEVNULL,
+            stdout=subprocess.PIPE if output is not None else subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+        )
+        try:
+            tasks = [process.stderr.read()]
+            if output is not None:
+                tasks.append(_collect_stdout(process, output))
+            if source is not None:
+                tasks.append(_feed_stdin(process, source))
+            stderr_bytes, *_ = await asyncio.gather(*tasks)
+            await process.wait()
+        except BaseException:
+            if process.returncode is None:
+                process.kill()
+                await process.wait()
+            raise
+
+    if process.returncode != 0:
+        raise Exception(f"{stderr_bytes.decode()}")
+    return stderr_bytes.decode()
+
+
+async def run_ffmpeg(
+    input_args: list[str], output_args: list[str], source: BinaryIO | None = None
+) -> BinaryIO:
+    """
+    Runs ffmpeg with stdout streamed into a spooled temporary file.
+
+    If ``source`` is given it is piped into stdin chunk by chunk, so ``input_args``
+    should read from ``pipe:0``. The number of concurrent ffmpeg processes is
+    limited by FFMPEG_CONCURRENCY and each one uses at most FFMPEG_THREADS threads.
+    """
+    output = tempfile.SpooledTemporaryFile(max_size=settings.DOWNLOAD_SPOOL_MAX_BYTES)
+    try:
+        await _run(_command("error", input_args, output_args), source, output)
+    except BaseException:
+        output.close()
+        raise
+
+    output.seek(0)
+    return output
+
+
+async def analyze_ffmpeg(
+    input_args: list[str], filter_args: list[str], source: BinaryIO | None = None
+) -> str:
+    """
+    Decodes the input through analysis filters like silencedetect without
+    writing any output and returns the ffmpeg log they print.
+    """
+    return await _run(
+        _command("info", ["-nostats", *input_args], [*filter_args, "-f", "null", "-"]),
+        source,
+        None,
+    )
@@ -1,60 +1,90 @@
 import asyncio
-import tempfile
-import sentry_sdk
 import os
-import subprocess
-import io
-
+import tempfile
+import time
 from enum import StrEnum
+
+import sentry_sdk
+from aiogram.exceptions import TelegramAPIError
+from aiogram.types import Message
 from aiogram.utils.formatting import BlockQuote, Pre
+
+from bot import messages
 from bot.bot_init import bot
+from bot.services import db, job_queue, metrics
+from bot.services.cache import transcript_cache
+from bot.services.chunking import (
+    chunk_seconds,
+    detect_silences,
+    extract_chunk,
+    local_copy,
+    needs_chunking,
+    plan_chunks,
+)
+from bot.services.delivery import send_transcript
+from bot.services.ffmpeg import local_path, run_ffmpeg
+from bot.services.health import engine_health
+from bot.services.hedging import hedged_transcribe, timed_transcribe
+from bot.services.log_writer import transcription_log
+from bot.services.normalize import normalize_audio, should_normalize
+from bot.services.scheduler import Priority, job_scheduler
+from bot.services.status import StatusMessage
+from bot.services.transcribe import fallback_transcription_client, transcription_client
+from bot.services.vad import SILENCE_TRANSCRIPT, trim_silence
 from config import settings
-import bot.messages as messages
-from bot.services.transcribe import transcription_client, fallback_transcription_client
-from bot.services import db
-import time
 
 
 class ProcessStatus(StrEnum):
     INIT = "Инициализация"
     DOWNLOAD = "Скачиваю файл..."
     CONVERT = "Достаю звук из видео..."
+    NORMALIZE = "Сжимаю аудио..."
+    TRIM = "Убираю тишину..."
+    SPLIT = "Нарезаю длинное аудио..."
     TRANSCRIBE = "Распознаю..."
     SENDING = "Отправляю результат..."
 
 
 async def convert_video_to_audio(file):
-    with tempfile.NamedTemporaryFile() as temp_file:
-        temp_file.write(file.read())
-        file_path = temp_file.name
-
-        command = ["ffmpeg", "-i", file_path, "-vn", "-c:a", "copy", "-f", "adts", "-"]
-        process = await asyncio.create_subprocess_exec(
-            *command,
-            stdin=subprocess.PIPE,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-        )
-        audio_bytes, stderr_bytes = await process.communicate()
+    """
+    Extracts the AAC track of a video note into ADTS without re-encoding.
 
-        if process.returncode != 0:
-            raise Exception(f"{stderr_bytes.decode()}")
+    Files stored by the local Bot API server are read by ffmpeg directly,
+    anything else is piped into its stdin. MP4 written without faststart has
+    its index at the end, which ffmpeg cannot seek back to in a pipe, such
+    files are copied to a temporary file and converted from there.
+    """
+    # Without -xerror ffmpeg exits with 0 and no output if demuxing fails
+    output_args = ["-xerror", "-vn", "-c:a", "copy", "-f", "adts", "-"]
+    path = local_path(file)
+    if path:
+        return await run_ffmpeg(["-i", path], output_args), "audio/aac"
 
-        return io.BytesIO(audio_bytes), "audio/aac"
+    try:
+        audio_file = await run_ffmpeg(["-i", "pipe:0"], output_args, source=file)
+    except Exception:
+        async with local_copy(file) as path:
+            audio_file = await run_ffmpeg(["-i", path], output_args)
+    return audio_file, "audio/aac"
 
 
 async def check_user_limits(message, hashed_user_id, file_duration):
+    """Reserves the file duration from the user balance, returns None if it is not enough."""
     user, check_result = await db.prepare_user_for_transcription(
         hashed_user_id, file_duration
     )
-    if check_result == "exceeded":
+    reservation = None
+    if check_result != "exceeded":
+        reservation = await db.reserve_seconds(user, file_duration)
+    if reservation is None:
+        # Both calls leave the current balance on the user, e.g. after another job
         await message.reply(
             messages.limit_exceeded_message(
                 user.left_free_seconds + user.left_purchased_seconds,
                 settings.AVAILABLE_SECONDS,
             )
         )
-        return user, False
+        return None
     elif check_result == "show_warning":
         await message.reply(
             messages.limit_warning_message(
@@ -62,124 +92,395 @@ async def check_user_limits(message, hashed_user_id, file_duration):
                 settings.AVAILABLE_SECONDS,
             )
         )
-    return user, True
+    return reservation
+
+
+async def open_telegram_file(file_info):
+    """
+    Returns a binary file handle with the file contents without buffering
+    the whole file in memory twice.
+
+    The local Bot API server has already stored the file on the shared volume,
+    so it is opened in place. Otherwise the download is streamed into a spooled
+    temporary file, which moves to disk once it outgrows DOWNLOAD_SPOOL_MAX_BYTES.
+    """
+    if bot.session.api.is_local:
+        path = bot.session.api.wrap_local_file.to_local(file_info.file_path)
+        return await asyncio.to_thread(open, path, "rb")
+
+    file = tempfile.SpooledTemporaryFile(max_size=settings.DOWNLOAD_SPOOL_MAX_BYTES)
+    try:
+        await bot.download_file(file_info.file_path, destination=file, timeout=60)
+    except BaseException:
+        file.close()
+        raise
+    return file
+
+
+def _copy_by_fd(fd):
+    copy = tempfile.SpooledTemporaryFile(max_size=settings.DOWNLOAD_SPOOL_MAX_BYTES)
+    offset = 0
+    while chunk := os.pread(fd, 64 * 1024, offset):
+        copy.write(chunk)
+        offset += len(chunk)
+    copy.seek(0)
+    return copy
+
+
+async def open_audio_copy(audio_file):
+    """
+    Returns an independent handle with the same contents as ``audio_file``
+    without moving its position, so both can be uploaded concurrently.
+    """
+    path = local_path(audio_file)
+    if path:
+        return await asyncio.to_thread(open, path, "rb")
+    # pread does not touch the shared offset of the original handle
+    return await asyncio.to_thread(_copy_by_fd, audio_file.fileno())
+
+
+def route_engines():
+    """
+    Returns ``(engine_name, client)`` pairs in the order to try them.
+    While the primary circuit is open, jobs go to the fallback engine first,
+    except for a small share of probes.
+    """
+    primary = (settings.TRANSCRIPTION_ENGINE, transcription_client())
+    fallback_client = fallback_transcription_client()
+    if not fallback_client:
+        return [primary]
+
+    fallback = (settings.FALLBACK_TRANSCRIPTION_ENGINE, fallback_client)
+    if (
+        engine_health(primary[0]).allow_request()
+        or not engine_health(fallback[0]).closed
+    ):
+        return [primary, fallback]
+    metrics.FALLBACKS.labels(fallback[0], "circuit_open").inc()
+    return [fallback, primary]
+
+
+async def transcribe_once(
+    engines, audio_file, mime_type, file_duration, on_partial=None
+):
+    if settings.HEDGE_ENABLED and len(engines) > 1:
+        return await hedged_transcribe(
+            engines[0],
+            engines[1],
+            audio_file,
+            mime_type,
+            file_duration,
+            open_audio_copy,
+            on_partial,
+        )
+    return await timed_transcribe(
+        *engines[0], audio_file, mime_type, file_duration, on_partial
+    )
 
 
-async def download_and_prep_file(msg, file_id, file_type, mime_type, set_step):
+async def download_and_prep_file(
+    msg, file_id, file_type, mime_type, file_duration, set_step
+):
+    """
+    Downloads the file and prepares the audio for upload. Returns
+    ``(file_info, audio_file, mime_type, duration)``, the duration of sped up
+    audio is shorter than the file duration.
+    """
     await set_step(msg, ProcessStatus.DOWNLOAD)
     file_info = await bot.get_file(file_id)
-    file = await bot.download_file(file_info.file_path, timeout=60)
+    audio_file = await open_telegram_file(file_info)
 
     if file_type == "video_note":
         await set_step(msg, ProcessStatus.CONVERT)
-        audio_bytes, new_mime_type = await convert_video_to_audio(file)
-        return file_info, audio_bytes, new_mime_type
-    
-    return file_info, file, mime_type
+        with audio_file:
+            audio_file, mime_type = await convert_video_to_audio(audio_file)
+
+    if should_normalize(audio_file, mime_type, file_duration):
+        await set_step(msg, ProcessStatus.NORMALIZE)
+        try:
+            return file_info, *await normalize_audio(
+                audio_file, mime_type, file_duration
+            )
+        except BaseException:
+            audio_file.close()
+            raise
 
+    return file_info, audio_file, mime_type, file_duration
 
-async def run_transcription(msg, audio_bytes, mime_type, set_step):
+
+async def transcribe_with_retries(
+    msg, audio_file, mime_type, file_duration, label="", on_partial=None
+):
+    engines = route_engines()
+    engine_name = engines[0][0]
     retries = 0
-    start_time = time.time()
-    transcript = None
     errors = []
 
-    await set_step(msg, ProcessStatus.TRANSCRIBE)
     while retries < settings.MAX_RETRIES:
         try:
-            transcript = await transcription_client.transcribe(
-                audio_bytes, mime_type
+            return await transcribe_once(
+                engines, audio_file, mime_type, file_duration, on_partial
             )
-            return transcript, time.time() - start_time
         except Exception as e:
-            audio_bytes.seek(0)
+            audio_file.seek(0)
             retries += 1
-            await msg.edit_text(
+            if len(engines) > 1 and not engine_health(engine_name).closed:
+                # The engine is degraded, go to the other one right away
+                errors.append(e)
+                break
+            if retries < settings.MAX_RETRIES:
+                metrics.RETRIES.labels(engine_name).inc()
+            msg.update(
                 **BlockQuote(
-                    f"Попытка {retries}/{settings.MAX_RETRIES}...\nЖдите {(settings.RETRY_DELAY * retries)} секунд..."
+                    f"{label}Попытка {retries}/{settings.MAX_RETRIES}...\nЖдите {(settings.RETRY_DELAY * retries)} секунд..."
                 ).as_kwargs()
             )
-            await asyncio.sleep((settings.RETRY_DELAY * retries))
+            await asyncio.sleep(settings.RETRY_DELAY * retries)
             if retries == settings.MAX_RETRIES:
                 errors.append(e)
 
-    if transcript is None and fallback_transcription_client:
+    if len(engines) > 1:
+        metrics.FALLBACKS.labels(engines[1][0], "failed").inc()
         try:
-            await msg.edit_text(**BlockQuote("Последняя попытка...").as_kwargs())
-            audio_bytes.seek(0)
-            transcript = await fallback_transcription_client.transcribe(
-                audio_bytes, mime_type
+            msg.update(**BlockQuote(f"{label}Последняя попытка...").as_kwargs())
+            audio_file.seek(0)
+            return await timed_transcribe(
+                *engines[1], audio_file, mime_type, file_duration
             )
-            return transcript, time.time() - start_time
         except Exception as e:
             errors.append(e)
 
-    if transcript is None:
-        error_text = "\n\n".join([f"{type(e).__name__}: {str(e)}" for e in errors])
-        raise Exception(error_text)
+    error_text = "\n\n".join([f"{type(e).__name__}: {e!s}" for e in errors])
+    raise Exception(error_text)
 
 
-async def send_results(message, msg, transcript, set_step):
-    await set_step(msg, ProcessStatus.SENDING, notify_user=False)
-    if len(transcript) > settings.MAX_MESSAGE_LENGTH:
-        await msg.edit_text(
-            **BlockQuote(transcript[: settings.MAX_MESSAGE_LENGTH]).as_kwargs()
+async def transcribe_in_chunks(msg, audio_file, file_duration, clients, set_step):
+    """
+    Splits long audio at silences and transcribes the chunks concurrently,
+    at most CHUNK_CONCURRENCY at a time. Every chunk has its own retries,
+    so a failure does not restart the whole file.
+    """
+    await set_step(msg, ProcessStatus.SPLIT)
+    async with local_copy(audio_file) as path:
+        silences = await detect_silences(path, file_duration)
+        chunks = plan_chunks(file_duration, silences, chunk_seconds(clients))
+
+        await set_step(msg, ProcessStatus.TRANSCRIBE)
+        slots = asyncio.Semaphore(settings.CHUNK_CONCURRENCY)
+        finished = 0
+
+        async def transcribe_chunk(number, start, end):
+            nonlocal finished
+            async with slots:
+                chunk_file, chunk_mime_type = await extract_chunk(path, start, end)
+                with chunk_file:
+                    text = await transcribe_with_retries(
+                        msg,
+                        chunk_file,
+                        chunk_mime_type,
+                        round(end - start),
+                        label=f"Часть {number}/{len(chunks)}. ",
+                    )
+            finished += 1
+            msg.update(f"{ProcessStatus.TRANSCRIBE.value} {finished}/{len(chunks)}")
+            return text
+
+        try:
+            async with asyncio.TaskGroup() as group:
+                tasks = [
+                    group.create_task(transcribe_chunk(number, start, end))
+                    for number, (start, end) in enumerate(chunks, start=1)
+                ]
+        except ExceptionGroup as e:
+            # The other chunks are cancelled, report the failed one
+            raise e.exceptions[0]
+
+    return "\n".join(task.result().strip() for task in tasks)
+
+
+async def run_transcription(msg, audio_file, mime_type, file_duration, set_step):
+    start_time = time.time()
+    clients = [
+        c for c in (transcription_client(), fallback_transcription_client()) if c
+    ]
+
+    if needs_chunking(clients, audio_file, file_duration):
+        transcript = await transcribe_in_chunks(
+            msg, audio_file, file_duration, clients, set_step
         )
-        for i in range(
-            settings.MAX_MESSAGE_LENGTH,
-            len(transcript),
-            settings.MAX_MESSAGE_LENGTH,
-        ):
-            await message.reply(
-                **BlockQuote(
-                    transcript[i : i + settings.MAX_MESSAGE_LENGTH]
-                ).as_kwargs()
-            )
     else:
-        await msg.edit_text(**BlockQuote(transcript).as_kwargs())
+        await set_step(msg, ProcessStatus.TRANSCRIBE)
+        on_partial = PartialResults(msg) if settings.STREAMING_ENABLED else None
+        transcript = await transcribe_with_retries(
+            msg, audio_file, mime_type, file_duration, on_partial=on_partial
+        )
+    return transcript, time.time() - start_time
 
 
-async def handle_file(
-    message, hashed_user_id, file_type, file_duration, file_id, mime_type
-):
+async def transcribe_file(msg, file_id, file_type, mime_type, file_duration, set_step):
+    """
+    Downloads the file, prepares the audio and transcribes it.
+    Returns ``(transcript, transcription_time)``.
+    """
+    start_time = time.time()
     file_info = None
+    audio_file = None
+    try:
+        file_info, audio_file, mime_type, audio_duration = await download_and_prep_file(
+            msg, file_id, file_type, mime_type, file_duration, set_step
+        )
+
+        await set_step(msg, ProcessStatus.TRIM, notify_user=False)
+        audio_file, mime_type, audio_duration, trimmed = await trim_silence(
+            audio_file, mime_type, audio_duration
+        )
+        metrics.TRIMMED_SECONDS.inc(trimmed)
+        if audio_file is None:
+            # Nothing but silence, no engine is called
+            return SILENCE_TRANSCRIPT, time.time() - start_time
+
+        return await run_transcription(
+            msg, audio_file, mime_type, audio_duration, set_step
+        )
+    finally:
+        if audio_file:
+            audio_file.close()
+        if file_info and os.path.exists(file_info.file_path):
+            os.remove(file_info.file_path)
+
+
+def send_partial_results(msg, text):
+    # The cursor keeps the preview different from the final transcript
+    preview = text[: settings.MAX_MESSAGE_LENGTH - 2] + " ▌"
+    msg.update(**BlockQuote(preview).as_kwargs())
+
+
+class PartialResults:
+    """
+    Renders a streamed transcript into the status message,
+    at most once per STREAM_EDIT_INTERVAL_SECONDS.
+    """
+
+    def __init__(self, msg):
+        self.msg = msg
+        self.last_edit_at = 0.0
+
+    async def __call__(self, text):
+        now = time.monotonic()
+        if not text.strip():
+            return
+        if now - self.last_edit_at < settings.STREAM_EDIT_INTERVAL_SECONDS:
+            return
+        self.last_edit_at = now
+        send_partial_results(self.msg, text)
+
+
+async def send_results(message, msg, transcript, set_step):
+    await set_step(msg, ProcessStatus.SENDING, notify_user=False)
+    await send_transcript(message, msg, transcript)
+
 
+async def reply_status(message, job=None):
+    """
+    Replies with the status message of the job. A job resumed after
+    a restart edits the one it sent before instead.
+    """
+    if job and job.status_message_id:
+        msg = Message(
+            message_id=job.status_message_id, date=message.date, chat=message.chat
+        ).as_(bot)
+        try:
+            await msg.edit_text("Продолжаю после перезапуска...")
+            return StatusMessage(msg, "Продолжаю после перезапуска...")
+        except TelegramAPIError:
+            # Deleted by the user, send a new one
+            pass
+
+    msg = await message.reply("Распознаю...")
+    return StatusMessage(msg, "Распознаю...")
+
+
+async def handle_file(
+    message,
+    hashed_user_id,
+    file_type,
+    file_duration,
+    file_id,
+    mime_type,
+    file_unique_id=None,
+    job=None,
+):
+    """
+    Transcribes the file and replies with the transcript. With a ``job`` its
+    progress is stored, see bot.services.job_queue.
+    """
     current_step = ProcessStatus.INIT.name
+    stages = metrics.StageTimer()
+    stages.enter(current_step)
+    stages_token = metrics.current_stages.set(stages)
 
     async def set_step(msg, step: ProcessStatus, notify_user=True):
         nonlocal current_step
         current_step = step.name
+        stages.enter(step.name)
         if notify_user:
-            try:
-                await msg.edit_text(step.value)
-            except Exception:
-                pass
+            msg.update(step.value)
 
     msg = None
+    reservation = None
     try:
-        user, should_continue = await check_user_limits(message, hashed_user_id, file_duration)
-        if not should_continue:
+        reservation = await check_user_limits(message, hashed_user_id, file_duration)
+        if reservation is None:
             return
-
-        msg = await message.reply("Распознаю...")
-
-        file_info, audio_bytes, mime_type = await download_and_prep_file(
-            msg, file_id, file_type, mime_type, set_step
+        msg = await reply_status(message, job)
+        # Everything a restart needs to resume the job, stored in one write
+        await job_queue.save_progress(
+            job, reservation=reservation, status_message_id=msg.message_id
         )
 
-        transcript, transcription_time = await run_transcription(
-            msg, audio_bytes, mime_type, set_step
+        start_time = time.time()
+        # A cached transcript is charged like any other: the balance counts
+        # the audio a user has transcribed, not the engine calls behind it
+        transcript = await transcript_cache.get(
+            file_unique_id, settings.TRANSCRIPTION_ENGINE
         )
+        if transcript is not None:
+            transcription_time = time.time() - start_time
+        else:
+            transcript, transcription_time = await transcribe_file(
+                msg, file_id, file_type, mime_type, file_duration, set_step
+            )
+            await transcript_cache.set(
+                file_unique_id, settings.TRANSCRIPTION_ENGINE, transcript
+            )
 
         await send_results(message, msg, transcript, set_step)
 
-        await db.process_user_transcription(user, file_duration, transcription_time)
-        await db.insert_transcription_log(user, file_duration, transcription_time)
+        if transcript == SILENCE_TRANSCRIPT:
+            # Nothing to recognize, the seconds are returned and only logged
+            await db.refund_reservation(reservation, file_duration, transcription_time)
+        else:
+            await transcription_log.add(
+                reservation.user_id, file_duration, transcription_time, reservation
+            )
+        metrics.JOBS.labels("done").inc()
     except Exception as e:
+        metrics.JOBS.labels("failed").inc()
+        metrics.JOB_ERRORS.labels(current_step, type(e).__name__).inc()
         error_text = str(e) if str(e) else f"{type(e).__name__}"
-        
+        sentry_sdk.set_context("pipeline", {"step": current_step})
+        sentry_sdk.capture_exception(e)
+        # Refunded and logged before the error is shown, sending it to
+        # Telegram can fail as well
+        if reservation:
+            await db.refund_reservation(reservation, file_duration)
+        else:
+            # Failed before it was admitted, nothing to refund
+            user, _ = await db.get_or_create_user(hashed_user_id)
+            await db.insert_transcription_log(user, file_duration, -1)
+
         if msg:
-            await msg.edit_text(
+            await msg.final(
                 **Pre(
                     f"Ошибочка ({current_step}):\n{error_text}"[
                         : settings.MAX_MESSAGE_LENGTH
@@ -187,19 +488,48 @@ async def handle_file(
                 ).as_kwargs()
             )
         else:
-             # Fallback if msg wasn't created yet
-             await message.reply(
+            # Fallback if msg wasn't created yet
+            await message.reply(
                 **Pre(
-                     f"Ошибочка ({current_step}):\n{error_text}"[
+                    f"Ошибочка ({current_step}):\n{error_text}"[
                         : settings.MAX_MESSAGE_LENGTH
                     ]
                 ).as_kwargs()
-             )
+            )
+    finally:
+        stages.finish()
+        metrics.current_stages.reset(stages_token)
+        if msg:
+            msg.close()
 
-        sentry_sdk.set_context("pipeline", {"step": current_step})
-        sentry_sdk.capture_exception(e)
+
+async def submit_job(priority: Priority, message, hashed_user_id, *args):
+    """
+    Stores the job, so it survives a restart, and runs it through the job
+    scheduler of this process, or leaves it to the worker processes when
+    JOB_WORKERS is set.
+    """
+    job = await job_queue.enqueue(priority, message, hashed_user_id, *args)
+    await start_job(job)
+
+
+async def start_job(job):
+    """Runs a queued job in this process, nothing to do when workers run them."""
+    if settings.JOB_WORKERS:
+        return
+
+    await job_scheduler.run(
+        Priority(job.priority),
+        job.hashed_user_id,
+        lambda: job_queue.job_runner.execute(job),
+    )
+
+
+async def schedule_file(priority: Priority, message, hashed_user_id, *args):
+    """Submits a file for transcription, users with purchased minutes go first."""
+    if priority != Priority.HIGH:
         user, _ = await db.get_or_create_user(hashed_user_id)
-        await db.insert_transcription_log(user, file_duration, -1)
-    finally:
-        if file_info and os.path.exists(file_info.file_path):
-            os.remove(file_info.file_path)
+        if user.left_purchased_seconds > 0:
+            priority = Priority.HIGH
+
+    await submit_job(priority, message, hashed_user_id, *args)
@@ -0,0 +1,104 @@
+import random
+import time
+from enum import StrEnum
+
+from bot.services import metrics
+from config import settings
+
+
+class CircuitState(StrEnum):
+    CLOSED = "closed"
+    OPEN = "open"
+
+
+class EngineHealth:
+    """
+    Circuit breaker of one transcription engine.
+
+    Tracks exponentially weighted error rate and latency per second of audio.
+    The circuit opens after BREAKER_FAILURE_THRESHOLD consecutive failures,
+    or when the error rate or the latency exceed their limits. While open,
+    jobs go to the other engine and only BREAKER_PROBE_RATIO of them probe this
+    one. A successful probe closes the circuit again.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.state = CircuitState.CLOSED
+        self.consecutive_failures = 0
+        self.error_rate = 0.0
+        self.latency_per_second = 0.0
+        self.samples = 0
+        self.opened_at = None
+
+    def _update_error_rate(self, failed: bool):
+        alpha = settings.BREAKER_EWMA_ALPHA
+        self.error_rate = alpha * float(failed) + (1 - alpha) * self.error_rate
+        self.samples += 1
+
+    def record_success(self, latency: float, duration: int):
+        self._update_error_rate(False)
+        alpha = settings.BREAKER_EWMA_ALPHA
+        per_second = latency / max(duration, 1)
+        if self.samples == 1:
+            self.latency_per_second = per_second
+        else:
+            self.latency_per_second = (
+                alpha * per_second + (1 - alpha) * self.latency_per_second
+            )
+        self.consecutive_failures = 0
+
+        if self._too_slow():
+            self._open()
+        elif self.state == CircuitState.OPEN:
+            self.state = CircuitState.CLOSED
+            self.opened_at = None
+            metrics.CIRCUIT_OPEN.labels(self.name).set(0)
+
+    def record_failure(self):
+        self._update_error_rate(True)
+        self.consecutive_failures += 1
+        if (
+            self.consecutive_failures >= settings.BREAKER_FAILURE_THRESHOLD
+            or self.samples >= settings.BREAKER_MIN_SAMPLES
+            and self.error_rate > settings.BREAKER_MAX_ERROR_RATE
+        ):
+            self._open()
+
+    def _too_slow(self) -> bool:
+        return (
+            settings.BREAKER_MAX_LATENCY_PER_SECOND > 0
+            and self.samples >= settings.BREAKER_MIN_SAMPLES
+            and self.latency_per_second > settings.BREAKER_MAX_LATENCY_PER_SECOND
+        )
+
+    def _open(self):
+        self.state = CircuitState.OPEN
+        self.opened_at = time.monotonic()
+        metrics.CIRCUIT_OPEN.labels(self.name).set(1)
+
+    @property
+    def closed(self) -> bool:
+        return self.state == CircuitState.CLOSED
+
+    def allow_request(self) -> bool:
+        """Whether a new job should use this engine, open circuits let through probes only."""
+        return self.closed or random.random() < settings.BREAKER_PROBE_RATIO
+
+    def describe(self) -> str:
+        text = (
+            f"{self.name}: {self.state}, ошибки {self.error_rate:.0%}, "
+            f"{self.latency_per_second:.2f} с на секунду аудио"
+        )
+        if self.opened_at is not None:
+            text += f", открыт {time.monotonic() - self.opened_at:.0f} с назад"
+        return text
+
+
+_engines: dict[str, EngineHealth] = {}
+
+
+def engine_health(name: str) -> EngineHealth:
+    if name not in _engines:
+        _engines[name] = EngineHealth(name)
+    return _engines[name]
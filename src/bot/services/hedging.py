@@ -0,0 +1,148 @@
+import asyncio
+import time
+from collections import defaultdict, deque
+
+from bot.services import metrics
+from bot.services.health import engine_health
+from config import settings
+
+
+class LatencyTracker:
+    """
+    Keeps recent successful transcription latencies per engine, bucketed by
+    audio duration: 0s, 1s, 2-3s, 4-7s, 8-15s and so on.
+    """
+
+    def __init__(self, samples_per_bucket: int = 200):
+        self._samples: dict[tuple[str, int], deque[float]] = defaultdict(
+            lambda: deque(maxlen=samples_per_bucket)
+        )
+
+    @staticmethod
+    def bucket(duration: int) -> int:
+        return max(0, int(duration)).bit_length()
+
+    def record(self, engine: str, duration: int, latency: float):
+        self._samples[(engine, self.bucket(duration))].append(latency)
+
+    def percentile(self, engine: str, duration: int, q: float) -> float | None:
+        samples = self._samples.get((engine, self.bucket(duration)))
+        if not samples or len(samples) < settings.HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+latency_tracker = LatencyTracker()
+
+
+def hedge_delay(engine: str, duration: int) -> float:
+    delay = latency_tracker.percentile(engine, duration, settings.HEDGE_PERCENTILE)
+    if delay is None:
+        return settings.HEDGE_DEFAULT_DELAY_SECONDS
+    return delay
+
+
+async def timed_transcribe(
+    engine_name, client, audio_file, mime_type, duration, on_partial=None
+):
+    """
+    Transcribes and records the latency and the outcome for the circuit
+    breaker. Cancelled requests are not counted. With ``on_partial`` set, streaming
+    engines report the text received so far after every delta.
+    """
+    start_time = time.monotonic()
+    try:
+        if on_partial and client.supports_streaming:
+            parts = []
+            async for delta in client.transcribe_stream(audio_file, mime_type):
+                parts.append(delta)
+                await on_partial("".join(parts))
+            transcript = "".join(parts)
+        else:
+            transcript = await client.transcribe(audio_file, mime_type)
+    except Exception as e:
+        engine_health(engine_name).record_failure()
+        metrics.ENGINE_ERRORS.labels(engine_name, type(e).__name__).inc()
+        raise
+    latency = time.monotonic() - start_time
+    metrics.ENGINE_SECONDS.labels(engine_name).observe(latency)
+    metrics.answered_by(engine_name)
+    latency_tracker.record(engine_name, duration, latency)
+    engine_health(engine_name).record_success(latency, duration)
+    return transcript
+
+
+async def hedged_transcribe(
+    primary, fallback, audio_file, mime_type, duration, open_copy, on_partial=None
+):
+    """
+    Sends the audio to the primary engine and, if it has not answered within
+    its usual latency for this duration, to the fallback engine as well.
+    The first successful transcript wins and the other request is cancelled.
+
+    ``primary`` and ``fallback`` are ``(engine_name, client)`` pairs,
+    ``open_copy`` returns an independent handle of ``audio_file`` for the hedge.
+    A primary that is already streaming text to ``on_partial`` is not hedged.
+    """
+    primary_name, primary_client = primary
+    fallback_name, fallback_client = fallback
+
+    first_text = asyncio.Event()
+
+    async def on_primary_partial(text):
+        first_text.set()
+        await on_partial(text)
+
+    primary_task = asyncio.create_task(
+        timed_transcribe(
+            primary_name,
+            primary_client,
+            audio_file,
+            mime_type,
+            duration,
+            on_primary_partial if on_partial else None,
+        )
+    )
+    first_text_task = asyncio.create_task(first_text.wait())
+    try:
+        await asyncio.wait(
+            {primary_task, first_text_task},
+            timeout=hedge_delay(primary_name, duration),
+            return_when=asyncio.FIRST_COMPLETED,
+        )
+    except asyncio.CancelledError:
+        primary_task.cancel()
+        raise
+    finally:
+        first_text_task.cancel()
+    if primary_task.done() or first_text.is_set():
+        return await primary_task
+
+    try:
+        hedge_file = await open_copy(audio_file)
+    except BaseException:
+        primary_task.cancel()
+        raise
+    fallback_task = asyncio.create_task(
+        timed_transcribe(
+            fallback_name, fallback_client, hedge_file, mime_type, duration
+        )
+    )
+    pending = {primary_task, fallback_task}
+    errors = []
+    try:
+        while pending:
+            done, pending = await asyncio.wait(
+                pending, return_when=asyncio.FIRST_COMPLETED
+            )
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+                errors.append(task.exception())
+        raise errors[0]
+    finally:
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        hedge_file.close()
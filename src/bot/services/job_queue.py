@@ -0,0 +1,400 @@
+import asyncio
+import os
+import sys
+import time
+from datetime import timedelta
+
+import sentry_sdk
+from aiogram.types import Chat, Message
+from asgiref.sync import sync_to_async
+from django.db import transaction
+from django.db.models import Count, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from bot.models import Job
+from bot.services import db, metrics
+from bot.services.scheduler import Priority, job_scheduler
+from config import settings
+
+# Jobs are rows of a database table: the intake process inserts them and
+# worker processes claim them with a conditional UPDATE, so no broker is needed.
+# Accepted jobs outlive restarts: a job interrupted by a shutdown goes back to
+# the queue and continues in the status message it had already sent.
+# Only what is needed to reply is stored, finished jobs are deleted after
+# JOB_RETENTION_SECONDS.
+
+# Every process deletes old finished jobs at most this often
+PURGE_INTERVAL_SECONDS = 60 * 60
+_purged_at = float("-inf")
+
+
+async def _store(
+    status: str,
+    priority: int,
+    message: Message,
+    hashed_user_id: str,
+    file_type: str,
+    file_duration: int,
+    file_id: str,
+    mime_type: str | None,
+    file_unique_id: str | None = None,
+) -> tuple[Job, bool]:
+    return await Job.objects.aget_or_create(
+        source_chat_id=message.chat.id,
+        source_message_id=message.message_id,
+        defaults={
+            "status": status,
+            "priority": priority,
+            "hashed_user_id": hashed_user_id,
+            "chat_id": message.chat.id,
+            "chat_type": message.chat.type,
+            "message_id": message.message_id,
+            "file_type": file_type,
+            "file_duration": file_duration,
+            "file_id": file_id,
+            "mime_type": mime_type,
+            "file_unique_id": file_unique_id,
+        },
+    )
+
+
+async def enqueue(priority: int, message: Message, *args) -> Job:
+    """
+    Stores the job of the message. Telegram delivers an update again if the
+    bot went down before confirming it, and webhook requests are retried, so
+    a message that already has a job gets that job instead of a second one.
+    """
+    job, _ = await _store(Job.Status.QUEUED, priority, message, *args)
+    return job
+
+
+async def hold(priority: int, message: Message, *args) -> Job | None:
+    """
+    Stores the job of the message without queueing it, until ``release``
+    says where to reply. None if the message already has a job.
+    """
+    job, created = await _store(Job.Status.HELD, priority, message, *args)
+    return job if created else None
+
+
+async def release(job: Job, reply_to: Message):
+    """Queues a held job, its result goes to ``reply_to``."""
+    job.status = Job.Status.QUEUED
+    job.chat_id, job.chat_type = reply_to.chat.id, reply_to.chat.type
+    job.message_id = reply_to.message_id
+    await job.asave(
+        update_fields=["status", "chat_id", "chat_type", "message_id", "updated_at"]
+    )
+
+
+@sync_to_async
+def claim_job(worker: str) -> Job | None:
+    """
+    Takes the next queued job: by priority, then users with fewer running
+    jobs first, then oldest. Workers racing for a job are told apart by the
+    conditional status update, a loser tries the next candidate.
+    """
+    running = (
+        Job.objects.filter(
+            status=Job.Status.RUNNING, hashed_user_id=OuterRef("hashed_user_id")
+        )
+        .values("hashed_user_id")
+        .annotate(count=Count("pk"))
+        .values("count")
+    )
+    candidates = (
+        Job.objects.filter(status=Job.Status.QUEUED)
+        .annotate(user_running=Coalesce(Subquery(running), Value(0)))
+        .order_by("priority", "user_running", "pk")
+        .values_list("pk", flat=True)[: settings.JOB_CLAIM_CANDIDATES]
+    )
+    for pk in candidates:
+        if Job.objects.filter(pk=pk, status=Job.Status.QUEUED).update(
+            status=Job.Status.RUNNING, worker=worker, started_at=timezone.now()
+        ):
+            return Job.objects.get(pk=pk)
+    return None
+
+
+@sync_to_async
+def claim(job: Job, worker: str) -> bool:
+    """Takes the given job, False if it is not queued anymore."""
+    started_at = timezone.now()
+    if not Job.objects.filter(pk=job.pk, status=Job.Status.QUEUED).update(
+        status=Job.Status.RUNNING, worker=worker, started_at=started_at
+    ):
+        return False
+    job.status, job.worker, job.started_at = Job.Status.RUNNING, worker, started_at
+    return True
+
+
+async def save_progress(job: Job | None, **fields):
+    """
+    Stores what a restart needs to resume the job, nothing without a job.
+    Called once per job, not per step, to keep writes off the hot path.
+    """
+    if job is None:
+        return
+    for name, value in fields.items():
+        setattr(job, name, value)
+    await job.asave(update_fields=[*fields, "updated_at"])
+
+
+async def requeue(job: Job):
+    """Puts an interrupted job back to the queue and refunds its seconds."""
+    if job.reservation:
+        await db.refund_reservation(job.reservation)
+    job.status, job.worker, job.reservation = Job.Status.QUEUED, "", None
+    await job.asave(update_fields=["status", "worker", "reservation", "updated_at"])
+
+
+@sync_to_async
+def requeue_running(worker: str) -> int:
+    """
+    Puts the jobs ``worker`` and its pool workers left running, i.e. before
+    it was killed, back to the queue and refunds their seconds.
+    """
+    running = Job.objects.filter(
+        Q(worker=worker) | Q(worker__startswith=f"{worker}/"),
+        status=Job.Status.RUNNING,
+    ).select_related("reservation")
+    count = 0
+    for job in running:
+        with transaction.atomic():
+            if job.reservation:
+                db._refund(job.reservation)
+            Job.objects.filter(pk=job.pk).update(
+                status=Job.Status.QUEUED, worker="", reservation=None
+            )
+        count += 1
+    return count
+
+
+async def finish_job(job: Job, failed: bool = False):
+    """Marks the job finished and clears the ids the user's file could be fetched by."""
+    job.status = Job.Status.FAILED if failed else Job.Status.DONE
+    job.finished_at = timezone.now()
+    job.file_id, job.file_unique_id = "", None
+    await job.asave(
+        update_fields=[
+            "status",
+            "finished_at",
+            "file_id",
+            "file_unique_id",
+            "updated_at",
+        ]
+    )
+    if time.monotonic() - _purged_at > PURGE_INTERVAL_SECONDS:
+        await purge_finished_jobs()
+
+
+async def purge_finished_jobs() -> int:
+    """
+    Deletes jobs finished more than JOB_RETENTION_SECONDS ago, and held jobs
+    of that age, which a crash kept from being released.
+    """
+    global _purged_at
+    _purged_at = time.monotonic()
+    before = timezone.now() - timedelta(seconds=settings.JOB_RETENTION_SECONDS)
+    deleted, _ = await Job.objects.filter(
+        Q(status__in=[Job.Status.DONE, Job.Status.FAILED], finished_at__lt=before)
+        | Q(status=Job.Status.HELD, created_at__lt=before)
+    ).adelete()
+    return deleted
+
+
+def job_message(job: Job) -> Message:
+    """The message to reply to, rebuilt from the stored ids and bound to the bot."""
+    from bot.bot_init import bot
+
+    return Message(
+        message_id=job.message_id,
+        date=job.created_at,
+        chat=Chat(id=job.chat_id, type=job.chat_type),
+    ).as_(bot)
+
+
+async def run_job(job: Job):
+    from bot.services.file_processor import handle_file
+
+    message = job_message(job)
+    try:
+        await handle_file(
+            message,
+            job.hashed_user_id,
+            job.file_type,
+            job.file_duration,
+            job.file_id,
+            job.mime_type,
+            job.file_unique_id,
+            job=job,
+        )
+    except asyncio.CancelledError:
+        # Not finished within the drain deadline, the next start resumes it
+        await requeue(job)
+        raise
+    except Exception as e:
+        sentry_sdk.capture_exception(e)
+        await finish_job(job, failed=True)
+    else:
+        await finish_job(job)
+
+
+class JobRunner:
+    """
+    Runs the jobs of one worker and keeps track of them, so a shutdown
+    can wait for them and put back the ones that do not finish in time.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.draining = False
+        self._tasks: set[asyncio.Task] = set()
+
+    def __len__(self):
+        return len(self._tasks)
+
+    async def execute(self, job: Job):
+        """Claims and runs a job in the current task, skipped while draining."""
+        if self.draining or not await claim(job, self.name):
+            return
+        task = asyncio.current_task()
+        self._tasks.add(task)
+        try:
+            await run_job(job)
+        finally:
+            self._tasks.discard(task)
+
+    def start(self, job: Job) -> asyncio.Task:
+        """Runs an already claimed job in a new task."""
+        task = asyncio.create_task(run_job(job))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def wait(self, timeout: float):
+        """Waits up to ``timeout`` seconds until one of the running jobs finishes."""
+        if self._tasks:
+            await asyncio.wait(
+                self._tasks, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+            )
+
+    async def drain(self, timeout: float):
+        """
+        Stops taking jobs and waits up to ``timeout`` seconds for the running
+        ones. The rest are cancelled, which puts them back to the queue.
+        """
+        self.draining = True
+        if not self._tasks:
+            return
+        print(f"Waiting up to {timeout}s for {len(self._tasks)} running jobs")
+        _, pending = await asyncio.wait(self._tasks, timeout=timeout)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+
+    async def stop(self):
+        await self.drain(settings.JOB_DRAIN_SECONDS)
+
+
+# Runs jobs in the bot process when there are no worker processes
+job_runner = JobRunner(settings.JOB_WORKER_NAME)
+_resumed: set[asyncio.Task] = set()
+
+
+async def resume_jobs():
+    """Runs the jobs left in the queue by the previous run of the bot process."""
+    async for job in Job.objects.filter(status=Job.Status.QUEUED).order_by(
+        "priority", "pk"
+    ):
+        task = asyncio.create_task(
+            job_scheduler.run(
+                Priority(job.priority),
+                job.hashed_user_id,
+                lambda job=job: job_runner.execute(job),
+            )
+        )
+        _resumed.add(task)
+        task.add_done_callback(_resumed.discard)
+
+
+async def _wait_for(event: asyncio.Event, timeout: float):
+    try:
+        await asyncio.wait_for(event.wait(), timeout)
+    except TimeoutError:
+        pass
+
+
+async def run_worker(name: str | None = None, stop: asyncio.Event | None = None):
+    """
+    Claims jobs and runs up to SCHEDULER_MAX_IN_FLIGHT of them at once.
+    The queue is polled every JOB_POLL_INTERVAL_SECONDS while it is empty.
+    Once ``stop`` is set the running jobs are drained.
+    """
+    runner = JobRunner(name or settings.JOB_WORKER_NAME)
+    stop = stop or asyncio.Event()
+    requeued = await requeue_running(runner.name)
+    if requeued:
+        print(f"Requeued {requeued} jobs interrupted by the previous run")
+
+    while not stop.is_set():
+        if len(runner) >= settings.SCHEDULER_MAX_IN_FLIGHT:
+            await runner.wait(settings.JOB_POLL_INTERVAL_SECONDS)
+            continue
+
+        try:
+            job = await claim_job(runner.name)
+        except Exception as e:
+            sentry_sdk.capture_exception(e)
+            job = None
+        if job is None:
+            await _wait_for(stop, settings.JOB_POLL_INTERVAL_SECONDS)
+            continue
+
+        runner.start(job)
+
+    await runner.stop()
+
+
+class WorkerPool:
+    """Keeps ``count`` runworker processes alive next to the intake process."""
+
+    def __init__(self, count: int):
+        self.count = count
+        self._tasks: list[asyncio.Task] = []
+
+    async def _keep_running(self, number: int):
+        manage_py = settings.BASE_DIR / "manage.py"
+        while True:
+            process = await asyncio.create_subprocess_exec(
+                sys.executable,
+                manage_py,
+                "runworker",
+                "--name",
+                f"{settings.JOB_WORKER_NAME}/{number}",
+                # Set by runbot --workers too, workers share the global rate limit by it
+                env={**os.environ, "JOB_WORKERS": str(self.count)},
+            )
+            try:
+                code = await process.wait()
+            except asyncio.CancelledError:
+                # The worker drains its jobs on SIGTERM
+                process.terminate()
+                await process.wait()
+                raise
+            metrics.process_exited(process.pid)
+            print(f"Worker {number} exited with code {code}, restarting")
+            await asyncio.sleep(settings.RETRY_DELAY)
+
+    async def start(self):
+        self._tasks = [
+            asyncio.create_task(self._keep_running(number))
+            for number in range(self.count)
+        ]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
@@ -0,0 +1,104 @@
+import asyncio
+
+import sentry_sdk
+
+from bot.models import QuotaReservation, Transcription
+from bot.services import db
+from config import settings
+
+
+class TranscriptionLogWriter:
+    """
+    Write-behind buffer of finished transcriptions.
+
+    Logs and their reservation commits are collected in memory and written
+    in one transaction once LOG_BATCH_SIZE entries are pending or every
+    LOG_FLUSH_INTERVAL_SECONDS. When the database falls behind and
+    LOG_MAX_PENDING entries are waiting, new jobs wait in ``add`` until a
+    flush succeeds. Without a running background task every add is written
+    right away.
+    """
+
+    def __init__(self, batch_size: int, flush_interval: float, max_pending: int):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._pending: list[tuple[int | None, Transcription]] = []
+        self._batch_ready = asyncio.Event()
+        self._drained = asyncio.Condition()
+        self._flush_lock = asyncio.Lock()
+        self._task: asyncio.Task | None = None
+
+    def __len__(self):
+        return len(self._pending)
+
+    async def add(
+        self,
+        user_id: int,
+        audio_duration: int,
+        transcription_time: float,
+        reservation: QuotaReservation | None = None,
+    ):
+        async with self._drained:
+            await self._drained.wait_for(lambda: len(self) < self.max_pending)
+            self._pending.append(
+                (
+                    reservation.pk if reservation else None,
+                    Transcription(
+                        user_id=user_id,
+                        audio_duration=audio_duration,
+                        transcription_time=transcription_time,
+                    ),
+                )
+            )
+
+        if self._task is None:
+            await self.flush()
+        elif len(self) >= self.batch_size:
+            self._batch_ready.set()
+
+    async def flush(self):
+        async with self._flush_lock:
+            if not self._pending:
+                return
+            batch = list(self._pending)
+            # Entries stay pending until written, a failed flush is retried
+            await db.commit_reservations(batch)
+            del self._pending[: len(batch)]
+        async with self._drained:
+            self._drained.notify_all()
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._batch_ready.wait(), self.flush_interval)
+            except TimeoutError:
+                pass
+            self._batch_ready.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                sentry_sdk.capture_exception(e)
+
+    async def start(self):
+        # A coroutine, aiogram runs plain function hooks in a thread without a loop
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        """Stops the background task and writes everything still pending."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+
+transcription_log = TranscriptionLogWriter(
+    settings.LOG_BATCH_SIZE,
+    settings.LOG_FLUSH_INTERVAL_SECONDS,
+    settings.LOG_MAX_PENDING,
+)
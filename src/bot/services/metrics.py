@@ -0,0 +1,202 @@
+import os
+import time
+from contextvars import ContextVar
+from pathlib import Path
+
+from aiohttp import web
+from django.db.models import Count
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+from bot.models import Job
+from bot.services.scheduler import Priority
+from config import settings
+
+# Worker processes (JOB_WORKERS) write their metrics to PROMETHEUS_MULTIPROC_DIR
+# and the bot process serves them all together
+MULTIPROCESS = bool(os.environ.get("PROMETHEUS_MULTIPROC_DIR"))
+
+# Telegram calls take fractions of a second, long audio takes minutes
+BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300, 600, 1200)
+
+STAGE_SECONDS = Histogram(
+    "transcription_stage_seconds",
+    "Time spent in each ProcessStatus step of a job, by the engine that answered",
+    ["stage", "engine"],
+    buckets=BUCKETS,
+)
+ENGINE_SECONDS = Histogram(
+    "transcription_engine_seconds",
+    "Latency of successful engine requests",
+    ["engine"],
+    buckets=BUCKETS,
+)
+ENGINE_ERRORS = Counter(
+    "transcription_engine_errors_total",
+    "Failed engine requests by exception type",
+    ["engine", "type"],
+)
+RETRIES = Counter(
+    "transcription_retries_total",
+    "Engine requests repeated after a failure",
+    ["engine"],
+)
+FALLBACKS = Counter(
+    "transcription_fallbacks_total",
+    "Jobs sent to the other engine: after failures or while the circuit is open",
+    ["engine", "reason"],
+)
+TRIMMED_SECONDS = Counter(
+    "transcription_trimmed_seconds_total",
+    "Seconds of silence cut out of the audio before upload",
+)
+CIRCUIT_OPEN = Gauge(
+    "transcription_circuit_open",
+    "1 while the circuit of the engine is open, in any of the processes",
+    ["engine"],
+    multiprocess_mode="livemax",
+)
+JOBS = Counter("transcription_jobs_total", "Finished jobs", ["result"])
+JOB_ERRORS = Counter(
+    "transcription_job_errors_total",
+    "Failed jobs by the step they failed in and exception type",
+    ["stage", "type"],
+)
+QUEUED_JOBS = Gauge(
+    "transcription_jobs_queued",
+    "Jobs waiting to run",
+    ["priority"],
+    multiprocess_mode="livemostrecent",
+)
+RUNNING_JOBS = Gauge(
+    "transcription_jobs_in_flight",
+    "Jobs running in all processes",
+    multiprocess_mode="livemostrecent",
+)
+
+
+class StageTimer:
+    """
+    Observes how long each step of one job took, see ProcessStatus. Steps that
+    got a transcript are labelled with the engine that returned it, so the
+    latency of a fallback engine is not mixed with that of the primary one.
+    """
+
+    def __init__(self):
+        self.stage = None
+        self.engine = ""
+        self.started_at = 0.0
+
+    def enter(self, stage: str | None):
+        now = time.monotonic()
+        if self.stage is not None:
+            STAGE_SECONDS.labels(self.stage, self.engine).observe(now - self.started_at)
+        self.stage, self.engine, self.started_at = stage, "", now
+
+    def finish(self):
+        self.enter(None)
+
+
+# The StageTimer of the job running in the current task, chunk tasks share it
+current_stages: ContextVar[StageTimer | None] = ContextVar(
+    "current_stages", default=None
+)
+
+
+def answered_by(engine: str):
+    """Labels the current step of the running job with the engine that answered."""
+    stages = current_stages.get()
+    if stages is not None:
+        stages.engine = engine
+
+
+async def job_counts() -> tuple[dict[Priority, int], int]:
+    """Queued jobs per priority and running jobs, from the Job table shared by all processes."""
+    counts = {
+        (row["status"], row["priority"]): row["count"]
+        async for row in Job.objects.filter(
+            status__in=[Job.Status.QUEUED, Job.Status.RUNNING]
+        )
+        .values("status", "priority")
+        .annotate(count=Count("pk"))
+    }
+    queued = {
+        priority: counts.get((Job.Status.QUEUED, priority), 0) for priority in Priority
+    }
+    running = sum(
+        n for (status, _), n in counts.items() if status == Job.Status.RUNNING
+    )
+    return queued, running
+
+
+async def update_job_gauges():
+    """Sets queue depth and in-flight jobs from the Job table."""
+    queued, running = await job_counts()
+    for priority, count in queued.items():
+        QUEUED_JOBS.labels(priority.name).set(count)
+    RUNNING_JOBS.set(running)
+
+
+def clear_multiprocess_dir():
+    """
+    Drops values of the previous run, they would be added to the new ones.
+    Files of this process are kept, its metrics were created on import and
+    are written to them.
+    """
+    if MULTIPROCESS:
+        for path in Path(os.environ["PROMETHEUS_MULTIPROC_DIR"]).glob("*.db"):
+            if not path.stem.endswith(f"_{os.getpid()}"):
+                path.unlink()
+
+
+def process_exited(pid: int):
+    """Stops serving live gauges of a worker process that exited."""
+    if MULTIPROCESS:
+        multiprocess.mark_process_dead(pid)
+
+
+def render() -> bytes:
+    if MULTIPROCESS:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry)
+    return generate_latest()
+
+
+async def metrics_view(request: web.Request) -> web.Response:
+    await update_job_gauges()
+    response = web.Response(body=render())
+    response.headers["Content-Type"] = CONTENT_TYPE_LATEST
+    return response
+
+
+def metrics_app() -> web.Application:
+    app = web.Application()
+    app.router.add_get("/metrics", metrics_view)
+    return app
+
+
+class MetricsServer:
+    """Serves /metrics on METRICS_HOST:METRICS_PORT next to the bot."""
+
+    def __init__(self):
+        self._runner: web.AppRunner | None = None
+
+    async def start(self):
+        self._runner = web.AppRunner(metrics_app())
+        await self._runner.setup()
+        await web.TCPSite(
+            self._runner, settings.METRICS_HOST, settings.METRICS_PORT
+        ).start()
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
@@ -0,0 +1,84 @@
+from typing import BinaryIO
+
+from bot.services.chunking import file_size, local_copy
+from bot.services.ffmpeg import run_ffmpeg
+from config import settings
+
+# Voice messages are already mono Opus at a low bitrate
+COMPACT_MIME_TYPES = {"audio/ogg", "audio/opus"}
+
+
+def _bitrate(value: str) -> int:
+    """Parses an ffmpeg bitrate like ``24k`` into bits per second."""
+    value = value.strip().lower()
+    if value.endswith("k"):
+        return int(float(value[:-1]) * 1000)
+    return int(value)
+
+
+def tempo_for(duration: int) -> float:
+    """Speed-up factor for audio of ``duration`` seconds, 1.0 leaves it as is."""
+    if duration >= settings.NORMALIZE_TEMPO_MIN_SECONDS:
+        return settings.NORMALIZE_TEMPO
+    return 1.0
+
+
+def should_normalize(
+    audio_file: BinaryIO, mime_type: str | None, duration: int
+) -> bool:
+    """
+    Whether re-encoding is worth it: the file is sped up, or its bitrate is
+    well above the target, so the upload shrinks. Compact voice OGG is kept.
+    """
+    if not settings.NORMALIZE_ENABLED or not duration:
+        return False
+    if tempo_for(duration) != 1.0:
+        return True
+    if mime_type in COMPACT_MIME_TYPES:
+        return False
+    bitrate = file_size(audio_file) * 8 / duration
+    return bitrate > _bitrate(settings.NORMALIZE_BITRATE) * settings.NORMALIZE_MIN_RATIO
+
+
+def normalize_args(tempo: float = 1.0) -> list[str]:
+    """ffmpeg output options for mono 16 kHz Opus, sped up ``tempo`` times."""
+    filters = ["-af", f"atempo={tempo}"] if tempo != 1.0 else []
+    return [
+        "-vn",
+        "-ac",
+        "1",
+        "-ar",
+        "16000",
+        *filters,
+        "-c:a",
+        "libopus",
+        "-b:a",
+        settings.NORMALIZE_BITRATE,
+        "-application",
+        "voip",
+        "-f",
+        "ogg",
+        "-",
+    ]
+
+
+async def normalize_audio(
+    audio_file: BinaryIO, mime_type: str | None, duration: int
+) -> tuple[BinaryIO, str | None, int]:
+    """
+    Re-encodes the audio as mono 16 kHz low bitrate Opus, callers check
+    should_normalize first. Returns ``(file, mime_type, duration)``; the duration
+    is shorter when the audio was sped up. If nothing is saved the original file
+    is returned, otherwise it is closed.
+    """
+    tempo = tempo_for(duration)
+    # A path lets ffmpeg seek, e.g. to the index at the end of an m4a
+    async with local_copy(audio_file) as path:
+        normalized = await run_ffmpeg(["-i", path], normalize_args(tempo))
+
+    if tempo == 1.0 and file_size(normalized) >= file_size(audio_file):
+        normalized.close()
+        return audio_file, mime_type, duration
+
+    audio_file.close()
+    return normalized, "audio/ogg", max(1, round(duration / tempo))
@@ -0,0 +1,174 @@
+import asyncio
+import itertools
+import time
+from contextvars import ContextVar
+from enum import IntEnum
+
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import TelegramRetryAfter
+
+
+class SendPriority(IntEnum):
+    RESULT = 0  # replies, transcripts and errors
+    PROGRESS = 1  # status message updates, see StatusMessage
+
+
+# Requests made in this context wait behind results, set by StatusMessage
+send_priority: ContextVar[SendPriority] = ContextVar(
+    "send_priority", default=SendPriority.RESULT
+)
+
+
+class TokenBucket:
+    """
+    ``rate`` requests per second on average, ``capacity`` of them at once.
+    The capacity is at least one request, or none would ever get a token.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = max(1, capacity)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.paused_until = 0.0
+
+    def _refill(self, now: float):
+        self.tokens = min(
+            self.capacity, self.tokens + (now - self.updated_at) * self.rate
+        )
+        self.updated_at = now
+
+    def wait_time(self, now: float) -> float:
+        self._refill(now)
+        wait = (1 - self.tokens) / self.rate if self.tokens < 1 else 0.0
+        return max(wait, self.paused_until - now)
+
+    def take(self, now: float):
+        self._refill(now)
+        self.tokens -= 1
+
+    def pause(self, seconds: float):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def idle(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= self.capacity and now >= self.paused_until
+
+
+class TelegramRateLimiter(BaseRequestMiddleware):
+    """
+    Session middleware queueing requests to chats under the Bot API limits:
+    ``global_rate`` per second overall, ``chat_rate`` per second in a private
+    chat and ``group_rate`` per minute in a group.
+
+    Waiting requests go by SendPriority, then in order; in a chat waiting for
+    its limit nothing is sent before the first of them. Flood control answers
+    pause the chat (or everything, for requests without one) and the request
+    is repeated, unless Telegram asks to wait longer than ``max_retry_after``.
+    """
+
+    def __init__(
+        self,
+        global_rate: float,
+        chat_rate: float,
+        chat_burst: int,
+        group_rate: float,
+        max_retry_after: float,
+    ):
+        self.global_rate = global_rate
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.group_rate = group_rate
+        self.max_retry_after = max_retry_after
+        self._global = TokenBucket(global_rate, global_rate)
+        self._chats: dict[int | str, TokenBucket] = {}
+        # (priority, order, chat_id, waiter)
+        self._waiters: list[tuple] = []
+        self._seq = itertools.count()
+        self._wakeup: asyncio.Event | None = None
+        self._task: asyncio.Task | None = None
+
+    async def __call__(self, make_request, bot, method):
+        if not hasattr(method, "chat_id"):
+            # getFile, answerPreCheckoutQuery and the like
+            return await make_request(bot, method)
+
+        chat_id = method.chat_id
+        while True:
+            await self.acquire(chat_id, send_priority.get())
+            try:
+                return await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                if e.retry_after > self.max_retry_after:
+                    raise
+                self._bucket(chat_id).pause(e.retry_after)
+
+    async def acquire(self, chat_id: int | str | None, priority: SendPriority):
+        """Waits until a request to ``chat_id`` may be sent."""
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append((priority, next(self._seq), chat_id, waiter))
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._dispatch())
+        self._wakeup.set()
+        await waiter
+
+    def _bucket(self, chat_id: int | str | None) -> TokenBucket:
+        if chat_id is None:
+            return self._global
+        if chat_id not in self._chats:
+            # Private chats have positive ids, groups and @channelusername do not
+            if isinstance(chat_id, int) and chat_id > 0:
+                bucket = TokenBucket(self.chat_rate, self.chat_burst)
+            else:
+                # No bursts, 20 per minute holds for any minute
+                bucket = TokenBucket(self.group_rate / 60, 1)
+            self._chats[chat_id] = bucket
+        return self._chats[chat_id]
+
+    async def _dispatch(self):
+        while self._waiters:
+            timeout = self._serve()
+            self._wakeup.clear()
+            if timeout is None:
+                continue
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except TimeoutError:
+                pass
+        # Buckets of chats without recent requests are full, no need to keep them
+        now = time.monotonic()
+        for chat_id in [c for c, bucket in self._chats.items() if bucket.idle(now)]:
+            del self._chats[chat_id]
+
+    def _serve(self) -> float | None:
+        """
+        Lets through the waiters that have tokens, returns seconds until
+        the next one may go, or None if nobody is left.
+        """
+        now = time.monotonic()
+        waiting = []
+        blocked_chats = set()
+        next_in = None
+        for entry in sorted(self._waiters, key=lambda entry: entry[:2]):
+            _, _, chat_id, waiter = entry
+            if waiter.done():
+                # Cancelled while waiting
+                continue
+            if chat_id in blocked_chats:
+                waiting.append(entry)
+                continue
+            wait = self._global.wait_time(now)
+            if chat_id is not None:
+                wait = max(wait, self._bucket(chat_id).wait_time(now))
+            if wait > 0:
+                waiting.append(entry)
+                blocked_chats.add(chat_id)
+                next_in = wait if next_in is None else min(next_in, wait)
+                continue
+            self._global.take(now)
+            if chat_id is not None:
+                self._bucket(chat_id).take(now)
+            waiter.set_result(None)
+        self._waiters = waiting
+        return next_in
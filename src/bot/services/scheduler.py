@@ -0,0 +1,119 @@
+import asyncio
+import time
+from collections import OrderedDict, deque
+from enum import IntEnum
+
+from config import settings
+
+
+class Priority(IntEnum):
+    HIGH = 0  # private chats and users with purchased minutes
+    NORMAL = 1  # explicit mentions of the bot in groups
+    LOW = 2  # group auto-transcription and admin forwards
+
+
+class JobScheduler:
+    """
+    Limits the number of jobs running at once.
+
+    Waiting jobs are served by priority tier; inside a tier users take turns,
+    so one user sending many files does not hold back everyone else.
+    """
+
+    def __init__(self, max_in_flight: int, wait_samples: int = 1000):
+        self.max_in_flight = max_in_flight
+        self.in_flight = 0
+        self._queues: dict[Priority, OrderedDict[str, deque[asyncio.Future]]] = {
+            priority: OrderedDict() for priority in Priority
+        }
+        self._wait_times: deque[float] = deque(maxlen=wait_samples)
+
+    def queue_depth(self, priority: Priority | None = None) -> int:
+        priorities = Priority if priority is None else [priority]
+        return sum(
+            len(waiters) for p in priorities for waiters in self._queues[p].values()
+        )
+
+    def stats(self) -> dict:
+        wait_times = sorted(self._wait_times)
+        return {
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+            "queued": {p.name: self.queue_depth(p) for p in Priority},
+            "wait_p50": percentile(wait_times, 0.5),
+            "wait_p95": percentile(wait_times, 0.95),
+            "wait_max": wait_times[-1] if wait_times else 0.0,
+        }
+
+    async def run(self, priority: Priority, user_key: str, job):
+        """Waits for a free slot and runs ``job()``."""
+        queued_at = time.monotonic()
+        await self._acquire(priority, user_key)
+        self._wait_times.append(time.monotonic() - queued_at)
+        try:
+            return await job()
+        finally:
+            self._release()
+
+    async def _acquire(self, priority: Priority, user_key: str):
+        if self.in_flight < self.max_in_flight and not self.queue_depth():
+            self.in_flight += 1
+            return
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._queues[priority].setdefault(user_key, deque()).append(waiter)
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was already handed over to us
+                self._release()
+            else:
+                self._forget(priority, user_key, waiter)
+            raise
+
+    def _forget(self, priority: Priority, user_key: str, waiter: asyncio.Future):
+        waiters = self._queues[priority].get(user_key)
+        if waiters is None:
+            return
+        try:
+            waiters.remove(waiter)
+        except ValueError:
+            pass
+        if not waiters:
+            del self._queues[priority][user_key]
+
+    def _release(self):
+        self.in_flight -= 1
+        while self.in_flight < self.max_in_flight:
+            waiter = self._next_waiter()
+            if waiter is None:
+                return
+            if not waiter.done():
+                self.in_flight += 1
+                waiter.set_result(None)
+
+    def _next_waiter(self) -> asyncio.Future | None:
+        for priority in Priority:
+            users = self._queues[priority]
+            if not users:
+                continue
+            user_key, waiters = next(iter(users.items()))
+            waiter = waiters.popleft()
+            if waiters:
+                # Move the user to the end of the line
+                users.move_to_end(user_key)
+            else:
+                del users[user_key]
+            return waiter
+        return None
+
+
+def percentile(sorted_values: list[float], q: float) -> float:
+    """The ``q`` quantile of already sorted values, 0 if there are none."""
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+job_scheduler = JobScheduler(max_in_flight=settings.SCHEDULER_MAX_IN_FLIGHT)
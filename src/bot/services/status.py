@@ -0,0 +1,93 @@
+import asyncio
+import time
+
+from aiogram.exceptions import TelegramAPIError, TelegramRetryAfter
+
+from bot.services.rate_limit import SendPriority, send_priority
+from config import settings
+
+
+class StatusMessage:
+    """
+    The status message of a job, edited as the job goes on.
+
+    Progress updates are coalesced: they are sent at most once per
+    STATUS_EDIT_INTERVAL_SECONDS, an update replaced by a newer one before
+    that is never sent, and text already shown is not sent again. A job
+    finishing within the first interval only edits the message once, with
+    its result. Flood control answers postpone the next update.
+    """
+
+    def __init__(self, msg, text: str = ""):
+        self.msg = msg
+        self._shown = (text, {})
+        self._pending: tuple[str, dict] | None = None
+        self._next_edit_at = time.monotonic() + settings.STATUS_EDIT_INTERVAL_SECONDS
+        self._task: asyncio.Task | None = None
+
+    @property
+    def message_id(self) -> int:
+        return self.msg.message_id
+
+    def update(self, text: str, **kwargs):
+        """
+        Shows ``text`` once the interval has passed, unless replaced first.
+        Takes the arguments of ``edit_text``, e.g. from ``as_kwargs()``.
+        """
+        self._pending = (text, kwargs)
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._send_pending())
+
+    async def final(self, text: str, **kwargs):
+        """
+        Shows the result of the job right away, dropping pending updates.
+        Flood control is waited out up to TELEGRAM_MAX_RETRY_AFTER_SECONDS in
+        total, longer waits are raised instead of holding the job.
+        """
+        self._pending = None
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        waited = 0.0
+        while True:
+            try:
+                await self._edit(text, kwargs)
+                return
+            except TelegramRetryAfter as e:
+                waited += e.retry_after
+                if waited > settings.TELEGRAM_MAX_RETRY_AFTER_SECONDS:
+                    raise
+                await asyncio.sleep(e.retry_after)
+
+    def close(self):
+        """Drops pending updates, e.g. when the job is cancelled."""
+        self._pending = None
+        if self._task:
+            self._task.cancel()
+
+    async def _send_pending(self):
+        # Results of other jobs are sent first, see TelegramRateLimiter
+        send_priority.set(SendPriority.PROGRESS)
+        while self._pending is not None:
+            await asyncio.sleep(max(0.0, self._next_edit_at - time.monotonic()))
+            if self._pending is None:
+                return
+            text, kwargs = self._pending
+            self._pending = None
+            try:
+                await self._edit(text, kwargs)
+            except TelegramRetryAfter as e:
+                # Keep the update unless a newer one arrives meanwhile
+                if self._pending is None:
+                    self._pending = (text, kwargs)
+                self._next_edit_at = time.monotonic() + e.retry_after
+            except TelegramAPIError:
+                # E.g. the message was deleted, progress is not worth failing the job
+                pass
+
+    async def _edit(self, text: str, kwargs: dict):
+        if (text, kwargs) == self._shown:
+            return
+        await self.msg.edit_text(text=text, **kwargs)
+        self._shown = (text, kwargs)
+        self._next_edit_at = time.monotonic() + settings.STATUS_EDIT_INTERVAL_SECONDS
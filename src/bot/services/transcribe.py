@@ -1,202 +1,223 @@
-import io
-
+import asyncio
+import contextlib
+import functools
+import os
 from abc import ABC, abstractmethod
+from collections.abc import AsyncIterator
+from typing import BinaryIO
 
 from config import settings
 
 
 class TranscriptionService(ABC):
-    @abstractmethod
-    def transcribe(self, file_data: io.BytesIO, mime_type: str) -> str:
-        pass
-
+    # Provider limits, longer or larger audio is split into chunks
+    max_upload_bytes: int | None = None
+    max_duration: int | None = None
+    # Whether transcribe_stream yields text while the provider is still working
+    supports_streaming = False
 
-class OpenAIWhisperTS(TranscriptionService):
-    def __init__(self):
-        from openai import AsyncOpenAI
+    def __init__(self, model: str):
+        self.model = model
 
-        if settings.OPENAI_API_KEY is None:
-            raise ValueError("Для OpenAI необходимо установить OPENAI_API_KEY")
-        self.client = AsyncOpenAI(api_key=settings.OPENAI_API_KEY)
-
-    async def transcribe(self, file_data: io.BytesIO, mime_type: str) -> str:
-        file_tuple = ("file", file_data.getvalue(), mime_type)
-        transcript = await self.client.audio.transcriptions.create(
-            model="whisper-1", file=file_tuple, response_format="text"
-        )
-        return transcript
-
-
-class OpenAIGPT4oMiniTranscribeTS(TranscriptionService):
-    def __init__(self):
-        from openai import AsyncOpenAI
+    @abstractmethod
+    def transcribe(self, file_data: BinaryIO, mime_type: str) -> str:
+        pass
 
-        if settings.OPENAI_API_KEY is None:
-            raise ValueError("Для OpenAI необходимо установить OPENAI_API_KEY")
-        self.client = AsyncOpenAI(api_key=settings.OPENAI_API_KEY)
+    async def transcribe_stream(
+        self, file_data: BinaryIO, mime_type: str
+    ) -> AsyncIterator[str]:
+        """Yields text deltas. Engines without streaming yield the whole transcript once."""
+        yield await self.transcribe(file_data, mime_type)
 
-    async def transcribe(self, file_data: io.BytesIO, mime_type: str) -> str:
-        file_tuple = ("file", file_data.getvalue(), mime_type)
-        transcript = await self.client.audio.transcriptions.create(
-            model="gpt-4o-mini-transcribe", file=file_tuple, response_format="text"
-        )
-        return transcript
 
+# SDK clients are created on first use and shared by all models of a provider,
+# so every provider keeps a single connection pool
 
-class ElevenLabsScribeV1TS(TranscriptionService):
-    def __init__(self):
-        from elevenlabs.client import AsyncElevenLabs
 
-        api_key = settings.ELEVENLABS_API_KEY
-        if api_key is None:
-            raise ValueError("Для ElevenLabs необходимо установить ELEVENLABS_API_KEY")
-        self.client = AsyncElevenLabs(api_key=api_key)
+@functools.cache
+def openai_client():
+    from openai import AsyncOpenAI
 
-    async def transcribe(self, file_data: io.BytesIO, mime_type: str) -> str:
-        response = await self.client.speech_to_text.convert(
-            file=file_data, model_id="scribe_v1"
-        )
-        return response.text or "..."
+    if settings.OPENAI_API_KEY is None:
+        raise ValueError("Для OpenAI необходимо установить OPENAI_API_KEY")
+    return AsyncOpenAI(api_key=settings.OPENAI_API_KEY)
 
 
-class ElevenLabsScribeV2TS(TranscriptionService):
-    def __init__(self):
-        from elevenlabs.client import AsyncElevenLabs
+@functools.cache
+def elevenlabs_client():
+    from elevenlabs.client import AsyncElevenLabs
 
-        api_key = settings.ELEVENLABS_API_KEY
-        if api_key is None:
-            raise ValueError("Для ElevenLabs необходимо установить ELEVENLABS_API_KEY")
-        self.client = AsyncElevenLabs(api_key=api_key)
+    api_key = settings.ELEVENLABS_API_KEY
+    if api_key is None:
+        raise ValueError("Для ElevenLabs необходимо установить ELEVENLABS_API_KEY")
+    return AsyncElevenLabs(api_key=api_key)
 
-    async def transcribe(self, file_data: io.BytesIO, mime_type: str) -> str:
-        response = await self.client.speech_to_text.convert(
-            file=file_data, model_id="scribe_v2"
-        )
-        return response.text or "..."
 
+@functools.cache
+def gemini_client():
+    from google import genai
 
-class Gemini25FlashTranscribeTS(TranscriptionService):
-    def __init__(self):
-        from google import genai
+    api_key = settings.GEMINI_API_KEY
+    if api_key is None:
+        raise ValueError("Для Gemini необходимо установить GEMINI_API_KEY")
+    return genai.Client(api_key=api_key)
 
-        api_key = settings.GEMINI_API_KEY
-        if api_key is None:
-            raise ValueError("Для Gemini необходимо установить GEMINI_API_KEY")
 
-        self.client = genai.Client()
+class OpenAITS(TranscriptionService):
+    max_upload_bytes = 25 * 1024 * 1024
 
-    async def transcribe(self, file_data: io.BytesIO, mime_type: str) -> str:
-        from google.genai.types import UploadFileConfig
+    def __init__(self, model: str):
+        super().__init__(model)
+        self.client = openai_client()
+        # whisper-1 has neither streaming nor a duration limit,
+        # gpt-4o-*-transcribe models have both
+        if model != "whisper-1":
+            self.supports_streaming = True
+            self.max_duration = 1500
 
-        file = await self.client.aio.files.upload(
-            file=file_data, config=UploadFileConfig(mime_type=mime_type)
-        )
-        prompt = settings.GEMINI_PROMPT
-        response = await self.client.aio.models.generate_content(
-            model="gemini-2.5-flash", contents=[prompt, file]
+    async def transcribe(self, file_data: BinaryIO, mime_type: str) -> str:
+        file_tuple = ("file", file_data, mime_type)
+        transcript = await self.client.audio.transcriptions.create(
+            model=self.model, file=file_tuple, response_format="text"
         )
-        if not response.text:
-            raise Exception(response)
-        return response.text
-
-
-class Gemini3FlashTranscribeTS(TranscriptionService):
-    def __init__(self):
-        from google import genai
-
-        api_key = settings.GEMINI_API_KEY
-        if api_key is None:
-            raise ValueError("Для Gemini необходимо установить GEMINI_API_KEY")
-
-        self.client = genai.Client()
+        return transcript
 
-    async def transcribe(self, file_data: io.BytesIO, mime_type: str) -> str:
-        from google.genai.types import UploadFileConfig
+    async def transcribe_stream(
+        self, file_data: BinaryIO, mime_type: str
+    ) -> AsyncIterator[str]:
+        if not self.supports_streaming:
+            yield await self.transcribe(file_data, mime_type)
+            return
 
-        file = await self.client.aio.files.upload(
-            file=file_data, config=UploadFileConfig(mime_type=mime_type)
-        )
-        prompt = settings.GEMINI_PROMPT
-        response = await self.client.aio.models.generate_content(
-            model="gemini-3-flash-preview", contents=[prompt, file]
+        file_tuple = ("file", file_data, mime_type)
+        stream = await self.client.audio.transcriptions.create(
+            model=self.model, file=file_tuple, stream=True
         )
-        if not response.text:
-            raise Exception(response)
-        return response.text
-
-
-class Gemini25FlashLiteTranscribeTS(TranscriptionService):
-    def __init__(self):
-        from google import genai
-
-        api_key = settings.GEMINI_API_KEY
-        if api_key is None:
-            raise ValueError("Для Gemini необходимо установить GEMINI_API_KEY")
+        async for event in stream:
+            if event.type == "transcript.text.delta":
+                yield event.delta
 
-        self.client = genai.Client()
 
-    async def transcribe(self, file_data: io.BytesIO, mime_type: str) -> str:
-        from google.genai.types import UploadFileConfig
+class ElevenLabsTS(TranscriptionService):
+    def __init__(self, model: str):
+        super().__init__(model)
+        self.client = elevenlabs_client()
 
-        file = await self.client.aio.files.upload(
-            file=file_data, config=UploadFileConfig(mime_type=mime_type)
-        )
-        prompt = settings.GEMINI_PROMPT
-        response = await self.client.aio.models.generate_content(
-            model="gemini-2.5-flash-lite", contents=[prompt, file]
+    async def transcribe(self, file_data: BinaryIO, mime_type: str) -> str:
+        response = await self.client.speech_to_text.convert(
+            file=file_data, model_id=self.model
         )
-        if not response.text:
-            raise Exception(response)
-        return response.text
-
-
-class Gemini31FlashLiteTranscribeTS(TranscriptionService):
-    def __init__(self):
-        from google import genai
-
-        api_key = settings.GEMINI_API_KEY
-        if api_key is None:
-            raise ValueError("Для Gemini необходимо установить GEMINI_API_KEY")
+        return response.text or "..."
 
-        self.client = genai.Client()
 
-    async def transcribe(self, file_data: io.BytesIO, mime_type: str) -> str:
-        from google.genai.types import UploadFileConfig
+class GeminiTS(TranscriptionService):
+    supports_streaming = True
+
+    def __init__(self, model: str):
+        super().__init__(model)
+        self.client = gemini_client()
+
+    @contextlib.asynccontextmanager
+    async def _contents(self, file_data: BinaryIO, mime_type: str):
+        """
+        Yields the request contents. Audio up to GEMINI_INLINE_MAX_BYTES is sent
+        inline in the same request, larger audio goes through the Files API
+        and the uploaded file is deleted afterwards.
+        """
+        from google.genai.types import Part, UploadFileConfig
+
+        file_data.seek(0, os.SEEK_END)
+        size = file_data.tell()
+        file_data.seek(0)
+        if size <= settings.GEMINI_INLINE_MAX_BYTES:
+            data = await asyncio.to_thread(file_data.read)
+            yield [
+                settings.GEMINI_PROMPT,
+                Part.from_bytes(data=data, mime_type=mime_type),
+            ]
+            return
 
         file = await self.client.aio.files.upload(
             file=file_data, config=UploadFileConfig(mime_type=mime_type)
         )
-        prompt = settings.GEMINI_PROMPT
-        response = await self.client.aio.models.generate_content(
-            model="gemini-3.1-flash-lite", contents=[prompt, file]
-        )
+        try:
+            yield [settings.GEMINI_PROMPT, file]
+        finally:
+            try:
+                await self.client.aio.files.delete(name=file.name)
+            except Exception:
+                # Uploaded files expire after two days anyway
+                pass
+
+    async def transcribe(self, file_data: BinaryIO, mime_type: str) -> str:
+        async with self._contents(file_data, mime_type) as contents:
+            response = await self.client.aio.models.generate_content(
+                model=self.model, contents=contents
+            )
         if not response.text:
             raise Exception(response)
         return response.text
 
-
+    async def transcribe_stream(
+        self, file_data: BinaryIO, mime_type: str
+    ) -> AsyncIterator[str]:
+        has_text = False
+        async with self._contents(file_data, mime_type) as contents:
+            async for chunk in await self.client.aio.models.generate_content_stream(
+                model=self.model, contents=contents
+            ):
+                if chunk.text:
+                    has_text = True
+                    yield chunk.text
+        if not has_text:
+            raise Exception("Gemini вернул пустой ответ")
+
+
+PROVIDERS = {
+    "openai": OpenAITS,
+    "elevenlabs": ElevenLabsTS,
+    "gemini": GeminiTS,
+}
+
+# Engine name -> (provider, model). More engines can be added without code
+# through EXTRA_TRANSCRIPTION_ENGINES, e.g. "openai-gpt-4o-transcribe=openai:gpt-4o-transcribe"
+ENGINES = {
+    "openai-whisper": ("openai", "whisper-1"),
+    "openai-gpt-4o-mini-transcribe": ("openai", "gpt-4o-mini-transcribe"),
+    "elevenlabs-scribe_v1": ("elevenlabs", "scribe_v1"),
+    "elevenlabs-scribe_v2": ("elevenlabs", "scribe_v2"),
+    "gemini-2.5-flash": ("gemini", "gemini-2.5-flash"),
+    "gemini-3-flash-preview": ("gemini", "gemini-3-flash-preview"),
+    "gemini-2.5-flash-lite": ("gemini", "gemini-2.5-flash-lite"),
+    "gemini-3.1-flash-lite": ("gemini", "gemini-3.1-flash-lite"),
+}
+
+
+def available_engines() -> dict[str, tuple[str, str]]:
+    return {**ENGINES, **settings.EXTRA_TRANSCRIPTION_ENGINES}
+
+
+@functools.cache
 def get_transcription_client(engine_name: str) -> TranscriptionService:
-    engines = {
-        "openai-whisper": OpenAIWhisperTS(),
-        "openai-gpt-4o-mini-transcribe": OpenAIGPT4oMiniTranscribeTS(),
-        "elevenlabs-scribe_v1": ElevenLabsScribeV1TS(),
-        "elevenlabs-scribe_v2": ElevenLabsScribeV2TS(),
-        "gemini-2.5-flash": Gemini25FlashTranscribeTS(),
-        "gemini-3-flash-preview": Gemini3FlashTranscribeTS(),
-        "gemini-2.5-flash-lite": Gemini25FlashLiteTranscribeTS(),
-        "gemini-3.1-flash-lite": Gemini31FlashLiteTranscribeTS(),
-    }
+    engines = available_engines()
     if engine_name not in engines:
         raise ValueError(
             f"Invalid engine name: {engine_name}. Available engines: {engines.keys()}"
         )
-    return engines[engine_name]
+    provider, model = engines[engine_name]
+    if provider not in PROVIDERS:
+        raise ValueError(
+            f"Invalid provider {provider} for engine {engine_name}. "
+            f"Available providers: {PROVIDERS.keys()}"
+        )
+    return PROVIDERS[provider](model)
+
+
+def transcription_client() -> TranscriptionService:
+    return get_transcription_client(settings.TRANSCRIPTION_ENGINE)
 
 
-transcription_client = get_transcription_client(settings.TRANSCRIPTION_ENGINE)
-if settings.FALLBACK_TRANSCRIPTION_ENGINE:
-    fallback_transcription_client = get_transcription_client(
-        settings.FALLBACK_TRANSCRIPTION_ENGINE
-    )
-else:
-    fallback_transcription_client = None
+def fallback_transcription_client() -> TranscriptionService | None:
+    if not settings.FALLBACK_TRANSCRIPTION_ENGINE:
+        return None
+    return get_transcription_client(settings.FALLBACK_TRANSCRIPTION_ENGINE)
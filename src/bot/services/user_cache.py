@@ -0,0 +1,58 @@
+import time
+from collections import OrderedDict
+
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from bot.models import User
+from config import settings
+
+
+class UserCache:
+    """
+    LRU + TTL cache of ``User`` rows keyed by hashed_user_id.
+
+    Balance changes made by this process are written through by bot.services.db.
+    Saves through the ORM, e.g. in the admin, drop the entry. Other processes
+    are covered by the TTL; the balance check is advisory anyway, reservations
+    are conditional updates in the database.
+    """
+
+    def __init__(self, max_entries: int, ttl: int):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: OrderedDict[str, tuple[float, User]] = OrderedDict()
+
+    def get(self, hashed_user_id: str) -> User | None:
+        entry = self._entries.get(hashed_user_id)
+        if entry is None:
+            return None
+        expires_at, user = entry
+        if expires_at <= time.monotonic():
+            self._entries.pop(hashed_user_id, None)
+            return None
+        self._entries.move_to_end(hashed_user_id)
+        return user
+
+    def put(self, user: User):
+        if self.max_entries <= 0:
+            return
+        self._entries[user.hashed_user_id] = (time.monotonic() + self.ttl, user)
+        self._entries.move_to_end(user.hashed_user_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, hashed_user_id: str):
+        self._entries.pop(hashed_user_id, None)
+
+    def clear(self):
+        self._entries.clear()
+
+
+user_cache = UserCache(settings.USER_CACHE_SIZE, settings.USER_CACHE_TTL_SECONDS)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def _invalidate_user(sender, instance: User, **kwargs):
+    user_cache.invalidate(instance.hashed_user_id)
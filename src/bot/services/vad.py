@@ -0,0 +1,97 @@
+from typing import BinaryIO
+
+from bot.services.chunking import detect_silences, local_copy
+from bot.services.ffmpeg import run_ffmpeg
+from config import settings
+
+# Result of audio without speech, the same marker the Gemini prompt asks for
+SILENCE_TRANSCRIPT = "[Тишина]"
+
+
+def speech_segments(
+    silences: list[tuple[float, float]],
+    duration: float,
+    pad: float,
+    min_pause: float,
+) -> list[tuple[float, float]]:
+    """
+    Returns the ``(start, end)`` intervals to keep: silence at the edges is
+    dropped, pauses inside the speech longer than ``min_pause`` are cut down
+    to ``pad`` seconds on each side. An empty list means no speech at all.
+    """
+    segments = []
+    start = 0.0
+    for silence_start, silence_end in sorted(silences):
+        leading = silence_start <= 0
+        # Durations from Telegram are whole seconds
+        trailing = silence_end >= duration - 1
+        if not leading and not trailing and silence_end - silence_start <= min_pause:
+            continue
+        end = silence_start if leading else silence_start + pad
+        if end > start:
+            segments.append((start, min(end, duration)))
+        start = duration if trailing else max(0.0, silence_end - pad)
+    if start < duration:
+        segments.append((start, float(duration)))
+    return [(s, e) for s, e in segments if e - s > 0.01]
+
+
+def _select_filter(segments: list[tuple[float, float]]) -> str:
+    condition = "+".join(f"between(t,{s:.3f},{e:.3f})" for s, e in segments)
+    return f"aselect='{condition}',asetpts=N/SR/TB"
+
+
+async def trim_silence(
+    audio_file: BinaryIO, mime_type: str | None, duration: int
+) -> tuple[BinaryIO | None, str | None, int, float]:
+    """
+    Cuts silence out of the audio with ffmpeg silencedetect, which only looks
+    at the volume, so it costs a decoding pass and no model.
+
+    Returns ``(file, mime_type, duration, trimmed_seconds)``. The file is None
+    if there is no speech at all. If less than VAD_MIN_TRIM_SECONDS would be
+    cut, the original file is returned, otherwise it is closed. Audio shorter
+    than VAD_MIN_DURATION_SECONDS is only checked for speech, not re-encoded.
+    """
+    if not settings.VAD_ENABLED or not duration:
+        return audio_file, mime_type, duration, 0.0
+
+    async with local_copy(audio_file) as path:
+        silences = await detect_silences(
+            path, duration, settings.VAD_NOISE_DB, settings.VAD_PAD_SECONDS * 2
+        )
+        segments = speech_segments(
+            silences, duration, settings.VAD_PAD_SECONDS, settings.VAD_MIN_PAUSE_SECONDS
+        )
+        if not segments:
+            audio_file.close()
+            return None, mime_type, 0, float(duration)
+
+        kept = sum(end - start for start, end in segments)
+        trimmed = duration - kept
+        if (
+            trimmed < settings.VAD_MIN_TRIM_SECONDS
+            or duration < settings.VAD_MIN_DURATION_SECONDS
+        ):
+            return audio_file, mime_type, duration, 0.0
+
+        trimmed_file = await run_ffmpeg(
+            ["-i", path],
+            [
+                "-vn",
+                "-af",
+                _select_filter(segments),
+                "-ac",
+                "1",
+                "-c:a",
+                "libopus",
+                "-b:a",
+                settings.CHUNK_BITRATE,
+                "-f",
+                "ogg",
+                "-",
+            ],
+        )
+
+    audio_file.close()
+    return trimmed_file, "audio/ogg", max(1, round(kept)), trimmed
@@ -0,0 +1,60 @@
+import pytest
+from cryptography.fernet import Fernet
+
+from bot.services.cache import TranscriptCache
+
+pytestmark = [pytest.mark.asyncio]
+
+
+async def test_cache_returns_transcript_for_same_file_and_engine():
+    """
+    Tests that a cached transcript is found only for the engine that produced it.
+    """
+    cache = TranscriptCache(max_entries=10, ttl=60)
+    await cache.set("unique_1", "openai-whisper", "привет")
+
+    assert await cache.get("unique_1", "openai-whisper") == "привет"
+    assert await cache.get("unique_1", "gemini-2.5-flash") is None
+
+
+async def test_cache_evicts_least_recently_used():
+    """
+    Tests that the least recently used entry is evicted when the cache is full.
+    """
+    cache = TranscriptCache(max_entries=2, ttl=60)
+    await cache.set("unique_1", "engine", "first")
+    await cache.set("unique_2", "engine", "second")
+    # Touch the first entry so the second one becomes the oldest
+    await cache.get("unique_1", "engine")
+    await cache.set("unique_3", "engine", "third")
+
+    assert await cache.get("unique_1", "engine") == "first"
+    assert await cache.get("unique_2", "engine") is None
+    assert await cache.get("unique_3", "engine") == "third"
+
+
+async def test_cache_expires_entries_after_ttl():
+    """
+    Tests that entries older than the TTL are not returned.
+    """
+    cache = TranscriptCache(max_entries=10, ttl=0)
+    await cache.set("unique_1", "engine", "stale")
+
+    assert await cache.get("unique_1", "engine") is None
+
+
+async def test_disk_cache_is_encrypted_and_survives_restart(tmp_path):
+    """
+    Tests that the disk tier stores only encrypted data under hashed names
+    and is readable by a new cache instance with the same key.
+    """
+    key = Fernet.generate_key().decode()
+    cache = TranscriptCache(max_entries=10, ttl=60, disk_dir=tmp_path, disk_key=key)
+    await cache.set("unique_1", "engine", "секретный текст")
+
+    [stored] = list(tmp_path.iterdir())
+    assert "unique_1" not in stored.name
+    assert "секретный текст".encode() not in stored.read_bytes()
+
+    restarted = TranscriptCache(max_entries=10, ttl=60, disk_dir=tmp_path, disk_key=key)
+    assert await restarted.get("unique_1", "engine") == "секретный текст"
@@ -0,0 +1,48 @@
+from bot.services.chunking import parse_silences, plan_chunks
+
+SILENCEDETECT_LOG = """
+[silencedetect @ 0x1] silence_start: -0.01
+[silencedetect @ 0x1] silence_end: 1.5 | silence_duration: 1.51
+[silencedetect @ 0x1] silence_start: 298
+[silencedetect @ 0x1] silence_end: 300 | silence_duration: 2
+[silencedetect @ 0x1] silence_start: 610.5
+"""
+
+
+def test_parse_silences_closes_trailing_silence_at_duration():
+    """
+    Tests that silencedetect output is parsed into intervals and a silence
+    without an end lasts until the end of the file.
+    """
+    assert parse_silences(SILENCEDETECT_LOG, 620) == [
+        (0.0, 1.5),
+        (298.0, 300.0),
+        (610.5, 620.0),
+    ]
+
+
+def test_plan_chunks_cuts_in_silence_closest_to_target():
+    """
+    Tests that chunks are cut in the middle of silences near the target length.
+    """
+    silences = [(250.0, 252.0), (298.0, 300.0), (590.0, 594.0)]
+    assert plan_chunks(900, silences, 300) == [
+        (0.0, 299.0),
+        (299.0, 592.0),
+        (592.0, 900.0),
+    ]
+
+
+def test_plan_chunks_hard_cuts_without_silence():
+    """
+    Tests that audio without silences is still split at the maximum chunk length.
+    """
+    chunks = plan_chunks(1000, [], 400)
+    assert chunks == [(0.0, 500.0), (500.0, 1000.0)]
+
+
+def test_plan_chunks_keeps_short_audio_whole():
+    """
+    Tests that audio within the maximum chunk length stays one chunk.
+    """
+    assert plan_chunks(350, [(100.0, 101.0)], 300) == [(0.0, 350.0)]
@@ -0,0 +1,11 @@
+import pytest
+
+from bot.services.user_cache import user_cache
+
+
+@pytest.fixture(autouse=True)
+def clear_user_cache():
+    # Test databases are flushed without signals, cached users would outlive them
+    user_cache.clear()
+    yield
+    user_cache.clear()
@@ -0,0 +1,109 @@
+import pytest
+
+from bot import messages
+from bot.services import delivery
+from bot.services.delivery import message_length, send_transcript, split_transcript
+from bot.services.status import StatusMessage
+from config import settings
+
+
+def test_split_prefers_paragraphs_then_sentences_then_words():
+    """
+    Tests that messages end at the last paragraph, sentence or word
+    that fits, and no message is longer than the limit.
+    """
+    text = "Первый абзац текста.\n\nВторой, длинный абзац. Ещё одно предложение"
+    assert split_transcript(text, 30) == [
+        "Первый абзац текста.",
+        "Второй, длинный абзац.",
+        "Ещё одно предложение",
+    ]
+    assert split_transcript("один два три четыре", 10) == ["один два", "три четыре"]
+    assert split_transcript("a" * 25, 10) == ["a" * 10, "a" * 10, "a" * 5]
+
+
+def test_split_counts_utf16_units():
+    """
+    Tests that characters outside the BMP count twice, like Telegram counts them.
+    """
+    parts = split_transcript("😀" * 10, 8)
+
+    assert parts == ["😀" * 4, "😀" * 4, "😀" * 2]
+    assert all(message_length(part) <= 8 for part in parts)
+
+
+class FakeMessage:
+    message_id = 1
+
+    def __init__(self, sent):
+        self.sent = sent
+
+    async def edit_text(self, text, **kwargs):
+        self.sent.append(("edit", text))
+
+    async def reply(self, text, **kwargs):
+        self.sent.append(("reply", text))
+
+    async def reply_document(self, document, **kwargs):
+        self.sent.append(("document", document.data.decode()))
+
+
+@pytest.mark.asyncio
+async def test_long_transcript_is_split_into_replies(monkeypatch):
+    """
+    Tests that the first part goes into the status message and the rest
+    into replies, in order.
+    """
+    monkeypatch.setattr(settings, "MAX_MESSAGE_LENGTH", 20)
+    monkeypatch.setattr(settings, "TRANSCRIPT_FILE_LENGTH", 0)
+    sent = []
+    transcript = "Первое предложение. Второе предложение. Третье."
+
+    await send_transcript(
+        FakeMessage(sent), StatusMessage(FakeMessage(sent), "Распознаю..."), transcript
+    )
+
+    assert ("edit", "Первое предложение.") in sent
+    assert [part for kind, part in sent if kind == "reply"] == [
+        "Второе предложение.",
+        "Третье.",
+    ]
+
+
+@pytest.mark.asyncio
+async def test_very_long_transcript_is_sent_as_file(monkeypatch):
+    """
+    Tests that past TRANSCRIPT_FILE_LENGTH the whole transcript is sent as
+    a document, with its beginning in the status message.
+    """
+    monkeypatch.setattr(settings, "MAX_MESSAGE_LENGTH", 50)
+    monkeypatch.setattr(settings, "TRANSCRIPT_FILE_LENGTH", 60)
+    sent = []
+    transcript = "Очень длинная встреча. " * 10
+
+    await send_transcript(
+        FakeMessage(sent), StatusMessage(FakeMessage(sent), "Распознаю..."), transcript
+    )
+
+    assert ("document", transcript) in sent
+    [preview] = [text for kind, text in sent if kind == "edit"]
+    assert preview.startswith("Очень длинная встреча.")
+    assert preview.endswith(delivery.FILE_NOTE)
+    assert message_length(preview) <= 50
+    assert not [kind for kind, _ in sent if kind == "reply"]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("transcript", ["", " \n "])
+async def test_empty_transcript_is_answered_with_a_note(transcript):
+    """
+    Tests that an empty transcript is not sent as an empty message, which
+    Telegram rejects, and the user is told no speech was recognized.
+    """
+    sent = []
+
+    await send_transcript(
+        FakeMessage(sent), StatusMessage(FakeMessage(sent), "Распознаю..."), transcript
+    )
+
+    assert sent == [("edit", messages.NO_SPEECH_MESSAGE)]
@@ -1,12 +1,12 @@
-import pytest
-
 from datetime import timedelta
+
+import pytest
 from django.utils import timezone
+
 from bot.models import User
-from bot.services.db import prepare_user_for_transcription, process_user_transcription
+from bot.services.db import prepare_user_for_transcription, reserve_seconds
 from config import settings
 
-
 pytestmark = [pytest.mark.django_db(transaction=True), pytest.mark.asyncio]
 
 
@@ -53,7 +53,7 @@ async def test_prepare_user_does_not_reset_free_seconds_within_30_days():
     assert user.left_free_seconds == 50
 
 
-async def test_process_transcription_exact_free_seconds_usage():
+async def test_reserve_seconds_exact_free_seconds_usage():
     """
     Tests the edge case where the audio duration is exactly equal to the
     user's remaining free seconds.
@@ -65,7 +65,7 @@ async def test_process_transcription_exact_free_seconds_usage():
     )
     audio_duration = 120
 
-    await process_user_transcription(user, audio_duration, transcription_time=10.0)
+    await reserve_seconds(user, audio_duration)
 
     await user.arefresh_from_db()
 
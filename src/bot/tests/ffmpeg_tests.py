@@ -0,0 +1,60 @@
+import shutil
+import tempfile
+
+import pytest
+
+from bot.services import file_processor
+from bot.services.ffmpeg import run_ffmpeg
+
+pytestmark = [
+    pytest.mark.skipif(not shutil.which("ffmpeg"), reason="ffmpeg is not installed"),
+    pytest.mark.asyncio,
+]
+
+
+async def video_note(tmp_path, faststart):
+    """A downloaded MP4 video note, without a path ffmpeg could open."""
+    path = tmp_path / "note.mp4"
+    await run_ffmpeg(
+        [
+            "-f",
+            "lavfi",
+            "-i",
+            "testsrc=size=240x240:rate=10:duration=3",
+            "-f",
+            "lavfi",
+            "-i",
+            "sine=frequency=300:duration=3",
+        ],
+        [
+            "-c:v",
+            "mpeg4",
+            "-c:a",
+            "aac",
+            "-shortest",
+            *(["-movflags", "+faststart"] if faststart else []),
+            "-y",
+            str(path),
+        ],
+    )
+    file = tempfile.TemporaryFile()
+    file.write(path.read_bytes())
+    file.seek(0)
+    return file
+
+
+@pytest.mark.parametrize("faststart", [True, False])
+async def test_video_note_is_converted_with_index_at_either_end(tmp_path, faststart):
+    """
+    Tests that the audio track is extracted from piped MP4, also when it was
+    written without faststart and ffmpeg cannot read it from the pipe.
+    """
+    with await video_note(tmp_path, faststart) as file:
+        audio_file, mime_type = await file_processor.convert_video_to_audio(file)
+
+    with audio_file:
+        audio = audio_file.read()
+    assert mime_type == "audio/aac"
+    # ADTS frames start with a 12 bit sync word
+    assert audio[:2] == b"\xff\xf1"
+    assert len(audio) > 10_000
@@ -0,0 +1,114 @@
+import pytest
+from prometheus_client import REGISTRY
+
+from bot.services import health
+from bot.services.health import CircuitState, EngineHealth
+from config import settings
+
+
+@pytest.fixture(autouse=True)
+def breaker_settings(monkeypatch):
+    monkeypatch.setattr(settings, "BREAKER_FAILURE_THRESHOLD", 3)
+    monkeypatch.setattr(settings, "BREAKER_MAX_ERROR_RATE", 0.5)
+    monkeypatch.setattr(settings, "BREAKER_MAX_LATENCY_PER_SECOND", 0)
+    monkeypatch.setattr(settings, "BREAKER_MIN_SAMPLES", 10)
+    monkeypatch.setattr(settings, "BREAKER_EWMA_ALPHA", 0.2)
+    monkeypatch.setattr(settings, "BREAKER_PROBE_RATIO", 0.05)
+
+
+def test_breaker_opens_after_consecutive_failures():
+    """
+    Tests that the circuit opens after the configured number of failures in a row.
+    """
+    engine = EngineHealth("engine")
+    engine.record_failure()
+    engine.record_failure()
+    assert engine.state == CircuitState.CLOSED
+
+    engine.record_failure()
+    assert engine.state == CircuitState.OPEN
+
+
+def test_open_breaker_lets_through_only_probes(monkeypatch):
+    """
+    Tests that an open circuit only admits the probe share of jobs.
+    """
+    engine = EngineHealth("engine")
+    for _ in range(3):
+        engine.record_failure()
+
+    monkeypatch.setattr(health.random, "random", lambda: 0.5)
+    assert engine.allow_request() is False
+    monkeypatch.setattr(health.random, "random", lambda: 0.01)
+    assert engine.allow_request() is True
+
+
+def test_successful_probe_closes_breaker():
+    """
+    Tests that a success on an open circuit closes it again.
+    """
+    engine = EngineHealth("engine")
+    for _ in range(3):
+        engine.record_failure()
+
+    engine.record_success(latency=2.0, duration=10)
+
+    assert engine.state == CircuitState.CLOSED
+    assert engine.consecutive_failures == 0
+
+
+def test_breaker_opens_on_high_latency(monkeypatch):
+    """
+    Tests that a slow engine is opened by the latency EWMA without failures.
+    """
+    monkeypatch.setattr(settings, "BREAKER_MAX_LATENCY_PER_SECOND", 1.0)
+    engine = EngineHealth("engine")
+    for _ in range(9):
+        engine.record_success(latency=5.0, duration=10)
+    assert engine.state == CircuitState.CLOSED
+
+    engine.record_success(latency=40.0, duration=10)
+    assert engine.state == CircuitState.OPEN
+
+
+def test_circuit_state_is_published_for_other_processes():
+    """
+    Tests that the state of the circuit is kept in a gauge, which the bot
+    process serves for its workers too.
+    """
+
+    def circuit_open():
+        return REGISTRY.get_sample_value(
+            "transcription_circuit_open", {"engine": "published"}
+        )
+
+    engine = EngineHealth("published")
+    for _ in range(3):
+        engine.record_failure()
+    assert circuit_open() == 1
+
+    engine.record_success(1, 10)
+    assert circuit_open() == 0
+
+
+@pytest.mark.asyncio
+async def test_model_command_hides_state_of_the_bot_process_with_workers(monkeypatch):
+    """
+    Tests that /model does not show the breakers of the bot process, which
+    does not transcribe when workers are running.
+    """
+    from bot.handlers.util import model
+
+    class FakeMessage:
+        async def reply(self, text, **kwargs):
+            self.text = text
+
+    message = FakeMessage()
+    monkeypatch.setattr(settings, "JOB_WORKERS", 2)
+    await model(message)
+    assert "closed" not in message.text
+    assert "transcription_circuit_open" in message.text
+
+    monkeypatch.setattr(settings, "JOB_WORKERS", 0)
+    await model(message)
+    assert f"{settings.TRANSCRIPTION_ENGINE}: " in message.text
@@ -0,0 +1,144 @@
+import asyncio
+import io
+
+import pytest
+
+from bot.services import hedging
+from bot.services.hedging import LatencyTracker, hedged_transcribe
+from config import settings
+
+pytestmark = [pytest.mark.asyncio]
+
+
+class FakeEngine:
+    supports_streaming = False
+
+    def __init__(self, delay, transcript="text", error=None):
+        self.delay = delay
+        self.transcript = transcript
+        self.error = error
+        self.calls = 0
+        self.cancelled = False
+
+    async def transcribe(self, file_data, mime_type):
+        self.calls += 1
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+        if self.error:
+            raise self.error
+        return self.transcript
+
+
+class FakeStreamingEngine(FakeEngine):
+    supports_streaming = True
+
+    async def transcribe_stream(self, file_data, mime_type):
+        self.calls += 1
+        for word in self.transcript.split():
+            await asyncio.sleep(self.delay)
+            yield word + " "
+
+
+async def open_copy(audio_file):
+    return io.BytesIO(audio_file.getvalue())
+
+
+@pytest.fixture(autouse=True)
+def fresh_tracker(monkeypatch):
+    monkeypatch.setattr(hedging, "latency_tracker", LatencyTracker())
+    monkeypatch.setattr(settings, "HEDGE_DEFAULT_DELAY_SECONDS", 0.05)
+
+
+async def test_fast_primary_is_not_hedged():
+    """
+    Tests that the fallback engine is not called when the primary answers in time.
+    """
+    primary, fallback = FakeEngine(0), FakeEngine(0, "fallback")
+    transcript = await hedged_transcribe(
+        ("primary", primary),
+        ("fallback", fallback),
+        io.BytesIO(b"a"),
+        "audio/ogg",
+        5,
+        open_copy,
+    )
+    assert transcript == "text"
+    assert fallback.calls == 0
+
+
+async def test_slow_primary_loses_to_fallback_and_is_cancelled():
+    """
+    Tests that a slow primary is hedged, the fallback result wins and
+    the primary request is cancelled.
+    """
+    primary, fallback = FakeEngine(10), FakeEngine(0, "fallback")
+    transcript = await hedged_transcribe(
+        ("primary", primary),
+        ("fallback", fallback),
+        io.BytesIO(b"a"),
+        "audio/ogg",
+        5,
+        open_copy,
+    )
+    assert transcript == "fallback"
+    assert primary.cancelled
+
+
+async def test_hedge_waits_for_other_engine_when_one_fails():
+    """
+    Tests that a failed fallback does not fail the job while the primary may still succeed.
+    """
+    primary = FakeEngine(0.1, "primary")
+    fallback = FakeEngine(0, error=RuntimeError("fallback is down"))
+    transcript = await hedged_transcribe(
+        ("primary", primary),
+        ("fallback", fallback),
+        io.BytesIO(b"a"),
+        "audio/ogg",
+        5,
+        open_copy,
+    )
+    assert transcript == "primary"
+
+
+async def test_hedge_delay_uses_latency_percentile_per_duration_bucket(monkeypatch):
+    """
+    Tests that the hedge delay follows recorded latencies of similar audio durations.
+    """
+    monkeypatch.setattr(settings, "HEDGE_MIN_SAMPLES", 10)
+    monkeypatch.setattr(settings, "HEDGE_PERCENTILE", 0.9)
+    for latency in range(1, 11):
+        hedging.latency_tracker.record("primary", 40, float(latency))
+
+    assert hedging.hedge_delay("primary", 50) == 10.0
+    # 5 seconds of audio is in another bucket without samples
+    assert hedging.hedge_delay("primary", 5) == settings.HEDGE_DEFAULT_DELAY_SECONDS
+
+
+async def test_streaming_primary_reports_partials_and_is_not_hedged():
+    """
+    Tests that a primary engine already streaming text is not hedged even
+    when the whole transcript takes longer than the hedge delay.
+    """
+    primary = FakeStreamingEngine(0.03, "раз два три")
+    fallback = FakeEngine(0, "fallback")
+    partials = []
+
+    async def on_partial(text):
+        partials.append(text)
+
+    transcript = await hedged_transcribe(
+        ("primary", primary),
+        ("fallback", fallback),
+        io.BytesIO(b"a"),
+        "audio/ogg",
+        5,
+        open_copy,
+        on_partial,
+    )
+    assert transcript == "раз два три "
+    assert partials == ["раз ", "раз два ", "раз два три "]
+    assert fallback.calls == 0
@@ -0,0 +1,50 @@
+from datetime import UTC, datetime
+
+import pytest
+from django.core.management import call_command
+
+from bot.models import Job, QuotaReservation, User
+from config import settings
+
+pytestmark = [
+    pytest.mark.skipif(
+        not settings.POSTGRES_HOST, reason="imports from SQLite into PostgreSQL"
+    ),
+    pytest.mark.django_db(transaction=True, databases=["default", "sqlite"]),
+]
+
+
+def test_import_keeps_ids_timestamps_and_queued_jobs():
+    """
+    Tests that rows are copied with their ids and timestamps, queued jobs
+    included, and rows created afterwards get ids past the imported ones.
+    """
+    created_at = datetime(2024, 1, 1, tzinfo=UTC)
+    user = User.objects.using("sqlite").create(
+        pk=100, hashed_user_id="imported", left_free_seconds=90
+    )
+    QuotaReservation.objects.using("sqlite").create(pk=200, user=user, free_seconds=10)
+    Job.objects.using("sqlite").create(
+        pk=300,
+        priority=0,
+        hashed_user_id="imported",
+        source_chat_id=1,
+        source_message_id=1,
+        chat_id=1,
+        chat_type="private",
+        message_id=1,
+        file_type="voice",
+        file_duration=10,
+        file_id="file",
+    )
+    User.objects.using("sqlite").update(created_at=created_at)
+
+    call_command("import_sqlite")
+
+    imported = User.objects.get(pk=100)
+    assert (imported.left_free_seconds, imported.created_at) == (90, created_at)
+    assert QuotaReservation.objects.get(pk=200).user_id == 100
+    assert Job.objects.get(pk=300).status == Job.Status.QUEUED
+
+    assert User.objects.create(hashed_user_id="new").pk > 100
+    assert QuotaReservation.objects.create(user=imported).pk > 200
@@ -0,0 +1,358 @@
+import asyncio
+import itertools
+
+import pytest
+from aiogram.types import Message
+
+from bot.models import Job, QuotaReservation, User
+from bot.services import db, file_processor, job_queue
+from bot.services.scheduler import Priority
+from config import settings
+
+pytestmark = [pytest.mark.django_db(transaction=True), pytest.mark.asyncio]
+
+
+def make_message(message_id=1, user_id=1):
+    return Message.model_validate(
+        {
+            "message_id": message_id,
+            "date": 0,
+            "chat": {"id": user_id, "type": "private", "username": "ivan_test"},
+            "from": {
+                "id": user_id,
+                "is_bot": False,
+                "first_name": "Иван",
+                "last_name": "Тестов",
+                "username": "ivan_test",
+            },
+            "caption": "Личное голосовое",
+            "voice": {
+                "file_id": "file",
+                "file_unique_id": "unique",
+                "duration": 10,
+                "mime_type": "audio/ogg",
+            },
+        }
+    )
+
+
+message_ids = itertools.count(1000)
+
+
+async def enqueue(priority, user, message_id=None):
+    message_id = message_id or next(message_ids)
+    return await job_queue.enqueue(
+        priority,
+        make_message(message_id),
+        user,
+        "voice",
+        10,
+        "file",
+        "audio/ogg",
+        "unique",
+    )
+
+
+async def test_claim_order_is_priority_then_users_with_fewer_running_jobs():
+    """
+    Tests that workers take high priority jobs first and, within a tier,
+    prefer users who have no job running yet.
+    """
+    await enqueue(Priority.LOW, "low")
+    first = await enqueue(Priority.NORMAL, "busy")
+    second = await enqueue(Priority.NORMAL, "busy")
+    other = await enqueue(Priority.NORMAL, "other")
+    await enqueue(Priority.HIGH, "high")
+
+    claimed = [await job_queue.claim_job("worker") for _ in range(4)]
+
+    assert [job.hashed_user_id for job in claimed] == ["high", "busy", "other", "busy"]
+    assert [job.pk for job in claimed[1:]] == [first.pk, other.pk, second.pk]
+    assert all(job.status == Job.Status.RUNNING for job in claimed)
+
+
+async def test_concurrent_workers_never_claim_one_job_twice():
+    """
+    Tests that racing workers each get a different job.
+    """
+    for number in range(3):
+        await enqueue(Priority.NORMAL, f"user{number}", number)
+
+    claimed = await asyncio.gather(
+        *(job_queue.claim_job(f"worker{n}") for n in range(5))
+    )
+
+    pks = [job.pk for job in claimed if job]
+    assert len(pks) == 3
+    assert len(set(pks)) == 3
+
+
+async def test_run_job_replays_message_and_records_result(monkeypatch):
+    """
+    Tests that a worker rebuilds the message bound to the bot, passes the
+    stored file to handle_file and marks the job done or failed.
+    """
+    calls = []
+
+    async def handle_file(message, hashed_user_id, *args, job):
+        calls.append(
+            (message.chat.id, message.message_id, message.bot, hashed_user_id, args)
+        )
+        if hashed_user_id == "broken":
+            raise RuntimeError("boom")
+
+    monkeypatch.setattr(file_processor, "handle_file", handle_file)
+    job = await enqueue(Priority.HIGH, "user", message_id=42)
+    broken = await enqueue(Priority.HIGH, "broken")
+
+    await job_queue.run_job(job)
+    await job_queue.run_job(broken)
+
+    chat_id, message_id, bot, hashed_user_id, args = calls[0]
+    assert (chat_id, message_id, hashed_user_id) == (1, 42, "user")
+    assert bot is not None
+    assert args == ("voice", 10, "file", "audio/ogg", "unique")
+    await job.arefresh_from_db()
+    await broken.arefresh_from_db()
+    assert job.status == Job.Status.DONE
+    assert broken.status == Job.Status.FAILED
+
+
+async def test_finished_job_keeps_no_user_data(monkeypatch):
+    """
+    Tests that no names, usernames, captions or file ids are left of a
+    finished job, and that it is deleted after JOB_RETENTION_SECONDS.
+    """
+
+    async def handle_file(message, hashed_user_id, *args, job):
+        pass
+
+    monkeypatch.setattr(file_processor, "handle_file", handle_file)
+    job = await enqueue(Priority.HIGH, "user")
+    await job_queue.run_job(job)
+
+    stored = await Job.objects.filter(pk=job.pk).values().aget()
+    values = " ".join(str(value) for value in stored.values())
+    for personal in ("Иван", "Тестов", "ivan_test", "Личное", "file", "unique"):
+        assert personal not in values
+    assert stored["status"] == Job.Status.DONE
+
+    monkeypatch.setattr(settings, "JOB_RETENTION_SECONDS", 0)
+    assert await job_queue.purge_finished_jobs() == 1
+    assert not await Job.objects.aexists()
+
+
+async def test_submit_job_queues_when_workers_are_configured(monkeypatch):
+    """
+    Tests that the intake process only stores the job when workers run transcriptions.
+    """
+    monkeypatch.setattr(settings, "JOB_WORKERS", 2)
+
+    await file_processor.submit_job(
+        Priority.HIGH,
+        make_message(),
+        "user",
+        "voice",
+        10,
+        "file",
+        "audio/ogg",
+        "unique",
+    )
+
+    job = await Job.objects.aget()
+    assert job.status == Job.Status.QUEUED
+    assert job.file_id == "file"
+
+
+async def test_message_delivered_twice_is_queued_once(monkeypatch):
+    """
+    Tests that an update Telegram delivers again, before or after its job
+    finished, gets the existing job and is not transcribed twice.
+    """
+    calls = []
+
+    async def handle_file(message, hashed_user_id, *args, job):
+        calls.append(job.pk)
+
+    monkeypatch.setattr(file_processor, "handle_file", handle_file)
+    first = await enqueue(Priority.HIGH, "user", message_id=5)
+    second = await enqueue(Priority.HIGH, "user", message_id=5)
+    assert first.pk == second.pk
+    assert await Job.objects.acount() == 1
+
+    for _ in range(2):
+        await file_processor.submit_job(
+            Priority.HIGH, make_message(5), "user", "voice", 10, "file", "audio/ogg"
+        )
+    assert calls == [first.pk]
+
+
+async def test_submit_job_persists_and_runs_in_process(monkeypatch):
+    """
+    Tests that without workers the job is stored and run by the bot process.
+    """
+    calls = []
+
+    async def handle_file(message, hashed_user_id, *args, job):
+        calls.append(job.status)
+
+    monkeypatch.setattr(file_processor, "handle_file", handle_file)
+    await file_processor.submit_job(
+        Priority.HIGH, make_message(7, 3), "user", "voice", 10, "file", "audio/ogg"
+    )
+
+    job = await Job.objects.aget()
+    assert calls == [Job.Status.RUNNING]
+    assert (job.status, job.chat_id, job.message_id) == (Job.Status.DONE, 3, 7)
+
+
+async def test_drain_cancels_late_jobs_and_requeues_them(monkeypatch):
+    """
+    Tests that shutdown waits for quick jobs, while jobs still running at the
+    deadline go back to the queue with their seconds refunded.
+    """
+    user = await User.objects.acreate(hashed_user_id="slow", left_free_seconds=100)
+
+    async def handle_file(message, hashed_user_id, *args, job):
+        reservation = await db.reserve_seconds(user, 10)
+        await job_queue.save_progress(job, reservation=reservation)
+        await asyncio.sleep(0 if hashed_user_id == "quick" else 10)
+
+    monkeypatch.setattr(file_processor, "handle_file", handle_file)
+    await enqueue(Priority.HIGH, "quick")
+    await enqueue(Priority.NORMAL, "slow")
+    runner = job_queue.JobRunner("worker")
+    quick, slow = [runner.start(await job_queue.claim_job("worker")) for _ in range(2)]
+    await asyncio.sleep(0.05)
+
+    await runner.drain(0.1)
+
+    assert quick.done() and slow.cancelled()
+    jobs = [job async for job in Job.objects.order_by("priority")]
+    assert [job.status for job in jobs] == [Job.Status.DONE, Job.Status.QUEUED]
+    assert (jobs[1].worker, jobs[1].reservation_id) == ("", None)
+    await user.arefresh_from_db()
+    assert user.left_free_seconds == 90
+    assert await job_queue.claim(jobs[1], "worker") is True
+
+
+async def test_draining_runner_leaves_new_jobs_queued():
+    """
+    Tests that jobs reaching the runner after shutdown began stay in the queue.
+    """
+    job = await enqueue(Priority.HIGH, "user")
+    await job_queue.job_runner.drain(0)
+    try:
+        await job_queue.job_runner.execute(job)
+    finally:
+        job_queue.job_runner.draining = False
+
+    await job.arefresh_from_db()
+    assert job.status == Job.Status.QUEUED
+
+
+async def test_requeue_running_returns_jobs_of_killed_worker():
+    """
+    Tests that jobs left running by a killed process and its pool workers are
+    queued again with their reservations refunded, other hosts are untouched.
+    """
+    user = await User.objects.acreate(hashed_user_id="user", left_free_seconds=100)
+    reservation = await db.reserve_seconds(user, 30)
+    for worker in ("host", "host/1", "other/0"):
+        job = await enqueue(Priority.HIGH, "user")
+        await Job.objects.filter(pk=job.pk).aupdate(
+            status=Job.Status.RUNNING, worker=worker, reservation=reservation
+        )
+
+    assert await job_queue.requeue_running("host") == 2
+
+    statuses = [job.status async for job in Job.objects.order_by("pk")]
+    assert statuses == [Job.Status.QUEUED, Job.Status.QUEUED, Job.Status.RUNNING]
+    await reservation.arefresh_from_db()
+    assert reservation.status == QuotaReservation.Status.REFUNDED
+    await user.arefresh_from_db()
+    assert user.left_free_seconds == 100
+
+
+async def test_resumed_job_edits_its_status_message(monkeypatch):
+    """
+    Tests that a job resumed after a restart keeps using the status message
+    it sent before instead of replying again.
+    """
+    edited = []
+
+    async def edit_text(self, text, **kwargs):
+        edited.append((self.chat.id, self.message_id, text))
+
+    async def reply(self, text, **kwargs):
+        raise AssertionError("replied again")
+
+    monkeypatch.setattr(Message, "edit_text", edit_text)
+    monkeypatch.setattr(Message, "reply", reply)
+    job = await enqueue(Priority.HIGH, "user")
+    await job_queue.save_progress(job, status_message_id=99)
+
+    msg = await file_processor.reply_status(
+        make_message(user_id=5).as_(file_processor.bot), job
+    )
+
+    assert msg.message_id == 99
+    assert edited == [(5, 99, "Продолжаю после перезапуска...")]
+
+
+def make_group_message(message_id=1):
+    message = make_message(message_id, user_id=7).model_dump()
+    message["chat"] = {"id": -100, "type": "supergroup", "title": "Группа"}
+    return Message.model_validate(message)
+
+
+async def test_forwarded_message_delivered_twice_is_forwarded_once(monkeypatch):
+    """
+    Tests that a group message Telegram delivers again is not forwarded to the
+    admin a second time, and that its job replies to the forwarded copy.
+    """
+    from bot.handlers.forward import forward_and_transcribe
+
+    forwarded = []
+
+    async def forward(self, chat_id, **kwargs):
+        if not forwarded:
+            forwarded.append(None)
+            raise RuntimeError("Telegram is down")
+        forwarded.append(chat_id)
+        return make_message(500 + len(forwarded), user_id=chat_id)
+
+    async def reply(self, text, **kwargs):
+        pass
+
+    monkeypatch.setattr(Message, "forward", forward)
+    monkeypatch.setattr(Message, "reply", reply)
+    monkeypatch.setattr(settings, "ADMIN_ID", 9)
+    monkeypatch.setattr(settings, "JOB_WORKERS", 1)
+    args = ("voice", 10, "file", "audio/ogg", "unique")
+
+    # Not forwarded, nothing is kept so the next delivery tries again
+    await forward_and_transcribe(make_group_message(), *args)
+    assert not await Job.objects.aexists()
+
+    for _ in range(2):
+        await forward_and_transcribe(make_group_message(), *args)
+
+    assert forwarded == [None, 9]
+    job = await Job.objects.aget()
+    assert (job.source_chat_id, job.source_message_id) == (-100, 1)
+    assert (job.chat_id, job.message_id, job.status) == (9, 502, Job.Status.QUEUED)
+
+
+async def test_held_job_is_not_claimed():
+    """
+    Tests that workers leave a job alone until it is released.
+    """
+    job = await job_queue.hold(
+        Priority.HIGH, make_message(), "user", "voice", 10, "file", "audio/ogg"
+    )
+    assert await job_queue.claim_job("worker") is None
+
+    await job_queue.release(job, make_message(8, user_id=9))
+    claimed = await job_queue.claim_job("worker")
+    assert (claimed.pk, claimed.chat_id, claimed.message_id) == (job.pk, 9, 8)
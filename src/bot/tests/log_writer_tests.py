@@ -0,0 +1,115 @@
+import asyncio
+
+import pytest
+
+from bot.models import QuotaReservation, Transcription, User
+from bot.services import db
+from bot.services.db import reserve_seconds
+from bot.services.log_writer import TranscriptionLogWriter
+
+pytestmark = [pytest.mark.django_db(transaction=True), pytest.mark.asyncio]
+
+
+async def test_logs_are_written_in_batches_with_reservations():
+    """
+    Tests that logs are held until the batch is full and then written
+    together with their reservation commits.
+    """
+    user = await User.objects.acreate(
+        hashed_user_id="test_user_batch", left_free_seconds=100
+    )
+    writer = TranscriptionLogWriter(batch_size=3, flush_interval=60, max_pending=100)
+    await writer.start()
+    try:
+        reservations = [await reserve_seconds(user, 10) for _ in range(3)]
+        for reservation in reservations[:2]:
+            await writer.add(user.id, 10, 1.0, reservation)
+        await asyncio.sleep(0.05)
+        assert await Transcription.objects.acount() == 0
+
+        await writer.add(user.id, 10, 1.0, reservations[2])
+        await asyncio.sleep(0.05)
+        assert await Transcription.objects.acount() == 3
+        assert (
+            await QuotaReservation.objects.filter(
+                status=QuotaReservation.Status.COMMITTED
+            ).acount()
+            == 3
+        )
+    finally:
+        await writer.close()
+
+
+async def test_close_flushes_pending_logs():
+    """
+    Tests that logs still buffered at shutdown are written.
+    """
+    user = await User.objects.acreate(hashed_user_id="test_user_shutdown")
+    writer = TranscriptionLogWriter(batch_size=10, flush_interval=60, max_pending=100)
+    await writer.start()
+    await writer.add(user.id, 10, -1)
+    await writer.close()
+
+    assert await Transcription.objects.acount() == 1
+    assert len(writer) == 0
+
+
+async def test_add_waits_while_database_falls_behind(monkeypatch):
+    """
+    Tests that new logs wait once max_pending logs are unwritten and
+    proceed after a successful flush.
+    """
+    user = await User.objects.acreate(hashed_user_id="test_user_backpressure")
+    writer = TranscriptionLogWriter(batch_size=10, flush_interval=60, max_pending=2)
+    await writer.start()
+    commit_reservations = db.commit_reservations
+
+    async def failing_commit(entries):
+        raise RuntimeError("database is locked")
+
+    monkeypatch.setattr(db, "commit_reservations", failing_commit)
+    try:
+        await writer.add(user.id, 10, 1.0)
+        await writer.add(user.id, 10, 1.0)
+        blocked = asyncio.create_task(writer.add(user.id, 10, 1.0))
+        await asyncio.sleep(0.05)
+        assert not blocked.done()
+
+        monkeypatch.setattr(db, "commit_reservations", commit_reservations)
+        await writer.flush()
+        await asyncio.wait_for(blocked, 1)
+    finally:
+        await writer.close()
+
+    assert await Transcription.objects.acount() == 3
+
+
+async def test_refunded_job_is_not_logged_by_a_later_flush(monkeypatch):
+    """
+    Tests that a log whose write failed, so that the job was refunded and
+    logged as failed, is not written again by the next successful flush.
+    """
+    user = await User.objects.acreate(
+        hashed_user_id="test_user_refund", left_free_seconds=100
+    )
+    reservation = await reserve_seconds(user, 10)
+    writer = TranscriptionLogWriter(batch_size=10, flush_interval=60, max_pending=100)
+    commit_reservations = db.commit_reservations
+
+    async def unavailable(entries):
+        raise ConnectionError("database is down")
+
+    monkeypatch.setattr(db, "commit_reservations", unavailable)
+    with pytest.raises(ConnectionError):
+        await writer.add(user.id, 10, 1.0, reservation)
+    await db.refund_reservation(reservation, 10)
+
+    monkeypatch.setattr(db, "commit_reservations", commit_reservations)
+    await writer.flush()
+
+    assert len(writer) == 0
+    assert await Transcription.objects.acount() == 1
+    await reservation.arefresh_from_db()
+    assert reservation.status == QuotaReservation.Status.REFUNDED
+    await user.arefresh_from_db()
+    assert user.left_free_seconds == 100
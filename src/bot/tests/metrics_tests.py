@@ -0,0 +1,225 @@
+import io
+import os
+import subprocess
+import sys
+
+import pytest
+from aiohttp.test_utils import TestClient, TestServer
+from prometheus_client import REGISTRY
+
+from bot.models import Job
+from bot.services import metrics
+from bot.services.hedging import timed_transcribe
+from bot.services.scheduler import Priority
+from config import settings
+
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+def test_stage_timer_observes_every_step():
+    """
+    Tests that each step is observed once, when the next one starts or the job ends.
+    """
+    before = sample("transcription_stage_seconds_count", stage="DOWNLOAD", engine="")
+    timer = metrics.StageTimer()
+    timer.enter("DOWNLOAD")
+    timer.enter("TRANSCRIBE")
+    assert (
+        sample("transcription_stage_seconds_count", stage="DOWNLOAD", engine="")
+        == before + 1
+    )
+
+    before = sample("transcription_stage_seconds_count", stage="TRANSCRIBE", engine="")
+    timer.finish()
+    timer.finish()
+    assert (
+        sample("transcription_stage_seconds_count", stage="TRANSCRIBE", engine="")
+        == before + 1
+    )
+
+
+class WorkingEngine:
+    supports_streaming = False
+
+    async def transcribe(self, file_data, mime_type):
+        return "text"
+
+
+@pytest.mark.asyncio
+async def test_transcribe_step_is_labelled_with_the_engine_that_answered():
+    """
+    Tests that the transcribe step is observed under the engine that returned
+    the transcript, and that later steps are not.
+    """
+    labels = {"stage": "TRANSCRIBE", "engine": "metrics-fallback"}
+    before = sample("transcription_stage_seconds_count", **labels)
+    timer = metrics.StageTimer()
+    token = metrics.current_stages.set(timer)
+    try:
+        timer.enter("TRANSCRIBE")
+        with pytest.raises(TimeoutError):
+            await timed_transcribe(
+                "metrics-primary", FailingEngine(), io.BytesIO(b""), "audio/ogg", 10
+            )
+        await timed_transcribe(
+            "metrics-fallback", WorkingEngine(), io.BytesIO(b""), "audio/ogg", 10
+        )
+        timer.enter("SENDING")
+        timer.finish()
+    finally:
+        metrics.current_stages.reset(token)
+
+    assert sample("transcription_stage_seconds_count", **labels) == before + 1
+    assert not sample(
+        "transcription_stage_seconds_count", stage="SENDING", engine="metrics-fallback"
+    )
+
+
+class FailingEngine:
+    supports_streaming = False
+
+    async def transcribe(self, file_data, mime_type):
+        raise TimeoutError("provider timed out")
+
+
+@pytest.mark.asyncio
+async def test_engine_errors_are_counted_by_type():
+    """
+    Tests that failed engine requests are counted per engine and exception type.
+    """
+    before = sample(
+        "transcription_engine_errors_total", engine="metrics-test", type="TimeoutError"
+    )
+    with pytest.raises(TimeoutError):
+        await timed_transcribe(
+            "metrics-test", FailingEngine(), io.BytesIO(b""), "audio/ogg", 10
+        )
+    assert (
+        sample(
+            "transcription_engine_errors_total",
+            engine="metrics-test",
+            type="TimeoutError",
+        )
+        == before + 1
+    )
+
+
+async def create_job(message_id, **fields):
+    return await Job.objects.acreate(
+        hashed_user_id="user",
+        source_chat_id=1,
+        source_message_id=message_id,
+        chat_id=1,
+        chat_type="private",
+        message_id=message_id,
+        file_type="voice",
+        file_duration=10,
+        file_id="file",
+        **fields,
+    )
+
+
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.asyncio
+async def test_metrics_endpoint_reports_queue_depth():
+    """
+    Tests that /metrics serves the metrics with queued and running jobs
+    counted from the Job table.
+    """
+    await create_job(1, priority=Priority.HIGH)
+    await create_job(2, priority=Priority.LOW)
+    await create_job(3, priority=Priority.LOW, status=Job.Status.RUNNING)
+    await create_job(4, priority=Priority.LOW, status=Job.Status.DONE)
+
+    async with TestClient(TestServer(metrics.metrics_app())) as client:
+        response = await client.get("/metrics")
+        body = await response.text()
+
+    assert response.status == 200
+    assert 'transcription_jobs_queued{priority="HIGH"} 1.0' in body
+    assert 'transcription_jobs_queued{priority="NORMAL"} 0.0' in body
+    assert "transcription_jobs_in_flight 1.0" in body
+    assert "# TYPE transcription_stage_seconds histogram" in body
+
+
+class FakeMessage:
+    def __init__(self):
+        self.replies = []
+
+    async def reply(self, text, **kwargs):
+        self.replies.append(text)
+
+
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.asyncio
+async def test_queue_command_counts_jobs_of_all_workers(monkeypatch):
+    """
+    Tests that /queue reports the jobs in the Job table when workers run
+    them, not the empty scheduler of the bot process.
+    """
+    from bot.handlers.util import queue
+
+    monkeypatch.setattr(settings, "JOB_WORKERS", 2)
+    await create_job(1, priority=Priority.NORMAL)
+    await create_job(2, priority=Priority.HIGH, status=Job.Status.RUNNING)
+
+    message = FakeMessage()
+    await queue(message)
+
+    max_in_flight = 2 * settings.SCHEDULER_MAX_IN_FLIGHT
+    assert message.replies == [
+        f"В работе: 1/{max_in_flight}\nВ очереди: HIGH 0, NORMAL 1, LOW 0"
+    ]
+
+
+# prepare_bot in a process of its own, prometheus_client picks the
+# multiprocess mode on import
+PREPARE_BOT = """
+import asyncio, os
+import config.settings
+config.settings.DATABASES["default"]["NAME"] = os.environ["TEST_DATABASE"]
+import django
+django.setup()
+from django.core.management import call_command
+call_command("migrate", verbosity=0)
+from bot.bot_init import prepare_bot
+from bot.services import metrics
+asyncio.run(prepare_bot())
+asyncio.run(metrics.update_job_gauges())
+print(metrics.render().decode())
+"""
+
+
+def test_multiprocess_gauges_are_served_after_prepare_bot(tmp_path):
+    """
+    Tests that clearing the metrics of the previous run at start keeps the
+    files the bot process already writes its own metrics to.
+    """
+    metrics_dir = tmp_path / "metrics"
+    metrics_dir.mkdir()
+    (metrics_dir / "counter_1.db").write_bytes(b"")
+    env = {
+        **os.environ,
+        "DJANGO_SETTINGS_MODULE": "config.settings",
+        "PROMETHEUS_MULTIPROC_DIR": str(metrics_dir),
+        "METRICS_PORT": "9100",
+        "TEST_DATABASE": str(tmp_path / "db.sqlite3"),
+    }
+    env.pop("POSTGRES_HOST", None)
+
+    result = subprocess.run(
+        [sys.executable, "-c", PREPARE_BOT],
+        cwd=settings.BASE_DIR,
+        env=env,
+        capture_output=True,
+        check=False,
+        text=True,
+        timeout=60,
+    )
+
+    assert result.returncode == 0, result.stderr
+    assert "transcription_jobs_in_flight 0.0" in result.stdout
+    assert 'transcription_jobs_queued{priority="HIGH"} 0.0' in result.stdout
+    assert not (metrics_dir / "counter_1.db").exists()
@@ -0,0 +1,75 @@
+import io
+import shutil
+
+import pytest
+
+from bot.services.ffmpeg import run_ffmpeg
+from bot.services.normalize import normalize_audio, should_normalize, tempo_for
+from config import settings
+
+
+def audio(size):
+    return io.BytesIO(b"\0" * size)
+
+
+def test_large_audio_is_normalized_and_compact_voice_is_not():
+    """
+    Tests that only audio well above the target bitrate is re-encoded and
+    voice OGG is left alone.
+    """
+    # 10 seconds of 16-bit 44.1 kHz stereo WAV
+    assert should_normalize(audio(1_764_000), "audio/wav", 10)
+    assert not should_normalize(audio(40_000), "audio/mpeg", 10)
+    assert not should_normalize(audio(1_764_000), "audio/ogg", 10)
+    assert not should_normalize(audio(1_764_000), "audio/wav", 0)
+
+
+def test_long_audio_is_sped_up(monkeypatch):
+    """
+    Tests that the tempo factor applies from NORMALIZE_TEMPO_MIN_SECONDS on,
+    even to compact voice OGG.
+    """
+    monkeypatch.setattr(settings, "NORMALIZE_TEMPO", 1.5)
+    monkeypatch.setattr(settings, "NORMALIZE_TEMPO_MIN_SECONDS", 300)
+
+    assert tempo_for(299) == 1.0
+    assert tempo_for(300) == 1.5
+    assert should_normalize(audio(600_000), "audio/ogg", 600)
+
+
+def test_disabled_normalization(monkeypatch):
+    """
+    Tests that nothing is re-encoded with NORMALIZE_ENABLED off.
+    """
+    monkeypatch.setattr(settings, "NORMALIZE_ENABLED", False)
+    assert not should_normalize(audio(1_764_000), "audio/wav", 10)
+
+
+@pytest.mark.skipif(not shutil.which("ffmpeg"), reason="ffmpeg is not installed")
+@pytest.mark.asyncio
+async def test_normalize_audio_shrinks_wav_and_shortens_sped_up_audio(monkeypatch):
+    """
+    Tests that stereo WAV becomes much smaller Opus and the duration of
+    sped up audio is divided by the tempo.
+    """
+    wav = await run_ffmpeg(
+        ["-f", "lavfi", "-i", "sine=frequency=440:duration=10"],
+        ["-ac", "2", "-ar", "44100", "-f", "wav", "-"],
+    )
+    wav_size = len(wav.read())
+    wav.seek(0)
+
+    normalized, mime_type, duration = await normalize_audio(wav, "audio/wav", 10)
+    with normalized:
+        assert mime_type == "audio/ogg"
+        assert duration == 10
+        assert len(normalized.read()) * 10 < wav_size
+
+    monkeypatch.setattr(settings, "NORMALIZE_TEMPO", 2.0)
+    monkeypatch.setattr(settings, "NORMALIZE_TEMPO_MIN_SECONDS", 0)
+    wav = await run_ffmpeg(
+        ["-f", "lavfi", "-i", "sine=frequency=440:duration=10"], ["-f", "wav", "-"]
+    )
+    normalized, _, duration = await normalize_audio(wav, "audio/wav", 10)
+    normalized.close()
+    assert duration == 5
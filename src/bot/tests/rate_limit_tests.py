@@ -0,0 +1,152 @@
+import asyncio
+import time
+
+import pytest
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import EditMessageText, SendMessage
+
+from bot.bot_init import rate_limiter
+from bot.services import job_queue
+from bot.services.rate_limit import SendPriority, TelegramRateLimiter, send_priority
+from config import settings
+
+pytestmark = [pytest.mark.asyncio]
+
+
+def make_limiter(**kwargs):
+    limits = {
+        "global_rate": 100,
+        "chat_rate": 100,
+        "chat_burst": 1,
+        "group_rate": 600,  # one per 0.1 second
+        "max_retry_after": 1,
+    }
+    return TelegramRateLimiter(**(limits | kwargs))
+
+
+class FakeApi:
+    def __init__(self, retry_after=0):
+        self.sent = []
+        self.retry_after = retry_after
+        self.start = time.monotonic()
+
+    async def __call__(self, bot, method):
+        if self.retry_after:
+            retry_after, self.retry_after = self.retry_after, 0
+            raise TelegramRetryAfter(method, "Flood control", retry_after)
+        self.sent.append((method.text, time.monotonic() - self.start))
+        return True
+
+
+async def test_group_requests_are_spaced():
+    """
+    Tests that requests to a group are sent at most group_rate per minute.
+    """
+    limiter = make_limiter()
+    api = FakeApi()
+    await asyncio.gather(
+        *(limiter(api, None, SendMessage(chat_id=-1, text=str(n))) for n in range(3))
+    )
+
+    assert [text for text, _ in api.sent] == ["0", "1", "2"]
+    assert api.sent[1][1] >= 0.09
+    assert api.sent[2][1] >= 0.19
+
+
+async def test_global_limit_holds_across_chats():
+    """
+    Tests that requests to different chats share the global limit.
+    """
+    limiter = make_limiter(global_rate=10)
+    api = FakeApi()
+    await asyncio.gather(
+        *(limiter(api, None, SendMessage(chat_id=n, text=str(n))) for n in range(1, 13))
+    )
+
+    times = [sent_at for _, sent_at in api.sent]
+    assert max(times[:10]) < 0.05
+    assert min(times[10:]) >= 0.09
+
+
+async def test_results_go_before_progress():
+    """
+    Tests that a result waiting for the chat limit is sent before progress
+    updates that were queued earlier.
+    """
+    limiter = make_limiter()
+    api = FakeApi()
+
+    async def progress(n):
+        send_priority.set(SendPriority.PROGRESS)
+        await limiter(
+            api, None, EditMessageText(chat_id=-1, message_id=1, text=f"progress {n}")
+        )
+
+    await limiter(api, None, SendMessage(chat_id=-1, text="reply"))
+    updates = [asyncio.create_task(progress(n)) for n in range(2)]
+    await asyncio.sleep(0)
+    await limiter(api, None, SendMessage(chat_id=-1, text="result"))
+    await asyncio.gather(*updates)
+
+    assert [text for text, _ in api.sent] == [
+        "reply",
+        "result",
+        "progress 0",
+        "progress 1",
+    ]
+
+
+async def test_retry_after_is_waited_out():
+    """
+    Tests that a flood control answer pauses the chat and the request is
+    repeated, unless Telegram asks to wait too long.
+    """
+    limiter = make_limiter()
+    api = FakeApi(retry_after=0.2)
+    await limiter(api, None, SendMessage(chat_id=1, text="result"))
+
+    assert api.sent[0][0] == "result"
+    assert api.sent[0][1] >= 0.19
+
+    api = FakeApi(retry_after=5)
+    with pytest.raises(TelegramRetryAfter):
+        await limiter(api, None, SendMessage(chat_id=1, text="result"))
+
+
+async def test_global_rate_below_one_per_second_still_sends():
+    """
+    Tests that a process with less than one request per second of the global
+    limit can send, its bucket holds at least one token.
+    """
+    limiter = make_limiter(global_rate=0.5)
+    api = FakeApi()
+    await asyncio.wait_for(
+        limiter(api, None, SendMessage(chat_id=1, text="0")), timeout=1
+    )
+
+    assert [text for text, _ in api.sent] == ["0"]
+
+
+async def test_worker_processes_share_the_global_rate(monkeypatch):
+    """
+    Tests that the limiter takes JOB_WORKERS as set by runbot --workers and
+    that the worker processes get the same number.
+    """
+    monkeypatch.setattr(settings, "JOB_WORKERS", 2)
+    assert rate_limiter().global_rate == settings.TELEGRAM_GLOBAL_RATE / 3
+
+    started = asyncio.Event()
+    envs = []
+
+    async def create_subprocess_exec(*args, env=None):
+        envs.append(env)
+        started.set()
+        await asyncio.Event().wait()
+
+    monkeypatch.setattr(asyncio, "create_subprocess_exec", create_subprocess_exec)
+    pool = job_queue.WorkerPool(2)
+    await pool.start()
+    await started.wait()
+    await pool.stop()
+
+    assert envs[0]["JOB_WORKERS"] == "2"
@@ -0,0 +1,211 @@
+import asyncio
+from datetime import timedelta
+
+import pytest
+from aiogram.exceptions import TelegramNetworkError
+from aiogram.methods import EditMessageText
+
+from bot.models import QuotaReservation, Transcription, User
+from bot.services import file_processor
+from bot.services.db import (
+    commit_reservation,
+    refund_reservation,
+    refund_stale_reservations,
+    reserve_seconds,
+)
+
+pytestmark = [pytest.mark.django_db(transaction=True), pytest.mark.asyncio]
+
+
+async def test_concurrent_reservations_do_not_overspend():
+    """
+    Tests that concurrent jobs of one user cannot reserve more than the balance.
+    """
+    user = await User.objects.acreate(
+        hashed_user_id="test_user_concurrent",
+        left_free_seconds=100,
+        left_purchased_seconds=50,
+    )
+    reservations = await asyncio.gather(*(reserve_seconds(user, 60) for _ in range(4)))
+
+    assert sum(r is not None for r in reservations) == 2
+    await user.arefresh_from_db()
+    assert user.left_free_seconds == 0
+    assert user.left_purchased_seconds == 30
+
+
+async def test_stale_balances_do_not_reject_concurrent_jobs():
+    """
+    Tests that jobs holding outdated copies of the user are all admitted
+    while the current balance is enough for them.
+    """
+    await User.objects.acreate(
+        hashed_user_id="test_user_stale_copies", left_free_seconds=60
+    )
+    copies = [
+        await User.objects.aget(hashed_user_id="test_user_stale_copies")
+        for _ in range(10)
+    ]
+    reservations = await asyncio.gather(*(reserve_seconds(u, 6) for u in copies))
+
+    assert all(r is not None for r in reservations)
+    user = await User.objects.aget(hashed_user_id="test_user_stale_copies")
+    assert user.left_free_seconds == 0
+
+
+async def test_reserve_seconds_rejects_insufficient_balance():
+    """
+    Tests that nothing is taken from the balance when it is not enough.
+    """
+    user = await User.objects.acreate(
+        hashed_user_id="test_user_insufficient",
+        left_free_seconds=30,
+        left_purchased_seconds=20,
+    )
+    assert await reserve_seconds(user, 60) is None
+    await user.arefresh_from_db()
+    assert user.left_free_seconds == 30
+    assert user.left_purchased_seconds == 20
+
+
+async def test_commit_reservation_logs_transcription():
+    """
+    Tests that committing keeps the seconds charged and logs the transcription.
+    """
+    user = await User.objects.acreate(
+        hashed_user_id="test_user_commit", left_free_seconds=100
+    )
+    reservation = await reserve_seconds(user, 60)
+    await commit_reservation(reservation, 60, 5.0)
+
+    await reservation.arefresh_from_db()
+    await user.arefresh_from_db()
+    assert reservation.status == QuotaReservation.Status.COMMITTED
+    assert user.left_free_seconds == 40
+    log = await Transcription.objects.aget(user=user)
+    assert log.transcription_time == 5.0
+
+
+async def test_refund_reservation_returns_seconds_once():
+    """
+    Tests that a failed job gets its free and purchased seconds back exactly once.
+    """
+    user = await User.objects.acreate(
+        hashed_user_id="test_user_refund",
+        left_free_seconds=50,
+        left_purchased_seconds=100,
+    )
+    reservation = await reserve_seconds(user, 80)
+    await refund_reservation(reservation, 80)
+    await refund_reservation(reservation)
+
+    await user.arefresh_from_db()
+    assert user.left_free_seconds == 50
+    assert user.left_purchased_seconds == 100
+    log = await Transcription.objects.aget(user=user)
+    assert log.transcription_time == -1
+
+
+async def test_refund_stale_reservations():
+    """
+    Tests that reservations left by an interrupted run are refunded at startup.
+    """
+    user = await User.objects.acreate(
+        hashed_user_id="test_user_stale", left_free_seconds=100
+    )
+    committed = await reserve_seconds(user, 10)
+    await commit_reservation(committed, 10, 1.0)
+    await reserve_seconds(user, 20)
+
+    assert await refund_stale_reservations() == 1
+    await user.arefresh_from_db()
+    assert user.left_free_seconds == 90
+
+
+async def test_refund_stale_reservations_keeps_young_ones():
+    """
+    Tests that reservations younger than the threshold, possibly of jobs
+    running in another process, are not refunded.
+    """
+    user = await User.objects.acreate(
+        hashed_user_id="test_user_young", left_free_seconds=100
+    )
+    await reserve_seconds(user, 20)
+
+    assert await refund_stale_reservations(timedelta(hours=1)) == 0
+    await user.arefresh_from_db()
+    assert user.left_free_seconds == 80
+
+
+class UnreachableTelegram:
+    """The user message, replies work but the status message cannot be edited."""
+
+    message_id = 1
+
+    async def reply(self, text, **kwargs):
+        return self
+
+    async def edit_text(self, text, **kwargs):
+        raise TelegramNetworkError(EditMessageText(text=text), "Connection reset")
+
+
+async def test_failed_job_is_refunded_when_the_error_cannot_be_sent(monkeypatch):
+    """
+    Tests that the reservation of a failed job is refunded even if
+    showing the error to the user fails too.
+    """
+    user = await User.objects.acreate(
+        hashed_user_id="test_user_unreachable", left_free_seconds=100
+    )
+
+    async def transcribe_file(*args):
+        raise RuntimeError("engine failed")
+
+    monkeypatch.setattr(file_processor, "transcribe_file", transcribe_file)
+    with pytest.raises(TelegramNetworkError):
+        await file_processor.handle_file(
+            UnreachableTelegram(), user.hashed_user_id, "voice", 30, "file", "audio/ogg"
+        )
+
+    await user.arefresh_from_db()
+    assert user.left_free_seconds == 100
+
+
+class FakeMessage:
+    message_id = 1
+
+    def __init__(self):
+        self.replies = []
+
+    async def reply(self, text=None, **kwargs):
+        self.replies.append(text or kwargs.get("text"))
+        return self
+
+
+async def test_job_failing_before_admission_is_logged(monkeypatch):
+    """
+    Tests that a job failing before its seconds are reserved is logged as
+    failed, like jobs failing later, while no seconds are taken.
+    """
+    user = await User.objects.acreate(
+        hashed_user_id="test_user_admission", left_free_seconds=100
+    )
+
+    async def reserve_seconds(user, seconds):
+        raise RuntimeError("database is locked")
+
+    monkeypatch.setattr(file_processor.db, "reserve_seconds", reserve_seconds)
+    message = FakeMessage()
+    await file_processor.handle_file(
+        message, user.hashed_user_id, "voice", 30, "file", "audio/ogg"
+    )
+
+    log = await Transcription.objects.aget()
+    assert (log.user_id, log.audio_duration, log.transcription_time) == (
+        user.pk,
+        30,
+        -1,
+    )
+    assert "database is locked" in message.replies[0]
+    await user.arefresh_from_db()
+    assert user.left_free_seconds == 100
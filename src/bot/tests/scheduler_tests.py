@@ -0,0 +1,93 @@
+import asyncio
+
+import pytest
+
+from bot.services.scheduler import JobScheduler, Priority
+
+pytestmark = [pytest.mark.asyncio]
+
+
+async def _run_jobs(scheduler, submissions):
+    """
+    Occupies the only slot, queues ``submissions`` and returns the order
+    in which the queued jobs were started.
+    """
+    started = []
+    blocker = asyncio.Event()
+
+    async def blocking_job():
+        await blocker.wait()
+
+    def job(name):
+        async def run():
+            started.append(name)
+
+        return run
+
+    tasks = [asyncio.create_task(scheduler.run(Priority.HIGH, "blocker", blocking_job))]
+    await asyncio.sleep(0)
+    for priority, user_key, name in submissions:
+        tasks.append(asyncio.create_task(scheduler.run(priority, user_key, job(name))))
+    await asyncio.sleep(0)
+
+    assert scheduler.queue_depth() == len(submissions)
+    blocker.set()
+    await asyncio.gather(*tasks)
+    return started
+
+
+async def test_scheduler_round_robins_users_within_tier():
+    """
+    Tests that a user with many queued jobs does not block other users.
+    """
+    scheduler = JobScheduler(max_in_flight=1)
+    started = await _run_jobs(
+        scheduler,
+        [
+            (Priority.HIGH, "spammer", "spammer_1"),
+            (Priority.HIGH, "spammer", "spammer_2"),
+            (Priority.HIGH, "spammer", "spammer_3"),
+            (Priority.HIGH, "user", "user_1"),
+        ],
+    )
+    assert started == ["spammer_1", "user_1", "spammer_2", "spammer_3"]
+
+
+async def test_scheduler_serves_higher_priority_first():
+    """
+    Tests that private chat jobs overtake queued group jobs.
+    """
+    scheduler = JobScheduler(max_in_flight=1)
+    started = await _run_jobs(
+        scheduler,
+        [
+            (Priority.LOW, "group_user", "group"),
+            (Priority.NORMAL, "mention_user", "mention"),
+            (Priority.HIGH, "private_user", "private"),
+        ],
+    )
+    assert started == ["private", "mention", "group"]
+
+
+async def test_scheduler_limits_jobs_in_flight():
+    """
+    Tests that no more than max_in_flight jobs run at the same time.
+    """
+    scheduler = JobScheduler(max_in_flight=2)
+    running = 0
+    max_running = 0
+
+    async def job():
+        nonlocal running, max_running
+        running += 1
+        max_running = max(max_running, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+
+    await asyncio.gather(
+        *[scheduler.run(Priority.HIGH, f"user_{i}", job) for i in range(6)]
+    )
+
+    assert max_running == 2
+    assert scheduler.in_flight == 0
+    assert scheduler.stats()["wait_max"] > 0
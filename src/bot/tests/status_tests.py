@@ -0,0 +1,104 @@
+import asyncio
+
+import pytest
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import EditMessageText
+
+from bot.services.status import StatusMessage
+from config import settings
+
+pytestmark = [pytest.mark.asyncio]
+
+
+class FakeMessage:
+    message_id = 1
+
+    def __init__(self, retry_after=0):
+        self.edits = []
+        self.retry_after = retry_after
+
+    async def edit_text(self, text, **kwargs):
+        if self.retry_after:
+            retry_after, self.retry_after = self.retry_after, 0
+            raise TelegramRetryAfter(
+                EditMessageText(text=text), "Flood control", retry_after
+            )
+        self.edits.append(text)
+
+
+@pytest.fixture(autouse=True)
+def interval(monkeypatch):
+    monkeypatch.setattr(settings, "STATUS_EDIT_INTERVAL_SECONDS", 0.05)
+
+
+async def test_rapid_updates_are_coalesced():
+    """
+    Tests that updates replaced within the interval are dropped and only
+    the latest one is shown.
+    """
+    msg = FakeMessage()
+    status = StatusMessage(msg, "Распознаю...")
+    status.update("Скачиваю файл...")
+    status.update("Сжимаю аудио...")
+    status.update("Распознаю речь...")
+    await asyncio.sleep(0.1)
+
+    assert msg.edits == ["Распознаю речь..."]
+
+
+async def test_unchanged_text_is_not_sent():
+    """
+    Tests that an update with the text already shown makes no request.
+    """
+    msg = FakeMessage()
+    status = StatusMessage(msg, "Распознаю...")
+    status.update("Распознаю...")
+    await asyncio.sleep(0.1)
+    await status.final("Распознаю...")
+
+    assert msg.edits == []
+
+
+async def test_fast_job_only_sends_the_result():
+    """
+    Tests that a job finishing within the first interval edits the message
+    once, with its result, and pending progress is never sent.
+    """
+    msg = FakeMessage()
+    status = StatusMessage(msg, "Распознаю...")
+    status.update("Скачиваю файл...")
+    status.update("Распознаю речь...")
+    await status.final("Привет")
+    await asyncio.sleep(0.1)
+
+    assert msg.edits == ["Привет"]
+
+
+async def test_flood_control_postpones_the_update():
+    """
+    Tests that an update answered with RetryAfter is sent again after the
+    given delay, replaced by a newer one if it arrived meanwhile.
+    """
+    msg = FakeMessage(retry_after=0.1)
+    status = StatusMessage(msg, "Распознаю...")
+    status.update("Скачиваю файл...")
+    await asyncio.sleep(0.08)
+    assert msg.edits == []
+
+    status.update("Распознаю речь...")
+    await asyncio.sleep(0.2)
+    assert msg.edits == ["Распознаю речь..."]
+
+
+async def test_final_gives_up_on_long_flood_control(monkeypatch):
+    """
+    Tests that the result is not waited for longer than
+    TELEGRAM_MAX_RETRY_AFTER_SECONDS, the error is raised instead.
+    """
+    monkeypatch.setattr(settings, "TELEGRAM_MAX_RETRY_AFTER_SECONDS", 1)
+    msg = FakeMessage(retry_after=3600)
+    status = StatusMessage(msg, "Распознаю...")
+
+    with pytest.raises(TelegramRetryAfter):
+        await status.final("Привет")
+    assert msg.edits == []
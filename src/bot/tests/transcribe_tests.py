@@ -0,0 +1,122 @@
+import pytest
+
+from bot.services import transcribe
+from config import settings
+
+
+def clear_registry():
+    for cached in (
+        transcribe.get_transcription_client,
+        transcribe.openai_client,
+        transcribe.elevenlabs_client,
+        transcribe.gemini_client,
+    ):
+        cached.cache_clear()
+
+
+@pytest.fixture(autouse=True)
+def fresh_registry(monkeypatch):
+    monkeypatch.setattr(settings, "OPENAI_API_KEY", "test-key")
+    monkeypatch.setattr(settings, "ELEVENLABS_API_KEY", None)
+    clear_registry()
+    yield
+    clear_registry()
+
+
+def test_engines_of_one_provider_share_sdk_client():
+    """
+    Tests that engines are built once and models of a provider share one client.
+    """
+    whisper = transcribe.get_transcription_client("openai-whisper")
+    gpt = transcribe.get_transcription_client("openai-gpt-4o-mini-transcribe")
+
+    assert transcribe.get_transcription_client("openai-whisper") is whisper
+    assert whisper.client is gpt.client
+    assert whisper.model == "whisper-1"
+    assert not whisper.supports_streaming
+    assert gpt.supports_streaming
+
+
+def test_unused_provider_without_api_key_does_not_fail():
+    """
+    Tests that a missing key only fails when an engine of that provider is requested.
+    """
+    transcribe.get_transcription_client("openai-whisper")
+
+    with pytest.raises(ValueError):
+        transcribe.get_transcription_client("elevenlabs-scribe_v1")
+
+
+def test_engine_from_config(monkeypatch):
+    """
+    Tests that engines listed in EXTRA_TRANSCRIPTION_ENGINES are built without a new class.
+    """
+    monkeypatch.setattr(
+        settings,
+        "EXTRA_TRANSCRIPTION_ENGINES",
+        {"openai-gpt-4o-transcribe": ("openai", "gpt-4o-transcribe")},
+    )
+
+    engine = transcribe.get_transcription_client("openai-gpt-4o-transcribe")
+
+    assert isinstance(engine, transcribe.OpenAITS)
+    assert engine.model == "gpt-4o-transcribe"
+
+
+def test_unknown_engine_raises():
+    """
+    Tests that an unknown engine name is reported with a ValueError.
+    """
+    with pytest.raises(ValueError):
+        transcribe.get_transcription_client("unknown-engine")
+
+
+class FakeFiles:
+    def __init__(self):
+        self.uploaded = []
+        self.deleted = []
+
+    async def upload(self, file, config):
+        self.uploaded.append(config.mime_type)
+        return type("File", (), {"name": f"files/{len(self.uploaded)}"})()
+
+    async def delete(self, name):
+        self.deleted.append(name)
+
+
+class FakeModels:
+    def __init__(self):
+        self.contents = []
+
+    async def generate_content(self, model, contents):
+        self.contents.append(contents)
+        return type("Response", (), {"text": "текст"})()
+
+
+@pytest.mark.asyncio
+async def test_gemini_sends_small_audio_inline_and_deletes_uploads(monkeypatch):
+    """
+    Tests that Gemini gets small audio as inline bytes in one request, while
+    larger audio is uploaded through the Files API and deleted afterwards.
+    """
+    import io
+
+    monkeypatch.setattr(settings, "GEMINI_API_KEY", "test-key")
+    monkeypatch.setattr(settings, "GEMINI_INLINE_MAX_BYTES", 10)
+    engine = transcribe.get_transcription_client("gemini-2.5-flash")
+    files, models = FakeFiles(), FakeModels()
+    monkeypatch.setattr(type(engine.client.aio), "files", property(lambda self: files))
+    monkeypatch.setattr(
+        type(engine.client.aio), "models", property(lambda self: models)
+    )
+
+    assert await engine.transcribe(io.BytesIO(b"voice"), "audio/ogg") == "текст"
+    assert (
+        await engine.transcribe(io.BytesIO(b"long audio file"), "audio/ogg") == "текст"
+    )
+
+    inline = models.contents[0][1]
+    assert inline.inline_data.data == b"voice"
+    assert inline.inline_data.mime_type == "audio/ogg"
+    assert files.uploaded == ["audio/ogg"]
+    assert files.deleted == ["files/1"]
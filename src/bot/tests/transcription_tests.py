@@ -1,9 +1,11 @@
+from datetime import timedelta
+
 import pytest
+from django.utils import timezone
+
 from bot.models import User
-from bot.services.db import prepare_user_for_transcription, process_user_transcription
+from bot.services.db import prepare_user_for_transcription, reserve_seconds
 from config import settings
-from django.utils import timezone
-from datetime import timedelta
 
 pytestmark = [pytest.mark.django_db(transaction=True), pytest.mark.asyncio]
 
@@ -101,46 +103,46 @@ async def test_prepare_user_for_transcription_already_warned():
     assert status == "warned"
 
 
-async def test_process_user_transcription_purely_free():
+async def test_reserve_seconds_purely_free():
     """
-    Tests processing a transcription that only uses free seconds.
+    Tests reserving a transcription that only uses free seconds.
     """
     user = await User.objects.acreate(
         hashed_user_id="test_user_process_free",
         left_free_seconds=100,
         left_purchased_seconds=50,
     )
-    await process_user_transcription(user, audio_duration=60, transcription_time=5.0)
+    await reserve_seconds(user, 60)
     await user.arefresh_from_db()
     assert user.left_free_seconds == 40
     assert user.left_purchased_seconds == 50
 
 
-async def test_process_user_transcription_mixed_free_and_paid():
+async def test_reserve_seconds_mixed_free_and_paid():
     """
-    Tests processing a transcription that uses up all free seconds and some purchased seconds.
+    Tests reserving a transcription that uses up all free seconds and some purchased seconds.
     """
     user = await User.objects.acreate(
         hashed_user_id="test_user_process_mixed",
         left_free_seconds=50,
         left_purchased_seconds=100,
     )
-    await process_user_transcription(user, audio_duration=80, transcription_time=7.0)
+    await reserve_seconds(user, 80)
     await user.arefresh_from_db()
     assert user.left_free_seconds == 0
     assert user.left_purchased_seconds == 70  # 100 - (80 - 50)
 
 
-async def test_process_user_transcription_purely_paid():
+async def test_reserve_seconds_purely_paid():
     """
-    Tests processing a transcription that only uses purchased seconds.
+    Tests reserving a transcription that only uses purchased seconds.
     """
     user = await User.objects.acreate(
         hashed_user_id="test_user_process_paid",
         left_free_seconds=0,
         left_purchased_seconds=100,
     )
-    await process_user_transcription(user, audio_duration=70, transcription_time=6.0)
+    await reserve_seconds(user, 70)
     await user.arefresh_from_db()
     assert user.left_free_seconds == 0
     assert user.left_purchased_seconds == 30
@@ -0,0 +1,72 @@
+import pytest
+
+from bot.models import User
+from bot.services import db
+from bot.services.user_cache import UserCache, user_cache
+from config import settings
+
+pytestmark = [pytest.mark.django_db(transaction=True), pytest.mark.asyncio]
+
+
+async def test_returning_user_is_admitted_from_cache(monkeypatch):
+    """
+    Tests that admission of a returning user does not query the database.
+    """
+    monkeypatch.setattr(settings, "LEFT_WARNING_SECONDS", 0)
+    await db.prepare_user_for_transcription("test_user_cached", 10)
+
+    async def no_database(*args, **kwargs):
+        raise AssertionError("database was queried")
+
+    monkeypatch.setattr(User.objects, "aget_or_create", no_database)
+    user, status = await db.prepare_user_for_transcription("test_user_cached", 10)
+    assert status == "success"
+    assert user is user_cache.get("test_user_cached")
+
+
+async def test_debits_and_payments_are_written_through(monkeypatch):
+    """
+    Tests that reservations and payments update the cached balance.
+    """
+    monkeypatch.setattr(settings, "CURRENCY_RATE_SECONDS", 10)
+    user, _ = await db.get_or_create_user("test_user_write_through")
+    free = user.left_free_seconds
+
+    await db.reserve_seconds(user, 10)
+    await db.make_payment(user, "payment", 5)
+
+    cached = user_cache.get("test_user_write_through")
+    assert cached.left_free_seconds == free - 10
+    assert cached.left_purchased_seconds == 50
+    stored = await User.objects.aget(hashed_user_id="test_user_write_through")
+    assert stored.left_free_seconds == cached.left_free_seconds
+    assert stored.left_purchased_seconds == cached.left_purchased_seconds
+
+
+async def test_admin_edit_invalidates_cached_user():
+    """
+    Tests that saving a user through the ORM, as the admin does, drops the cached copy.
+    """
+    await db.get_or_create_user("test_user_admin_edit")
+    stored = await User.objects.aget(hashed_user_id="test_user_admin_edit")
+    stored.left_purchased_seconds = 1000
+    await stored.asave()
+
+    user, _ = await db.get_or_create_user("test_user_admin_edit")
+    assert user.left_purchased_seconds == 1000
+
+
+async def test_cache_evicts_least_recently_used():
+    """
+    Tests that the cache keeps at most max_entries users, evicting the oldest.
+    """
+    cache = UserCache(max_entries=2, ttl=60)
+    users = [User(hashed_user_id=str(i)) for i in range(3)]
+    cache.put(users[0])
+    cache.put(users[1])
+    cache.get("0")
+    cache.put(users[2])
+
+    assert cache.get("1") is None
+    assert cache.get("0") is users[0]
+    assert cache.get("2") is users[2]
@@ -0,0 +1,131 @@
+import shutil
+
+import pytest
+
+from bot.models import User
+from bot.services import file_processor
+from bot.services.ffmpeg import run_ffmpeg
+from bot.services.vad import SILENCE_TRANSCRIPT, speech_segments, trim_silence
+from config import settings
+
+
+def test_edges_are_cut_and_long_pauses_shortened():
+    """
+    Tests that silence at the edges is dropped and a long pause keeps only
+    the padding around the speech, while a short pause stays.
+    """
+    silences = [(0.0, 3.0), (7.0, 12.0), (13.0, 14.0), (15.0, 19.0)]
+    assert speech_segments(silences, 19, pad=0.3, min_pause=2) == [
+        (2.7, 7.3),
+        (11.7, 15.3),
+    ]
+
+
+def test_trailing_silence_ends_within_the_rounded_duration():
+    """
+    Tests that a silence ending less than a second before the reported
+    duration counts as trailing.
+    """
+    assert speech_segments([(5.0, 9.6)], 10, pad=0.3, min_pause=2) == [(0.0, 5.3)]
+
+
+def test_all_silent_audio_has_no_speech():
+    """
+    Tests that audio that is silent from start to end has no segments.
+    """
+    assert speech_segments([(0.0, 10.0)], 10, pad=0.3, min_pause=2) == []
+    assert speech_segments([], 10, pad=0.3, min_pause=2) == [(0.0, 10.0)]
+
+
+async def sine_with_gaps(*parts):
+    """Opus audio of ``(seconds, is_speech)`` parts, speech is a sine tone."""
+    inputs, labels = [], []
+    for number, (seconds, is_speech) in enumerate(parts):
+        source = "sine=frequency=300" if is_speech else "anullsrc=r=16000:cl=mono"
+        inputs += ["-f", "lavfi", "-i", f"{source}:d={seconds}"]
+        labels.append(f"[{number}]")
+    return await run_ffmpeg(
+        inputs,
+        [
+            "-filter_complex",
+            f"{''.join(labels)}concat=n={len(parts)}:v=0:a=1,aformat=channel_layouts=mono",
+            "-c:a",
+            "libopus",
+            "-f",
+            "ogg",
+            "-",
+        ],
+    )
+
+
+@pytest.mark.skipif(not shutil.which("ffmpeg"), reason="ffmpeg is not installed")
+@pytest.mark.asyncio
+async def test_trim_silence_cuts_pauses_and_detects_silent_audio(monkeypatch):
+    """
+    Tests that silence is cut out of the audio and all-silent audio returns
+    no file, so no engine is called.
+    """
+    monkeypatch.setattr(settings, "VAD_MIN_DURATION_SECONDS", 0)
+    audio = await sine_with_gaps(
+        (3, False), (4, True), (5, False), (3, True), (4, False)
+    )
+    trimmed_file, mime_type, duration, trimmed = await trim_silence(
+        audio, "audio/ogg", 19
+    )
+    trimmed_file.close()
+    assert mime_type == "audio/ogg"
+    assert duration == 8
+    assert trimmed == pytest.approx(10.8, abs=0.1)
+
+    silent = await sine_with_gaps((10, False))
+    silent_file, _, duration, trimmed = await trim_silence(silent, "audio/ogg", 10)
+    assert silent_file is None
+    assert (duration, trimmed) == (0, 10.0)
+    assert silent.closed
+
+
+@pytest.mark.skipif(not shutil.which("ffmpeg"), reason="ffmpeg is not installed")
+@pytest.mark.asyncio
+async def test_short_audio_is_checked_for_speech_but_not_reencoded():
+    """
+    Tests that audio shorter than VAD_MIN_DURATION_SECONDS without speech is
+    still answered without the engine, while with speech it is passed on as it is.
+    """
+    silent = await sine_with_gaps((5, False))
+    assert (await trim_silence(silent, "audio/ogg", 5))[0] is None
+
+    audio = await sine_with_gaps((2, False), (3, True), (3, False), (2, True))
+    assert await trim_silence(audio, "audio/ogg", 10) == (audio, "audio/ogg", 10, 0.0)
+    audio.close()
+
+
+class FakeMessage:
+    message_id = 1
+
+    async def reply(self, text, **kwargs):
+        return self
+
+    async def edit_text(self, text, **kwargs):
+        pass
+
+
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.asyncio
+async def test_silent_audio_is_not_charged(monkeypatch):
+    """
+    Tests that the seconds of audio without any speech are returned.
+    """
+    user = await User.objects.acreate(
+        hashed_user_id="test_user_silence", left_free_seconds=100
+    )
+
+    async def transcribe_file(*args):
+        return SILENCE_TRANSCRIPT, 0.5
+
+    monkeypatch.setattr(file_processor, "transcribe_file", transcribe_file)
+    await file_processor.handle_file(
+        FakeMessage(), user.hashed_user_id, "voice", 40, "file", "audio/ogg"
+    )
+
+    await user.arefresh_from_db()
+    assert user.left_free_seconds == 100
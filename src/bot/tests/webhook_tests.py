@@ -0,0 +1,62 @@
+import asyncio
+
+import pytest
+import pytest_asyncio
+from aiohttp.test_utils import TestClient, TestServer
+
+from bot import bot_init
+from config import settings
+
+pytestmark = [pytest.mark.asyncio]
+
+UPDATE = {
+    "update_id": 1,
+    "message": {
+        "message_id": 1,
+        "date": 0,
+        "chat": {"id": 1, "type": "private"},
+        "from": {"id": 1, "is_bot": False, "first_name": "Test"},
+        "text": "hi",
+    },
+}
+
+
+@pytest_asyncio.fixture
+async def client(monkeypatch):
+    monkeypatch.setattr(settings, "WEBHOOK_URL", "https://bot.example/telegram")
+    monkeypatch.setattr(settings, "WEBHOOK_SECRET", "secret")
+    async with TestClient(TestServer(bot_init.webhook_app())) as client:
+        yield client
+
+
+async def test_webhook_rejects_wrong_secret(client):
+    """
+    Tests that updates without the configured secret token are rejected.
+    """
+    response = await client.post(
+        "/telegram",
+        json=UPDATE,
+        headers={"X-Telegram-Bot-Api-Secret-Token": "wrong"},
+    )
+    assert response.status == 401
+
+
+async def test_webhook_hands_update_off_to_dispatcher(client, monkeypatch):
+    """
+    Tests that a valid update is answered right away and fed to the dispatcher.
+    """
+    received = []
+
+    async def feed_update(bot, update, **kwargs):
+        received.append(update.update_id)
+
+    monkeypatch.setattr(bot_init.dp, "feed_update", feed_update)
+    response = await client.post(
+        "/telegram",
+        json=UPDATE,
+        headers={"X-Telegram-Bot-Api-Secret-Token": "secret"},
+    )
+    assert response.status == 200
+    # Processing happens in a background task after the response
+    await asyncio.sleep(0.01)
+    assert received == [1]
@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
 import os
+import socket
 from pathlib import Path
 
 from dotenv import load_dotenv
@@ -18,6 +19,8 @@ from dotenv import load_dotenv
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
+load_dotenv()
+
 DATA_DIR = BASE_DIR.parent / "data"
 
 STATIC_ROOT = BASE_DIR / "static"
@@ -79,18 +82,72 @@ WSGI_APPLICATION = "config.wsgi.application"
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
 
-DATABASES = {
-    "default": {
-        "ENGINE": "django.db.backends.sqlite3",
-        "NAME": DATA_DIR / "db.sqlite3",
-        "OPTIONS": {
-            "timeout": 20,  # in seconds
-            # see also
-            # https://docs.python.org/3.7/library/sqlite3.html#sqlite3.connect
-        },
+# Applied to every new SQLite connection. WAL lets readers work while a quota
+# update is being written, synchronous=NORMAL is durable in WAL mode except
+# for the last transactions on power loss. Set SQLITE_JOURNAL_MODE=DELETE and
+# SQLITE_SYNCHRONOUS=FULL for the previous rollback journal behaviour.
+SQLITE_PRAGMAS = {
+    "journal_mode": os.environ.get("SQLITE_JOURNAL_MODE", "WAL"),
+    "synchronous": os.environ.get("SQLITE_SYNCHRONOUS", "NORMAL"),
+    # Negative cache size is in KiB
+    "cache_size": -int(os.environ.get("SQLITE_CACHE_KIB", str(64 * 1024))),
+    "mmap_size": int(os.environ.get("SQLITE_MMAP_BYTES", str(256 * 1024 * 1024))),
+    "busy_timeout": int(os.environ.get("SQLITE_BUSY_TIMEOUT_MS", "20000")),
+    "temp_store": "MEMORY",
+}
+
+
+def sqlite_options(pragmas: dict) -> dict:
+    return {
+        "timeout": pragmas["busy_timeout"] / 1000,  # in seconds
+        # Take the write lock when a transaction starts, a deferred transaction
+        # upgrading to a writer can fail with "database is locked" right away
+        "transaction_mode": "IMMEDIATE",
+        "init_command": ";".join(
+            f"PRAGMA {name}={value}" for name, value in pragmas.items()
+        ),
     }
+
+
+SQLITE_DATABASE = {
+    "ENGINE": "django.db.backends.sqlite3",
+    "NAME": DATA_DIR / "db.sqlite3",
+    "OPTIONS": sqlite_options(SQLITE_PRAGMAS),
 }
 
+# Several bot processes need a shared database, PostgreSQL is used when
+# POSTGRES_HOST is set. Every process keeps a psycopg connection pool, the
+# async ORM borrows a connection per query instead of opening a new one.
+POSTGRES_HOST = os.environ.get("POSTGRES_HOST")
+
+if POSTGRES_HOST:
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.postgresql",
+            "HOST": POSTGRES_HOST,
+            "PORT": os.environ.get("POSTGRES_PORT", "5432"),
+            "NAME": os.environ.get("POSTGRES_DB", "goodsecretarybot"),
+            "USER": os.environ.get("POSTGRES_USER", "postgres"),
+            "PASSWORD": os.environ.get("POSTGRES_PASSWORD", ""),
+            "OPTIONS": {
+                "pool": {
+                    "min_size": int(os.environ.get("POSTGRES_POOL_MIN_SIZE", "2")),
+                    "max_size": int(os.environ.get("POSTGRES_POOL_MAX_SIZE", "10")),
+                    "timeout": int(os.environ.get("POSTGRES_POOL_TIMEOUT", "10")),
+                },
+            },
+        },
+        # The previous SQLite database, source of the import_sqlite command
+        "sqlite": SQLITE_DATABASE,
+    }
+else:
+    DATABASES = {"default": SQLITE_DATABASE}
+
+# Reservations still open at startup are refunded once they are this old.
+# 0 suits a single process; with several processes sharing PostgreSQL set it
+# above the longest job, so running jobs of other processes keep theirs.
+STALE_RESERVATION_SECONDS = int(os.environ.get("STALE_RESERVATION_SECONDS", "0"))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -133,22 +190,58 @@ STATIC_URL = "static/"
 
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
-load_dotenv()
-
 MAX_MESSAGE_LENGTH = 4096
+# Longer transcripts are sent as a .txt file, with their beginning in the
+# status message, instead of many messages (0 disables)
+TRANSCRIPT_FILE_LENGTH = int(os.environ.get("TRANSCRIPT_FILE_LENGTH", "16000"))
 
 TELEGRAM_TOKEN = os.environ.get("TELEGRAM_TOKEN")
 TELEGRAM_BOT_API_URL = os.environ.get("TELEGRAM_BOT_API_URL")
+
+# Outgoing requests are queued under the Bot API limits: TELEGRAM_GLOBAL_RATE
+# per second overall, TELEGRAM_CHAT_RATE per second (TELEGRAM_CHAT_BURST at once)
+# in private chats and TELEGRAM_GROUP_RATE per minute in groups. Flood control
+# answers are waited out and repeated, up to TELEGRAM_MAX_RETRY_AFTER_SECONDS.
+TELEGRAM_GLOBAL_RATE = float(os.environ.get("TELEGRAM_GLOBAL_RATE", "30"))
+TELEGRAM_CHAT_RATE = float(os.environ.get("TELEGRAM_CHAT_RATE", "1"))
+TELEGRAM_CHAT_BURST = int(os.environ.get("TELEGRAM_CHAT_BURST", "3"))
+TELEGRAM_GROUP_RATE = float(os.environ.get("TELEGRAM_GROUP_RATE", "20"))
+TELEGRAM_MAX_RETRY_AFTER_SECONDS = float(
+    os.environ.get("TELEGRAM_MAX_RETRY_AFTER_SECONDS", "60")
+)
+
+# Webhook mode (runbot --webhook): the Bot API server posts updates to
+# WEBHOOK_URL, served on WEBHOOK_HOST:WEBHOOK_PORT. Requests without
+# WEBHOOK_SECRET in the X-Telegram-Bot-Api-Secret-Token header are rejected.
+WEBHOOK_URL = os.environ.get("WEBHOOK_URL")
+WEBHOOK_SECRET = os.environ.get("WEBHOOK_SECRET")
+WEBHOOK_HOST = os.environ.get("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.environ.get("WEBHOOK_PORT", "8080"))
 SENTRY_DSN = os.environ.get("SENTRY_DSN")
 
 TRANSCRIPTION_ENGINE = os.environ.get(
     "TRANSCRIPTION_ENGINE", "openai-gpt-4o-mini-transcribe"
 )
 FALLBACK_TRANSCRIPTION_ENGINE = os.environ.get("FALLBACK_TRANSCRIPTION_ENGINE")
+# Additional engines as comma separated name=provider:model,
+# e.g. openai-gpt-4o-transcribe=openai:gpt-4o-transcribe
+EXTRA_TRANSCRIPTION_ENGINES = {
+    name.strip(): tuple(spec.strip().split(":", 1))
+    for name, spec in (
+        item.split("=", 1)
+        for item in os.environ.get("EXTRA_TRANSCRIPTION_ENGINES", "").split(",")
+        if item.strip()
+    )
+}
 
 OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY")
 ELEVENLABS_API_KEY = os.environ.get("ELEVENLABS_API_KEY")
 GEMINI_API_KEY = os.environ.get("GEMINI_API_KEY")
+# Audio up to this size is sent to Gemini inline, larger through the Files API.
+# Requests are limited to 20 MB and inline bytes grow by a third in base64
+GEMINI_INLINE_MAX_BYTES = int(
+    os.environ.get("GEMINI_INLINE_MAX_BYTES", str(14 * 1024 * 1024))
+)
 
 BOT_USERNAME = os.environ.get("BOT_USERNAME")
 SUPPORT_USERNAME = os.environ.get("SUPPORT_USERNAME")
@@ -172,10 +265,129 @@ FORWARD_CHAT_IDS = list(
     )
 )
 
-ADMIN_ID = int(os.environ.get("ADMIN_ID", 0))
+ADMIN_ID = int(os.environ.get("ADMIN_ID", "0"))
+
+# Downloads from the cloud Bot API are kept in memory up to this size and
+# spill to a temporary file after it
+DOWNLOAD_SPOOL_MAX_BYTES = int(
+    os.environ.get("DOWNLOAD_SPOOL_MAX_BYTES", str(4 * 1024 * 1024))
+)
 
-MAX_RETRIES = int(os.environ.get("MAX_RETRIES", 3))
-RETRY_DELAY = int(os.environ.get("RETRY_DELAY", 1))
+# ffmpeg processes running at once and threads per process
+FFMPEG_CONCURRENCY = int(
+    os.environ.get("FFMPEG_CONCURRENCY", str(max(1, (os.cpu_count() or 2) // 2)))
+)
+FFMPEG_THREADS = int(os.environ.get("FFMPEG_THREADS", "1"))
+
+# Transcription jobs running at once, the rest wait in the scheduler queue
+SCHEDULER_MAX_IN_FLIGHT = int(os.environ.get("SCHEDULER_MAX_IN_FLIGHT", "8"))
+
+# With JOB_WORKERS > 0 the bot process only accepts updates and queues jobs in
+# the database, JOB_WORKERS worker processes run them, each up to
+# SCHEDULER_MAX_IN_FLIGHT at once. 0 runs everything in the bot process.
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", "0"))
+JOB_POLL_INTERVAL_SECONDS = float(os.environ.get("JOB_POLL_INTERVAL_SECONDS", "0.25"))
+JOB_CLAIM_CANDIDATES = int(os.environ.get("JOB_CLAIM_CANDIDATES", "5"))
+# Running jobs are recorded under this name, on restart the jobs it left running
+# are queued again. Must survive restarts, so not the container id
+JOB_WORKER_NAME = os.environ.get("JOB_WORKER_NAME") or socket.gethostname()
+# On SIGTERM running jobs get this long to finish, the rest are queued again
+JOB_DRAIN_SECONDS = float(os.environ.get("JOB_DRAIN_SECONDS", "60"))
+# Finished jobs are kept this long without their file ids, so an update Telegram
+# delivers again is not transcribed twice, then deleted. Updates live 24 hours
+JOB_RETENTION_SECONDS = int(os.environ.get("JOB_RETENTION_SECONDS", str(24 * 60 * 60)))
+
+MAX_RETRIES = int(os.environ.get("MAX_RETRIES", "3"))
+RETRY_DELAY = int(os.environ.get("RETRY_DELAY", "1"))
+
+# Circuit breaker per engine: opens after BREAKER_FAILURE_THRESHOLD failures
+# in a row, or when the error rate / latency per second of audio EWMA exceeds
+# the limits (0 disables the latency limit). While open, jobs go to the
+# fallback engine and BREAKER_PROBE_RATIO of them probe the degraded one.
+BREAKER_FAILURE_THRESHOLD = int(os.environ.get("BREAKER_FAILURE_THRESHOLD", "3"))
+BREAKER_MAX_ERROR_RATE = float(os.environ.get("BREAKER_MAX_ERROR_RATE", "0.5"))
+BREAKER_MAX_LATENCY_PER_SECOND = float(
+    os.environ.get("BREAKER_MAX_LATENCY_PER_SECOND", "0")
+)
+BREAKER_MIN_SAMPLES = int(os.environ.get("BREAKER_MIN_SAMPLES", "10"))
+BREAKER_EWMA_ALPHA = float(os.environ.get("BREAKER_EWMA_ALPHA", "0.2"))
+BREAKER_PROBE_RATIO = float(os.environ.get("BREAKER_PROBE_RATIO", "0.05"))
+
+# Hedging: if the primary engine is slower than its usual HEDGE_PERCENTILE
+# latency for this audio duration, the fallback engine gets the same audio too
+HEDGE_ENABLED = os.environ.get("HEDGE_ENABLED", "False").lower() == "true"
+HEDGE_PERCENTILE = float(os.environ.get("HEDGE_PERCENTILE", "0.9"))
+HEDGE_MIN_SAMPLES = int(os.environ.get("HEDGE_MIN_SAMPLES", "20"))
+HEDGE_DEFAULT_DELAY_SECONDS = float(os.environ.get("HEDGE_DEFAULT_DELAY_SECONDS", "5"))
+
+# Streaming engines show the transcript while it is being recognized,
+# the status message is edited at most once per STREAM_EDIT_INTERVAL_SECONDS
+STREAMING_ENABLED = os.environ.get("STREAMING_ENABLED", "True").lower() == "true"
+STREAM_EDIT_INTERVAL_SECONDS = float(
+    os.environ.get("STREAM_EDIT_INTERVAL_SECONDS", "1.5")
+)
+
+# Progress updates of the status message are sent at most once per
+# STATUS_EDIT_INTERVAL_SECONDS, the ones replaced meanwhile are dropped
+STATUS_EDIT_INTERVAL_SECONDS = float(
+    os.environ.get("STATUS_EDIT_INTERVAL_SECONDS", "2")
+)
+
+# Audio longer than CHUNK_THRESHOLD_SECONDS (or over engine limits) is cut
+# at silences into chunks of about CHUNK_SECONDS, transcribed concurrently
+CHUNK_THRESHOLD_SECONDS = int(os.environ.get("CHUNK_THRESHOLD_SECONDS", "600"))
+CHUNK_SECONDS = int(os.environ.get("CHUNK_SECONDS", "300"))
+CHUNK_CONCURRENCY = int(os.environ.get("CHUNK_CONCURRENCY", "4"))
+CHUNK_BITRATE = os.environ.get("CHUNK_BITRATE", "32k")
+SILENCE_NOISE_DB = int(os.environ.get("SILENCE_NOISE_DB", "-35"))
+SILENCE_MIN_SECONDS = float(os.environ.get("SILENCE_MIN_SECONDS", "0.5"))
+
+# Before upload, audio with a bitrate over NORMALIZE_MIN_RATIO times
+# NORMALIZE_BITRATE (e.g. WAV or stereo MP3) is re-encoded as mono 16 kHz Opus.
+# Audio of NORMALIZE_TEMPO_MIN_SECONDS and longer is also sped up NORMALIZE_TEMPO
+# times (1.0-2.0), engines take less time and bill fewer seconds for it
+NORMALIZE_ENABLED = os.environ.get("NORMALIZE_ENABLED", "True").lower() == "true"
+NORMALIZE_BITRATE = os.environ.get("NORMALIZE_BITRATE", "24k")
+NORMALIZE_MIN_RATIO = float(os.environ.get("NORMALIZE_MIN_RATIO", "2"))
+NORMALIZE_TEMPO = float(os.environ.get("NORMALIZE_TEMPO", "1.0"))
+NORMALIZE_TEMPO_MIN_SECONDS = int(os.environ.get("NORMALIZE_TEMPO_MIN_SECONDS", "300"))
+
+# Silence quieter than VAD_NOISE_DB is cut before upload: at the edges entirely,
+# pauses over VAD_MIN_PAUSE_SECONDS down to VAD_PAD_SECONDS around the speech.
+# Files are left as they are if less than VAD_MIN_TRIM_SECONDS would be cut,
+# audio without any speech is answered without calling an engine
+VAD_ENABLED = os.environ.get("VAD_ENABLED", "True").lower() == "true"
+VAD_NOISE_DB = int(os.environ.get("VAD_NOISE_DB", "-40"))
+VAD_MIN_PAUSE_SECONDS = float(os.environ.get("VAD_MIN_PAUSE_SECONDS", "2"))
+VAD_PAD_SECONDS = float(os.environ.get("VAD_PAD_SECONDS", "0.3"))
+VAD_MIN_TRIM_SECONDS = float(os.environ.get("VAD_MIN_TRIM_SECONDS", "3"))
+# Shorter audio is only checked for speech, re-encoding it could not pay off
+VAD_MIN_DURATION_SECONDS = float(os.environ.get("VAD_MIN_DURATION_SECONDS", "20"))
+
+# Transcript cache, 0 entries disables it. Disk tier is optional and encrypted,
+# TRANSCRIPT_CACHE_KEY is a Fernet key (Fernet.generate_key()).
+TRANSCRIPT_CACHE_SIZE = int(os.environ.get("TRANSCRIPT_CACHE_SIZE", "1024"))
+TRANSCRIPT_CACHE_TTL_SECONDS = int(
+    os.environ.get("TRANSCRIPT_CACHE_TTL_SECONDS", "3600")
+)
+TRANSCRIPT_CACHE_DIR = os.environ.get("TRANSCRIPT_CACHE_DIR")
+TRANSCRIPT_CACHE_KEY = os.environ.get("TRANSCRIPT_CACHE_KEY")
+
+# Transcription logs are written in batches of LOG_BATCH_SIZE or every
+# LOG_FLUSH_INTERVAL_SECONDS; jobs wait once LOG_MAX_PENDING logs are unwritten
+LOG_BATCH_SIZE = int(os.environ.get("LOG_BATCH_SIZE", "50"))
+LOG_FLUSH_INTERVAL_SECONDS = float(os.environ.get("LOG_FLUSH_INTERVAL_SECONDS", "2"))
+LOG_MAX_PENDING = int(os.environ.get("LOG_MAX_PENDING", "1000"))
+
+# Prometheus metrics are served at http://METRICS_HOST:METRICS_PORT/metrics,
+# 0 disables them. With JOB_WORKERS also set PROMETHEUS_MULTIPROC_DIR to an
+# empty directory, so the metrics of the worker processes are collected too
+METRICS_HOST = os.environ.get("METRICS_HOST", "0.0.0.0")
+METRICS_PORT = int(os.environ.get("METRICS_PORT", "0"))
+
+# Users with balances kept in memory, see bot/services/user_cache.py
+USER_CACHE_SIZE = int(os.environ.get("USER_CACHE_SIZE", "10000"))
+USER_CACHE_TTL_SECONDS = int(os.environ.get("USER_CACHE_TTL_SECONDS", "300"))
 
 
 GEMINI_PROMPT = """